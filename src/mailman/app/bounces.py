@@ -181,14 +181,19 @@ class _ProbePendable(dict):
     """The pendable dictionary for probe messages."""
 
 
-def send_probe(member, msg):
+def send_probe(member, msg=None, message_id=None):
     """Send a VERP probe to the member.
 
     :param member: The member to send the probe to.  From this object, both
         the user and the mailing list can be determined.
     :type member: IMember
-    :param msg: The bouncing message that caused the probe to be sent.
+    :param msg: The bouncing message that caused the probe to be sent.  This
+        is attached to the probe.
     :type msg:
+    :param message_id: The Message-ID of the bouncing message, used when the
+        message itself is no longer available.  Exactly one of `msg` and
+        `message_id` must be given.
+    :type message_id: string
     :return: The token representing this probe in the pendings database.
     :rtype: string
     """
@@ -202,7 +207,7 @@ def send_probe(member, msg):
     pendable = _ProbePendable(
         # We can only pend unicodes.
         member_id=member.member_id.hex,
-        message_id=msg['message-id'],
+        message_id=(msg['message-id'] if message_id is None else message_id),
         )
     token = getUtility(IPendings).add(pendable)
     mailbox, domain_parts = split_email(mlist.bounces_address)
@@ -215,14 +220,15 @@ def send_probe(member, msg):
     with _.using(member.preferred_language.code):
         subject = _('$mlist.display_name mailing list probe message')
     # Craft the probe message.  This will be a multipart where the first part
-    # is the probe text and the second part is the message that caused this
-    # probe to be sent.
+    # is the probe text and the second part, if we have it, is the message
+    # that caused this probe to be sent.
     probe = UserNotification(member.address.email, probe_sender,
                              subject, lang=member.preferred_language)
     probe.set_type('multipart/mixed')
     notice = MIMEText(text, _charset=mlist.preferred_language.charset)
     probe.attach(notice)
-    probe.attach(MIMEMessage(msg))
+    if msg is not None:
+        probe.attach(MIMEMessage(msg))
     # Probes should not have the Precedence: bulk header.
     probe.send(mlist, envsender=probe_sender, verp=False, probe_token=token,
                add_precedence=False)
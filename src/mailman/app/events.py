@@ -27,7 +27,8 @@ __all__ = [
 
 from zope import event
 
-from mailman.app import domain, moderator, subscriptions
+from mailman.app import (
+    domain, membership, moderator, routing, subscriptions)
 
 
 
@@ -37,4 +38,11 @@ def initialize():
         moderator.handle_ListDeletingEvent,
         subscriptions.handle_ListDeletedEvent,
         domain.handle_DomainDeletingEvent,
+        membership.handle_MembershipChangeEvent,
+        membership.handle_PreferencesChangeEvent,
+        membership.handle_PreferredAddressChangeEvent,
+        membership.handle_AddressLinkChangeEvent,
+        membership.handle_AddressDeletingEvent,
+        membership.handle_UserDeletingEvent,
+        routing.handle_ListEvent,
         ])
@@ -22,23 +22,40 @@ from __future__ import absolute_import, unicode_literals
 __metaclass__ = type
 __all__ = [
     'add_member',
+    'bump_membership_generation',
     'delete_member',
+    'handle_AddressDeletingEvent',
+    'handle_AddressLinkChangeEvent',
+    'handle_MembershipChangeEvent',
+    'handle_PreferencesChangeEvent',
+    'handle_PreferredAddressChangeEvent',
+    'handle_UserDeletingEvent',
     ]
 
 
 from email.utils import formataddr
 from flufl.password import lookup, make_secret
+from storm.locals import Store
 from zope.component import getUtility
 
 from mailman.app.notifications import send_goodbye_message
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.email.message import OwnerNotification
-from mailman.interfaces.address import IEmailValidator
+from mailman.interfaces.address import AddressDeletingEvent, IEmailValidator
 from mailman.interfaces.bans import IBanManager
+from mailman.interfaces.listmanager import IListManager
 from mailman.interfaces.member import (
-    MemberRole, MembershipIsBannedError, NotAMemberError)
+    MemberRole, MembershipChangeEvent, MembershipIsBannedError,
+    NotAMemberError)
+from mailman.interfaces.preferences import PreferencesChangeEvent
+from mailman.interfaces.user import (
+    AddressLinkChangeEvent, PreferredAddressChangeEvent, UserDeletingEvent)
 from mailman.interfaces.usermanager import IUserManager
+from mailman.model.address import Address
+from mailman.model.mailinglist import MailingList
+from mailman.model.member import Member
+from mailman.model.user import User
 from mailman.utilities.i18n import make
 
 
@@ -159,3 +176,135 @@ def delete_member(mlist, email, admin_notif=None, userack=None):
         msg = OwnerNotification(mlist, subject, text,
                                 roster=mlist.administrators)
         msg.send(mlist)
+
+
+
+def bump_membership_generation(mlist):
+    """Invalidate the cached recipients of a mailing list.
+
+    The generation is incremented by the database, so that concurrent bumps
+    from other processes are not lost.
+
+    :param mlist: The mailing list whose membership changed.
+    :type mlist: `IMailingList`
+    """
+    mlist.membership_generation = MailingList.membership_generation + 1
+
+
+def _bump_membership_generations(fqdn_listnames):
+    """Invalidate the cached recipients of some mailing lists.
+
+    :param fqdn_listnames: The mailing lists whose membership changed.
+    :type fqdn_listnames: iterable of strings
+    """
+    list_manager = getUtility(IListManager)
+    for fqdn_listname in set(fqdn_listnames):
+        mlist = list_manager.get(fqdn_listname)
+        if mlist is not None:
+            bump_membership_generation(mlist)
+
+
+def _address_listnames(store, address, user):
+    """The mailing lists whose recipients depend on an address.
+
+    These are the mailing lists the address is subscribed to and, if the
+    address is the user's preferred address, the mailing lists the user is
+    subscribed to.
+    """
+    fqdn_listnames = set(store.find(
+        Member, Member._address == address).values(Member.mailing_list))
+    if user is not None and user.preferred_address == address:
+        fqdn_listnames.update(store.find(
+            Member, Member._user == user).values(Member.mailing_list))
+    return fqdn_listnames
+
+
+def _user_listnames(user):
+    """The mailing lists whose recipients depend on a user."""
+    return set(member.mailing_list for member in user.memberships.members)
+
+
+
+def handle_MembershipChangeEvent(event):
+    """Bump the membership generation when a membership changes."""
+    if not isinstance(event, MembershipChangeEvent):
+        return
+    # The mailing list is None when its members are unsubscribed because the
+    # mailing list was deleted.
+    if event.mlist is not None:
+        bump_membership_generation(event.mlist)
+
+
+
+def handle_PreferencesChangeEvent(event):
+    """Bump the membership generations affected by a preference change."""
+    if not isinstance(event, PreferencesChangeEvent):
+        return
+    preferences = event.preferences
+    store = Store.of(preferences)
+    if store is None:
+        # The preferences aren't linked to any member, address or user yet.
+        return
+    # The preferences belong to exactly one of a member, an address, or a
+    # user.  Address and user preferences may affect several memberships.
+    fqdn_listnames = set(store.find(
+        Member, Member.preferences == preferences).values(
+            Member.mailing_list))
+    for address in store.find(Address, Address.preferences == preferences):
+        fqdn_listnames.update(
+            _address_listnames(store, address, address.user))
+    for user in store.find(User, User.preferences == preferences):
+        fqdn_listnames.update(_user_listnames(user))
+    _bump_membership_generations(fqdn_listnames)
+
+
+
+def handle_PreferredAddressChangeEvent(event):
+    """Bump the membership generations of a user's direct subscriptions."""
+    if not isinstance(event, PreferredAddressChangeEvent):
+        return
+    store = Store.of(event.user)
+    if store is None:
+        return
+    _bump_membership_generations(store.find(
+        Member, Member._user == event.user).values(Member.mailing_list))
+
+
+
+def handle_AddressLinkChangeEvent(event):
+    """Bump the membership generations affected by (un)linking an address.
+
+    The preferences of the members subscribed with the address fall back to
+    the preferences of the address's user.
+    """
+    if not isinstance(event, AddressLinkChangeEvent):
+        return
+    store = Store.of(event.address)
+    if store is None:
+        return
+    _bump_membership_generations(
+        _address_listnames(store, event.address, event.user))
+
+
+
+def handle_AddressDeletingEvent(event):
+    """Bump the membership generations affected by deleting an address."""
+    if not isinstance(event, AddressDeletingEvent):
+        return
+    store = Store.of(event.address)
+    if store is None:
+        return
+    _bump_membership_generations(
+        _address_listnames(store, event.address, event.address.user))
+
+
+
+def handle_UserDeletingEvent(event):
+    """Bump the membership generations affected by deleting a user."""
+    if not isinstance(event, UserDeletingEvent):
+        return
+    store = Store.of(event.user)
+    if store is None:
+        return
+    # The user's memberships include those of all its addresses.
+    _bump_membership_generations(_user_listnames(event.user))
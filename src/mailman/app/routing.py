@@ -0,0 +1,181 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Routing of mailing list addresses to the queues which handle them."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'RoutingTable',
+    'handle_ListEvent',
+    'routing_table',
+    'split_recipient',
+    ]
+
+
+from zope.component import getUtility
+
+from mailman.config import config
+from mailman.interfaces.listmanager import (
+    IListManager, ListCreatedEvent, ListDeletedEvent)
+
+
+# We only care about the listname and the sub-addresses as in listname@ or
+# listname-request@.  This maps user visible subaddress names (which may
+# include aliases) to the internal canonical subaddress name.
+SUBADDRESS_NAMES = dict(
+    admin='bounces',
+    bounces='bounces',
+    confirm='confirm',
+    join='join',
+    leave='leave',
+    owner='owner',
+    request='request',
+    subscribe='join',
+    unsubscribe='leave',
+    )
+
+# This maps subaddress canonical name to the destination queue that handles
+# messages sent to that subaddress.
+SUBADDRESS_QUEUES = dict(
+    bounces='bounces',
+    confirm='command',
+    join='command',
+    leave='command',
+    owner='in',
+    request='command',
+    )
+
+DASH = '-'
+
+
+
+def split_recipient(address):
+    """Split an address into listname, subaddress and domain parts.
+
+    The addresses of existing mailing lists are looked up in the routing
+    table, so that e.g. a list named mylist-request is told apart from the
+    request address of mylist.  Other addresses are split by name.  For
+    example:
+
+    >>> split_recipient('mylist@example.com')
+    ('mylist', None, 'example.com')
+
+    >>> split_recipient('mylist-subscribe@example.com')
+    ('mylist', 'join', 'example.com')
+
+    This must be called from within a transaction.
+
+    :param address: The destination address.
+    :return: A 3-tuple of the form (list-shortname, subaddress, domain).
+        subaddress is the canonical subaddress name, or None if this is the
+        list's posting address.
+    """
+    route = RoutingTable.route(routing_table.routes, address.lower())
+    if route is not None:
+        fqdn_listname, queue, subaddress = route
+        listname, at, domain = fqdn_listname.partition('@')
+        return listname, subaddress, domain
+    localpart, domain = address.split('@', 1)
+    localpart = localpart.split(config.mta.verp_delimiter, 1)[0]
+    parts = localpart.split(DASH)
+    if parts[-1] in SUBADDRESS_NAMES:
+        listname = DASH.join(parts[:-1])
+        subaddress = SUBADDRESS_NAMES[parts[-1]]
+    else:
+        listname = localpart
+        subaddress = None
+    return listname, subaddress, domain
+
+
+
+class RoutingTable:
+    """Map recipient addresses to the queues which handle them.
+
+    Every address of every mailing list, i.e. its posting address and all of
+    its sub-addresses, is mapped to a 3-tuple of the form (fqdn_listname,
+    queue, canonical-subaddress), so that each recipient can be routed with a
+    single dictionary lookup.  The table is rebuilt when a mailing list is
+    created or deleted, either in this process or in another one.
+    """
+
+    def __init__(self):
+        self._routes = None
+        self._generation = None
+
+    def invalidate(self):
+        """Rebuild the table the next time it is used."""
+        self._routes = None
+
+    @property
+    def routes(self):
+        """The current routes.
+
+        The dictionary is never changed once it has been returned, so it can
+        safely be used from other threads.  This must be read from within a
+        transaction though.
+        """
+        list_manager = getUtility(IListManager)
+        generation = list_manager.generation
+        if self._routes is None or generation != self._generation:
+            name_components = list(list_manager.name_components)
+            routes = {}
+            for listname, domain in name_components:
+                fqdn_listname = '{0}@{1}'.format(listname, domain)
+                for subaddress, canonical in SUBADDRESS_NAMES.items():
+                    address = '{0}-{1}@{2}'.format(
+                        listname, subaddress, domain)
+                    routes[address] = (
+                        fqdn_listname, SUBADDRESS_QUEUES[canonical], canonical)
+            # The posting addresses go in last, so that a list named
+            # e.g. foo-request can be posted to even if foo exists.
+            for listname, domain in name_components:
+                fqdn_listname = '{0}@{1}'.format(listname, domain)
+                routes[fqdn_listname] = (fqdn_listname, 'in', None)
+            self._routes = routes
+            self._generation = generation
+        return self._routes
+
+    @staticmethod
+    def route(routes, address):
+        """Find where a recipient address is routed to.
+
+        :param routes: The routes, as returned by `routes`.
+        :type routes: dictionary
+        :param address: The lower cased recipient address, which may carry a
+            VERP suffix.
+        :type address: str
+        :return: The (fqdn_listname, queue, canonical-subaddress) 3-tuple, or
+            None if the address doesn't belong to any mailing list.
+        """
+        route = routes.get(address)
+        if route is None and config.mta.verp_delimiter in address:
+            localpart, domain = address.split('@', 1)
+            localpart = localpart.split(config.mta.verp_delimiter, 1)[0]
+            route = routes.get('{0}@{1}'.format(localpart, domain))
+        return route
+
+
+# The routing table of this process.
+routing_table = RoutingTable()
+
+
+def handle_ListEvent(event):
+    """Invalidate the routing table when a list is created or deleted."""
+    if isinstance(event, (ListCreatedEvent, ListDeletedEvent)):
+        routing_table.invalidate()
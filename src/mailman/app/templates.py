@@ -25,69 +25,86 @@ __all__ = [
     ]
 
 
+import os
+import time
 import urllib2
 
 from contextlib import closing
+from itertools import takewhile
 from urllib import addinfourl
 from urlparse import urlparse
 from zope.component import getUtility
 from zope.interface import implementer
 
-from mailman.utilities.i18n import TemplateNotFoundError, find
+from mailman.utilities.i18n import TemplateNotFoundError, find, search
 from mailman.interfaces.languages import ILanguageManager
 from mailman.interfaces.listmanager import IListManager
 from mailman.interfaces.templates import ITemplateLoader
 
 
+# Cached templates are checked against the file system at most this often, in
+# seconds.  Configuration changes invalidate the cache right away.
+CHECK_INTERVAL = 5
+
+
+
+def _find_template(original_url):
+    # Parse urls of the form:
+    #
+    # mailman:///<fqdn_listname>/<language>/<template_name>
+    #
+    # where only the template name is required, and return the path to the
+    # template, the open template file, and the paths searched before it.
+    mlist = code = template = None
+    parsed = urlparse(original_url)
+    assert parsed.scheme == 'mailman'
+    # The path can contain one, two, or three components.  Since no empty
+    # path components are legal, filter them out.
+    parts = filter(None, parsed.path.split('/'))
+    if len(parts) == 0:
+        raise urllib2.URLError('No template specified')
+    elif len(parts) == 1:
+        template = parts[0]
+    elif len(parts) == 2:
+        part0, template = parts
+        # Is part0 a language code or a mailing list?  It better be one or
+        # the other, and there's no possibility of namespace collisions
+        # because language codes don't contain @ and mailing list names
+        # MUST contain @.
+        language = getUtility(ILanguageManager).get(part0)
+        mlist = getUtility(IListManager).get(part0)
+        if language is None and mlist is None:
+            raise urllib2.URLError('Bad language or list name')
+        elif mlist is None:
+            code = language.code
+    elif len(parts) == 3:
+        fqdn_listname, code, template = parts
+        mlist = getUtility(IListManager).get(fqdn_listname)
+        if mlist is None:
+            raise urllib2.URLError('Missing list')
+        language = getUtility(ILanguageManager).get(code)
+        if language is None:
+            raise urllib2.URLError('No such language')
+        code = language.code
+    else:
+        raise urllib2.URLError('No such file')
+    # Find the template, mutating any missing template exception.
+    try:
+        path, fp = find(template, mlist, code)
+    except TemplateNotFoundError:
+        raise urllib2.URLError('No such file')
+    preceding = list(takewhile(lambda candidate: candidate != path,
+                               search(template, mlist, code)))
+    return path, fp, preceding
+
+
 
 class MailmanHandler(urllib2.BaseHandler):
     # Handle internal mailman: URLs.
     def mailman_open(self, req):
-        # Parse urls of the form:
-        #
-        # mailman:///<fqdn_listname>/<language>/<template_name>
-        #
-        # where only the template name is required.
-        mlist = code = template = None
         # Parse the full requested URL and be sure it's something we handle.
         original_url = req.get_full_url()
-        parsed = urlparse(original_url)
-        assert parsed.scheme == 'mailman'
-        # The path can contain one, two, or three components.  Since no empty
-        # path components are legal, filter them out.
-        parts = filter(None, parsed.path.split('/'))
-        if len(parts) == 0:
-            raise urllib2.URLError('No template specified')
-        elif len(parts) == 1:
-            template = parts[0]
-        elif len(parts) == 2:
-            part0, template = parts
-            # Is part0 a language code or a mailing list?  It better be one or
-            # the other, and there's no possibility of namespace collisions
-            # because language codes don't contain @ and mailing list names
-            # MUST contain @.
-            language = getUtility(ILanguageManager).get(part0)
-            mlist = getUtility(IListManager).get(part0)
-            if language is None and mlist is None:
-                raise urllib2.URLError('Bad language or list name')
-            elif mlist is None:
-                code = language.code
-        elif len(parts) == 3:
-            fqdn_listname, code, template = parts
-            mlist = getUtility(IListManager).get(fqdn_listname)
-            if mlist is None:
-                raise urllib2.URLError('Missing list')
-            language = getUtility(ILanguageManager).get(code)
-            if language is None:
-                raise urllib2.URLError('No such language')
-            code = language.code
-        else:
-            raise urllib2.URLError('No such file')
-        # Find the template, mutating any missing template exception.
-        try:
-            path, fp = find(template, mlist, code)
-        except TemplateNotFoundError:
-            raise urllib2.URLError('No such file')
+        path, fp, preceding = _find_template(original_url)
         return addinfourl(fp, {}, original_url)
 
 
@@ -99,8 +116,46 @@ class TemplateLoader:
     def __init__(self):
         opener = urllib2.build_opener(MailmanHandler())
         urllib2.install_opener(opener)
+        # Map mailman: URIs to the path, modification time and size of the
+        # template file they were resolved to, the paths searched before it,
+        # its contents, and the time it was last checked.
+        self._cache = {}
 
     def get(self, uri):
         """See `ITemplateLoader`."""
-        with closing(urllib2.urlopen(uri)) as fp:
-            return fp.read()
+        if urlparse(uri).scheme != 'mailman':
+            with closing(urllib2.urlopen(uri)) as fp:
+                return fp.read()
+        cached = self._cache.get(uri)
+        now = time.time()
+        if cached is not None:
+            path, mtime, size, preceding, content, checked = cached
+            if now - checked < CHECK_INTERVAL:
+                return content
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # The template is gone, so search for it again.
+                pass
+            else:
+                # A template added earlier in the search order, e.g. for the
+                # mailing list or its domain, takes precedence.
+                if ((stat.st_mtime, stat.st_size) == (mtime, size) and
+                    not any(os.path.exists(candidate)
+                            for candidate in preceding)):
+                    self._cache[uri] = cached[:-1] + (now,)
+                    return content
+        path, fp, preceding = _find_template(uri)
+        with closing(fp):
+            stat = os.fstat(fp.fileno())
+            content = fp.read()
+        self._cache[uri] = (
+            path, stat.st_mtime, stat.st_size, preceding, content, now)
+        return content
+
+    def invalidate(self, uri=None):
+        """See `ITemplateLoader`."""
+        if uri is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(uri, None)
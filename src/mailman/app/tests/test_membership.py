@@ -34,10 +34,12 @@ from mailman.config import config
 from mailman.core.constants import system_preferences
 from mailman.interfaces.bans import IBanManager
 from mailman.interfaces.member import (
-    AlreadySubscribedError, DeliveryMode, MemberRole, MembershipIsBannedError)
+    AlreadySubscribedError, DeliveryMode, DeliveryStatus, MemberRole,
+    MembershipIsBannedError)
 from mailman.interfaces.usermanager import IUserManager
 from mailman.testing.helpers import reset_the_world
 from mailman.testing.layers import ConfigLayer
+from mailman.utilities.datetime import now
 
 
 
@@ -196,3 +198,108 @@ class AddMemberPasswordTest(unittest.TestCase):
                             system_preferences.preferred_language)
         self.assertEqual(
             member.user.password, '{SHA}qZk-NkcGgWq6PiVxeFDCbJzQ2J0=')
+
+
+
+class MembershipGenerationTest(unittest.TestCase):
+    """Test the bumping of mailing list membership generations."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._ant = create_list('ant@example.com')
+        self._bee = create_list('bee@example.com')
+        self._user_manager = getUtility(IUserManager)
+        self._anne = self._user_manager.create_user('anne@example.com')
+        self._address = list(self._anne.addresses)[0]
+        self._address.verified_on = now()
+        self._anne.preferred_address = self._address
+
+    def _generations(self):
+        return (self._ant.membership_generation,
+                self._bee.membership_generation)
+
+    def test_new_list(self):
+        self.assertEqual(self._generations(), (0, 0))
+
+    def test_subscribe_and_unsubscribe(self):
+        member = self._ant.subscribe(self._address)
+        self.assertEqual(self._generations(), (1, 0))
+        member.unsubscribe()
+        self.assertEqual(self._generations(), (2, 0))
+
+    def test_member_preferences(self):
+        member = self._ant.subscribe(self._address)
+        self._bee.subscribe(self._anne)
+        self.assertEqual(self._generations(), (1, 1))
+        member.preferences.delivery_mode = DeliveryMode.mime_digests
+        self.assertEqual(self._generations(), (2, 1))
+
+    def test_irrelevant_preferences(self):
+        # Preferences which don't affect the recipients don't bump the
+        # generation.
+        member = self._ant.subscribe(self._address)
+        member.preferences.acknowledge_posts = True
+        self.assertEqual(self._generations(), (1, 0))
+
+    def test_address_preferences(self):
+        # Address preferences affect the address's own subscriptions, and the
+        # subscriptions of the user for which it is the preferred address.
+        self._ant.subscribe(self._address)
+        self._bee.subscribe(self._anne)
+        self._address.preferences.delivery_status = DeliveryStatus.by_user
+        self.assertEqual(self._generations(), (2, 2))
+
+    def test_user_preferences(self):
+        self._ant.subscribe(self._address)
+        self._anne.preferences.receive_own_postings = False
+        self.assertEqual(self._generations(), (2, 0))
+
+    def test_preferred_address(self):
+        # Changing the preferred address affects the user's direct
+        # subscriptions.
+        self._ant.subscribe(self._address)
+        self._bee.subscribe(self._anne)
+        address = self._user_manager.create_address('anne@example.org')
+        address.verified_on = now()
+        self._anne.preferred_address = address
+        self.assertEqual(self._generations(), (1, 2))
+
+    def test_link_and_unlink(self):
+        # Linking an address changes the preferences its memberships fall
+        # back to.
+        address = self._user_manager.create_address('anne@example.org')
+        self._ant.subscribe(address)
+        self.assertEqual(self._generations(), (1, 0))
+        self._anne.link(address)
+        self.assertEqual(self._generations(), (2, 0))
+        self._anne.unlink(address)
+        self.assertEqual(self._generations(), (3, 0))
+
+    def _assert_bumped(self, function, *args):
+        before = self._generations()
+        function(*args)
+        after = self._generations()
+        self.assertGreater(after[0], before[0])
+        self.assertGreater(after[1], before[1])
+
+    def test_delete_address(self):
+        self._ant.subscribe(self._address)
+        self._bee.subscribe(self._anne)
+        self._assert_bumped(self._user_manager.delete_address, self._address)
+
+    def test_delete_user(self):
+        self._ant.subscribe(self._address)
+        self._bee.subscribe(self._anne)
+        self._assert_bumped(self._user_manager.delete_user, self._anne)
+
+    def test_concurrent_bumps(self):
+        # The generation is incremented in the database, so a bump made by
+        # another process since the mailing list was loaded is not lost.
+        self.assertEqual(self._generations(), (0, 0))
+        config.db.store.execute("""
+            UPDATE mailinglist SET membership_generation =
+            membership_generation + 1
+            """)
+        self._ant.subscribe(self._address)
+        self.assertEqual(self._ant.membership_generation, 2)
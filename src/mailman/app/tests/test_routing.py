@@ -0,0 +1,113 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the routing of mailing list addresses."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestRoutingTable',
+    ]
+
+
+import unittest
+
+from zope.component import getUtility
+
+from mailman.app.lifecycle import create_list, remove_list
+from mailman.app.routing import RoutingTable, routing_table, split_recipient
+from mailman.interfaces.listmanager import IListManager
+from mailman.testing.layers import ConfigLayer
+
+
+
+class TestRoutingTable(unittest.TestCase):
+    """Test the routing table."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        # The test layer resets the database behind the table's back.
+        routing_table.invalidate()
+        self._mlist = create_list('test@example.com')
+
+    def test_routes(self):
+        routes = routing_table.routes
+        self.assertEqual(routes['test@example.com'],
+                         ('test@example.com', 'in', None))
+        self.assertEqual(routes['test-request@example.com'],
+                         ('test@example.com', 'command', 'request'))
+        self.assertEqual(routes['test-admin@example.com'],
+                         ('test@example.com', 'bounces', 'bounces'))
+        self.assertEqual(routes['test-owner@example.com'],
+                         ('test@example.com', 'in', 'owner'))
+        self.assertNotIn('test-bogus@example.com', routes)
+        # The routes are cached.
+        self.assertIs(routing_table.routes, routes)
+
+    def test_verp(self):
+        self.assertEqual(
+            RoutingTable.route(routing_table.routes,
+                               'test-bounces+anne=example.org@example.com'),
+            ('test@example.com', 'bounces', 'bounces'))
+        self.assertEqual(
+            RoutingTable.route(routing_table.routes,
+                               'nobody+anne=example.org@example.com'),
+            None)
+
+    def test_posting_address_wins(self):
+        # A list named like another list's sub-address gets its own posts.
+        create_list('test-request@example.com')
+        self.assertEqual(routing_table.routes['test-request@example.com'],
+                         ('test-request@example.com', 'in', None))
+
+    def test_list_events(self):
+        # Creating and deleting lists invalidates the routes.
+        self.assertNotIn('other@example.com', routing_table.routes)
+        mlist = create_list('other@example.com')
+        self.assertIn('other@example.com', routing_table.routes)
+        remove_list(mlist.fqdn_listname, mlist)
+        self.assertNotIn('other@example.com', routing_table.routes)
+
+    def test_generation(self):
+        # Lists created or deleted by other processes don't send any events
+        # to this one, but they change the list manager's generation.
+        table = RoutingTable()
+        generation = getUtility(IListManager).generation
+        self.assertNotIn('other@example.com', table.routes)
+        mlist = create_list('other@example.com')
+        self.assertNotEqual(getUtility(IListManager).generation, generation)
+        self.assertIn('other@example.com', table.routes)
+        getUtility(IListManager).delete(mlist)
+        self.assertNotIn('other@example.com', table.routes)
+
+    def test_split_recipient(self):
+        # Existing lists' addresses are split through the routing table.
+        create_list('test-request@example.com')
+        self.assertEqual(split_recipient('test-request@example.com'),
+                         ('test-request', None, 'example.com'))
+        self.assertEqual(split_recipient('Test-Admin@example.com'),
+                         ('test', 'bounces', 'example.com'))
+        self.assertEqual(
+            split_recipient('test-bounces+anne=example.org@example.com'),
+            ('test', 'bounces', 'example.com'))
+        # Other addresses are split by name.
+        self.assertEqual(split_recipient('other-leave@example.com'),
+                         ('other', 'leave', 'example.com'))
+        self.assertEqual(split_recipient('other@example.com'),
+                         ('other', None, 'example.com'))
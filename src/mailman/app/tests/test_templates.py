@@ -26,6 +26,8 @@ __all__ = [
 
 
 import os
+import mock
+import time
 import shutil
 import urllib2
 import tempfile
@@ -144,3 +146,79 @@ class TestTemplateLoader(unittest.TestCase):
             self.assertEqual(error.reason, 'No such file')
         else:
             raise AssertionError('Exception expected')
+
+    def test_cached(self):
+        # The template is only searched for the first time.
+        self.assertEqual(self._loader.get('mailman:///demo.txt'),
+                         'Test content')
+        with mock.patch('mailman.app.templates.find') as find:
+            content = self._loader.get('mailman:///demo.txt')
+        self.assertEqual(content, 'Test content')
+        self.assertFalse(find.called)
+
+    def test_checked_once_per_interval(self):
+        # The file system isn't checked for changes on every cache hit.
+        self._loader.get('mailman:///demo.txt')
+        with mock.patch('mailman.app.templates.os') as os_module:
+            self.assertEqual(self._loader.get('mailman:///demo.txt'),
+                             'Test content')
+        self.assertEqual(os_module.mock_calls, [])
+
+    def _later(self):
+        # Move past the interval in which cached templates aren't checked.
+        return mock.patch('mailman.app.templates.time', **{
+            'time.return_value': time.time() + 60})
+
+    def test_changed_template(self):
+        # A cached template is reloaded when its file changes.
+        self.assertEqual(self._loader.get('mailman:///demo.txt'),
+                         'Test content')
+        path = os.path.join(self.var_dir, 'templates', 'site', 'en',
+                            'demo.txt')
+        with open(path, 'w') as fp:
+            print('New content', end='', file=fp)
+        os.utime(path, (0, 0))
+        self.assertEqual(self._loader.get('mailman:///demo.txt'),
+                         'Test content')
+        with self._later():
+            self.assertEqual(self._loader.get('mailman:///demo.txt'),
+                             'New content')
+
+    def test_new_template_takes_over(self):
+        # A list specific template added later is found, even though the
+        # site template is cached.
+        uri = 'mailman:///test@example.com/en/demo.txt'
+        self.assertEqual(self._loader.get(uri), 'Test content')
+        path = os.path.join(self.var_dir, 'templates', 'lists',
+                            'test@example.com', 'en')
+        os.makedirs(path)
+        with open(os.path.join(path, 'demo.txt'), 'w') as fp:
+            print('List content', end='', file=fp)
+        with self._later():
+            self.assertEqual(self._loader.get(uri), 'List content')
+
+    def test_invalidate(self):
+        # An invalidated template is searched for again.
+        uri = 'mailman:///test@example.com/en/demo.txt'
+        self.assertEqual(self._loader.get(uri), 'Test content')
+        self._loader.invalidate(uri)
+        path = os.path.join(self.var_dir, 'templates', 'site', 'en',
+                            'demo.txt')
+        with mock.patch('mailman.app.templates.find',
+                        return_value=(path, open(path))) as find:
+            self.assertEqual(self._loader.get(uri), 'Test content')
+        self.assertTrue(find.called)
+
+    def test_configuration_change(self):
+        # Changing the configuration clears the cache.
+        self._loader.get('mailman:///demo.txt')
+        config.push('other', '[mailman]\nlayout: testing')
+        try:
+            with mock.patch('mailman.app.templates.find', return_value=(
+                    'demo.txt', open(os.path.join(
+                        self.var_dir, 'templates', 'site', 'en',
+                        'demo.txt')))) as find:
+                self._loader.get('mailman:///demo.txt')
+            self.assertTrue(find.called)
+        finally:
+            config.pop('other')
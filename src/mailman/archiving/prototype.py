@@ -27,23 +27,20 @@ __all__ = [
 
 import os
 import errno
-import logging
 
 from datetime import timedelta
 from mailbox import Maildir
 from urlparse import urljoin
 
-from flufl.lock import Lock, TimeOutError
+from flufl.lock import Lock
 from zope.interface import implementer
 
 from mailman.config import config
-from mailman.interfaces.archiver import IArchiver
-
-log = logging.getLogger('mailman.error')
+from mailman.interfaces.archiver import IBatchArchiver
 
 
 
-@implementer(IArchiver)
+@implementer(IBatchArchiver)
 class Prototype:
     """A prototype of a third party archiver.
 
@@ -75,6 +72,15 @@ class Prototype:
 
         This archiver saves messages into a maildir.
         """
+        Prototype.archive_messages(mlist, [message])
+
+    @staticmethod
+    def archive_messages(mlist, messages):
+        """See `IBatchArchiver`.
+
+        All the messages are added to the maildir under a single acquisition
+        of its lock.
+        """
         archive_dir = os.path.join(config.ARCHIVE_DIR, 'prototype')
         try:
             os.makedirs(archive_dir, 0775)
@@ -91,29 +97,18 @@ class Prototype:
         lock_file = os.path.join(
             config.LOCK_DIR, '{0}-maildir.lock'.format(mlist.fqdn_listname))
 
-        # Lock the maildir as Maildir.add() is not threadsafe.  Don't use the
-        # context manager because it's not an error if we can't acquire the
-        # archiver lock.  We'll just log the problem and continue.
-        #
-        # XXX 2012-03-14 BAW: When we extend the chain/pipeline architecture
-        # to other runners, e.g. the archive runner, it would be better to let
-        # any TimeOutError propagate up.  That would cause the message to be
-        # re-queued and tried again later, rather than being discarded as
-        # happens now below.
+        # Lock the maildir as Maildir.add() is not threadsafe.  If we can't
+        # acquire the lock, the TimeOutError propagates up so that the
+        # messages are requeued and tried again later.
         lock = Lock(lock_file)
+        lock.lock(timeout=timedelta(seconds=1))
         try:
-            lock.lock(timeout=timedelta(seconds=1))
-            # Add the message to the maildir.  The return value could be used
-            # to construct the file path if necessary.  E.g.
-            #
-            # os.path.join(archive_dir, mlist.fqdn_listname, 'new',
-            #              message_key)
-            mailbox.add(message)
-        except TimeOutError:
-            # Log the error and go on.
-            log.error('Unable to acquire prototype archiver lock for {0}, '
-                      'discarding: {1}'.format(
-                          mlist.fqdn_listname,
-                          message.get('message-id', 'n/a')))
+            for message in messages:
+                # Add the message to the maildir.  The return value could be
+                # used to construct the file path if necessary.  E.g.
+                #
+                # os.path.join(archive_dir, mlist.fqdn_listname, 'new',
+                #              message_key)
+                mailbox.add(message)
         finally:
             lock.unlock(unconditionally=True)
@@ -288,6 +288,18 @@ class PIDWatcher:
         """
         return self._pids.pop(pid, None)
 
+    def get(self, pid):
+        """Return existing process information.
+
+        :param pid: The process id.
+        :type pid: int
+        :return: The process information, or None if the process id is not
+            being tracked.
+        :rtype: 4-tuple consisting of
+            (runner-name, slice-number, slice-count, restart-count)
+        """
+        return self._pids.get(pid)
+
 
 
 class Loop:
@@ -298,6 +310,12 @@ class Loop:
         self._restartable = restartable
         self._config_file = config_file
         self._kids = PIDWatcher()
+        # The number of instances started for each runner.
+        self._instances = {}
+        # The runners being rescaled, mapped to their new number of instances.
+        # These are started once all the old instances have exited.
+        self._rescaling = {}
+        self._rescale_requested = False
 
     def install_signal_handlers(self):
         """Install various signals handlers for control from the master."""
@@ -336,6 +354,12 @@ class Loop:
                 os.kill(pid, signal.SIGINT)
             log.info('Master watcher caught SIGINT.  Restarting.')
         signal.signal(signal.SIGINT, sigint_handler)
+        # SIGUSR2 is used by 'mailman rescale'.  Rescaling forks, so it's done
+        # by the main loop rather than in the signal handler.
+        def sigusr2_handler(signum, frame):
+            self._rescale_requested = True
+            log.info('Master watcher caught SIGUSR2.  Rescaling.')
+        signal.signal(signal.SIGUSR2, sigusr2_handler)
 
     def _start_runner(self, spec):
         """Start a runner.
@@ -397,19 +421,60 @@ class Loop:
             runner_config = getattr(config, section_name)
             if not as_boolean(runner_config.start):
                 continue
-            # Find out how many runners to instantiate.  This must be a power
-            # of 2.
+            # Find out how many runners to instantiate.  With range slicing,
+            # this must be a power of 2.
             count = int(runner_config.instances)
-            assert (count & (count - 1)) == 0, (
+            assert (runner_config.slicing != 'range' or
+                    (count & (count - 1)) == 0), (
                 'Runner "{0}", not a power of 2: {1}'.format(name, count))
-            for slice_number in range(count):
-                # runner name, slice #, # of slices, restart count
-                info = (name, slice_number, count, 0)
-                spec = '{0}:{1:d}:{2:d}'.format(name, slice_number, count)
-                pid = self._start_runner(spec)
-                log = logging.getLogger('mailman.runner')
-                log.debug('[{0:d}] {1}'.format(pid, spec))
-                self._kids.add(pid, info)
+            self._start_instances(name, count)
+
+    def _start_instances(self, name, count):
+        """Start all the instances of a runner.
+
+        :param name: The runner name.
+        :type name: string
+        :param count: The number of instances, i.e. slices, to start.
+        :type count: int
+        """
+        log = logging.getLogger('mailman.runner')
+        self._instances[name] = count
+        for slice_number in range(count):
+            # runner name, slice #, # of slices, restart count
+            info = (name, slice_number, count, 0)
+            spec = '{0}:{1:d}:{2:d}'.format(name, slice_number, count)
+            pid = self._start_runner(spec)
+            log.debug('[{0:d}] {1}'.format(pid, spec))
+            self._kids.add(pid, info)
+
+    def rescale(self):
+        """Match the number of runner instances to the configuration.
+
+        Every started runner whose number of instances has changed in the
+        configuration has all its instances stopped.  Once they have exited,
+        the new number of instances is started.  The other runners keep
+        running.
+        """
+        log = logging.getLogger('mailman.runner')
+        for name, count in sorted(self._instances.items()):
+            runner_config = getattr(config, 'runner.' + name)
+            new_count = int(runner_config.instances)
+            if new_count == count or name in self._rescaling:
+                continue
+            if (runner_config.slicing == 'range' and
+                (new_count & (new_count - 1)) != 0):
+                log.error('Runner {0}, not a power of 2: {1}'.format(
+                    name, new_count))
+                continue
+            log.info('Rescaling runner {0} from {1:d} to {2:d} '
+                     'instances'.format(name, count, new_count))
+            self._rescaling[name] = new_count
+            pids = [pid for pid in self._kids
+                    if self._kids.get(pid)[0] == name]
+            for pid in pids:
+                os.kill(pid, signal.SIGTERM)
+            if len(pids) == 0:
+                self._start_instances(name, self._rescaling.pop(name))
 
     def _pause(self):
         """Sleep until a signal is received."""
@@ -424,9 +489,13 @@ class Loop:
         Wait until all the runner subprocesses have exited, restarting them if
         necessary and configured to do so.
         """
-        log = logging.getLogger('mailman.runner')
         self._pause()
         while True:
+            if self._rescale_requested:
+                self._rescale_requested = False
+                # Pick up the new number of instances.
+                config.reload()
+                self.rescale()
             try:
                 pid, status = os.wait()
             except OSError as error:
@@ -438,46 +507,63 @@ class Loop:
                     continue
                 else:
                     raise
-            # Find out why the subprocess exited by getting the signal
-            # received or exit status.
-            if os.WIFSIGNALED(status):
-                why = os.WTERMSIG(status)
-            elif os.WIFEXITED(status):
-                why = os.WEXITSTATUS(status)
-            else:
-                why = None
-            # We'll restart the subprocess if it exited with a SIGUSR1 or
-            # because of a failure (i.e. no exit signal), and the no-restart
-            # command line switch was not given.  This lets us better handle
-            # runaway restarts (e.g.  if the subprocess had a syntax error!)
-            rname, slice_number, count, restarts = self._kids.pop(pid)
-            config_name = 'runner.' + rname
+            self._reap(pid, status)
+
+    def _reap(self, pid, status):
+        """Handle the exit of a runner subprocess.
+
+        :param pid: The process id of the runner.
+        :type pid: int
+        :param status: The exit status of the runner, as returned by
+            `os.wait()`.
+        :type status: int
+        """
+        log = logging.getLogger('mailman.runner')
+        # Find out why the subprocess exited by getting the signal
+        # received or exit status.
+        if os.WIFSIGNALED(status):
+            why = os.WTERMSIG(status)
+        elif os.WIFEXITED(status):
+            why = os.WEXITSTATUS(status)
+        else:
+            why = None
+        # We'll restart the subprocess if it exited with a SIGUSR1 or
+        # because of a failure (i.e. no exit signal), and the no-restart
+        # command line switch was not given.  This lets us better handle
+        # runaway restarts (e.g.  if the subprocess had a syntax error!)
+        rname, slice_number, count, restarts = self._kids.pop(pid)
+        config_name = 'runner.' + rname
+        restart = False
+        if why == signal.SIGUSR1 and self._restartable:
+            restart = True
+        # Have we hit the maximum number of restarts?
+        restarts += 1
+        max_restarts = int(getattr(config, config_name).max_restarts)
+        if restarts > max_restarts:
             restart = False
-            if why == signal.SIGUSR1 and self._restartable:
-                restart = True
-            # Have we hit the maximum number of restarts?
-            restarts += 1
-            max_restarts = int(getattr(config, config_name).max_restarts)
-            if restarts > max_restarts:
-                restart = False
-            # Are we permanently non-restartable?
-            log.debug("""\
+        # Are we permanently non-restartable?
+        log.debug("""\
 Master detected subprocess exit
 (pid: {0:d}, why: {1}, class: {2}, slice: {3:d}/{4:d}) {5}""".format(
-                     pid, why, rname, slice_number + 1, count,
-                     ('[restarting]' if restart else '')))
-            # See if we've reached the maximum number of allowable restarts.
-            if restarts > max_restarts:
-                log.info("""\
+                 pid, why, rname, slice_number + 1, count,
+                 ('[restarting]' if restart else '')))
+        # See if we've reached the maximum number of allowable restarts.
+        if restarts > max_restarts:
+            log.info("""\
 Runner {0} reached maximum restart limit of {1:d}, not restarting.""",
-                         rname, max_restarts)
-            # Now perhaps restart the process unless it exited with a
-            # SIGTERM or we aren't restarting.
-            if restart:
-                spec = '{0}:{1:d}:{2:d}'.format(rname, slice_number, count)
-                new_pid = self._start_runner(spec)
-                new_info = (rname, slice_number, count, restarts)
-                self._kids.add(new_pid, new_info)
+                     rname, max_restarts)
+        # Now perhaps restart the process unless it exited with a
+        # SIGTERM or we aren't restarting.
+        if restart and rname not in self._rescaling:
+            spec = '{0}:{1:d}:{2:d}'.format(rname, slice_number, count)
+            new_pid = self._start_runner(spec)
+            new_info = (rname, slice_number, count, restarts)
+            self._kids.add(new_pid, new_info)
+        # Once all the old instances of a runner being rescaled have exited,
+        # start the new ones.
+        if rname in self._rescaling and not any(
+                self._kids.get(kid)[0] == rname for kid in self._kids):
+            self._start_instances(rname, self._rescaling.pop(rname))
 
     def cleanup(self):
         """Ensure that all children have exited."""
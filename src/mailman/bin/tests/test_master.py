@@ -21,17 +21,24 @@ from __future__ import absolute_import, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestMasterLock',
+    'TestRescale',
     ]
 
 
 import os
+import mock
 import errno
+import signal
 import tempfile
 import unittest
 
 from flufl.lock import Lock
+from itertools import count
 
 from mailman.bin import master
+from mailman.config import config
+from mailman.testing.layers import ConfigLayer
 
 
 
@@ -71,3 +78,72 @@ class TestMasterLock(unittest.TestCase):
             my_lock.unlock()
         self.assertEqual(state, master.WatcherState.conflict)
         # XXX test stale_lock and host_mismatch states.
+
+
+
+
+class TestRescale(unittest.TestCase):
+    """Test changing the number of runner instances."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._loop = master.Loop()
+        self._started = []
+        pids = count(1000)
+        def start_runner(spec):
+            self._started.append(spec)
+            return next(pids)
+        self._loop._start_runner = start_runner
+        self._patcher = mock.patch('mailman.bin.master.os.kill')
+        self._kill = self._patcher.start()
+        config.push('hash slicing', """
+        [runner.out]
+        slicing: hash
+        """)
+        self._loop.start_runners(['in', 'out'])
+
+    def tearDown(self):
+        config.pop('hash slicing')
+        self._patcher.stop()
+
+    def _rescale(self, configuration):
+        config.push('rescale', configuration)
+        try:
+            self._loop.rescale()
+        finally:
+            config.pop('rescale')
+
+    def test_rescale(self):
+        self.assertEqual(self._started, ['in:0:1', 'out:0:1'])
+        self._rescale("""
+        [runner.out]
+        instances: 3
+        """)
+        # Only the runner whose number of instances changed is stopped.
+        self._kill.assert_called_once_with(1001, signal.SIGTERM)
+        # Its new instances are started once the old ones have exited.
+        self.assertEqual(len(self._started), 2)
+        self._loop._reap(1001, signal.SIGTERM)
+        self.assertEqual(self._started[2:], ['out:0:3', 'out:1:3', 'out:2:3'])
+        # Scale back down.
+        self._rescale("""
+        [runner.out]
+        instances: 1
+        """)
+        self.assertEqual(self._kill.call_count, 4)
+        self._loop._reap(1002, signal.SIGTERM)
+        self._loop._reap(1003, signal.SIGTERM)
+        self.assertEqual(len(self._started), 5)
+        self._loop._reap(1004, signal.SIGTERM)
+        self.assertEqual(self._started[5:], ['out:0:1'])
+
+    def test_range_slicing_needs_power_of_2(self):
+        # Runners with range slicing can't be rescaled to a number of
+        # instances which is not a power of 2.
+        self._rescale("""
+        [runner.in]
+        instances: 3
+        """)
+        self.assertEqual(self._kill.call_count, 0)
+        self.assertEqual(self._loop._rescaling, {})
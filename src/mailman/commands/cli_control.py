@@ -22,6 +22,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 __metaclass__ = type
 __all__ = [
     'Reopen',
+    'Rescale',
     'Restart',
     'Start',
     'Stop',
@@ -209,3 +210,11 @@ class Restart(SignalCommand):
     name = 'restart'
     message = _('Restarting the Mailman runners')
     signal = signal.SIGUSR1
+
+
+class Rescale(SignalCommand):
+    """Match the number of runner instances to the configuration."""
+
+    name = 'rescale'
+    message = _('Rescaling the Mailman runners')
+    signal = signal.SIGUSR2
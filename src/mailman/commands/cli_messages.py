@@ -0,0 +1,79 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The 'packmessages' command."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'PackMessages',
+    ]
+
+
+import os
+
+from zope.component import getUtility
+from zope.interface import implementer
+
+from mailman.core.i18n import _
+from mailman.database.transaction import transaction
+from mailman.interfaces.command import ICLISubCommand
+from mailman.interfaces.messages import IMessageStore
+
+
+
+@implementer(ICLISubCommand)
+class PackMessages:
+    """Pack the message store's messages."""
+
+    name = 'packmessages'
+
+    def add(self, parser, command_parser):
+        """See `ICLISubCommand`."""
+        self.parser = parser
+        command_parser.add_argument(
+            '-b', '--batch-size',
+            type=int, default=100,
+            help=_("""\
+            The number of messages to convert in each database transaction.
+            The default is 100."""))
+        command_parser.add_argument(
+            '-q', '--quiet',
+            default=False, action='store_true',
+            help=_('Print no output.'))
+
+    def process(self, args):
+        """See `ICLISubCommand`."""
+        message_store = getUtility(IMessageStore)
+        message_ids = list(message_store.pickled_message_ids)
+        count = 0
+        while count < len(message_ids):
+            batch = message_ids[count:count + args.batch_size]
+            with transaction():
+                paths = [message_store.pack_message(message_id)
+                         for message_id in batch]
+            # The pickle files can only be removed once the messages' new
+            # paths have been committed.
+            for path in paths:
+                os.remove(path)
+            count += len(batch)
+        # Reclaim the space used by deleted messages.
+        removed = len(message_store.remove_empty_packs())
+        if not args.quiet:
+            print(_('Packed $count messages'))
+            print(_('Removed $removed empty pack files'))
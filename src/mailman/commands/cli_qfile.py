@@ -25,12 +25,11 @@ __all__ = [
     ]
 
 
-import cPickle
-
 from pprint import PrettyPrinter
 from zope.interface import implementer
 
 from mailman.core.i18n import _
+from mailman.core.switchboard import read_queue_file
 from mailman.interfaces.command import ICLISubCommand
 from mailman.utilities.interact import interact
 
@@ -71,12 +70,8 @@ class QFile:
         """See `ICLISubCommand`."""
         printer = PrettyPrinter(indent=4)
         assert len(args.qfile) == 1, 'Wrong number of positional arguments'
-        with open(args.qfile[0]) as fp:
-            while True:
-                try:
-                    m.append(cPickle.load(fp))
-                except EOFError:
-                    break
+        with open(args.qfile[0], 'rb') as fp:
+            m.extend(read_queue_file(fp))
         if args.doprint:
             print(_('[----- start pickle -----]'))
             for i, obj in enumerate(m):
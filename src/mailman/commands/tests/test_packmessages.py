@@ -0,0 +1,82 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test `bin/mailman packmessages`."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestPackMessages',
+    ]
+
+
+import os
+import unittest
+
+from zope.component import getUtility
+
+from mailman.commands.cli_messages import PackMessages
+from mailman.config import config
+from mailman.interfaces.messages import IMessageStore
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+
+
+
+class FakeArgs:
+    batch_size = 2
+    quiet = True
+
+
+
+class TestPackMessages(unittest.TestCase):
+    """Test `bin/mailman packmessages`."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._store = getUtility(IMessageStore)
+        self._messages = []
+        self._pickle_files = []
+        for i in range(5):
+            msg = mfs("""\
+From: anne@example.com
+Subject: Message {0}
+Message-ID: <{0}>
+
+Message number {0}.
+""".format(i))
+            hash32 = self._store.add(msg)
+            self._messages.append(msg.as_string())
+            self._pickle_files.append(os.path.join(
+                config.MESSAGES_DIR, hash32[0:2], hash32[2:4], hash32))
+        config.db.commit()
+
+    def test_pack_messages(self):
+        for path in self._pickle_files:
+            self.assertTrue(os.path.exists(path))
+        PackMessages().process(FakeArgs())
+        for path in self._pickle_files:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(list(self._store.pickled_message_ids), [])
+        for i, text in enumerate(self._messages):
+            msg = self._store.get_message_by_id('<{0}>'.format(i))
+            self.assertEqual(msg.as_string(), text)
+        # There's nothing left to do the second time around.
+        PackMessages().process(FakeArgs())
+        self.assertEqual(len(list(self._store.messages)), 5)
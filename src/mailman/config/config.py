@@ -39,6 +39,7 @@ import mailman.templates
 from mailman import version
 from mailman.interfaces.languages import ILanguageManager
 from mailman.interfaces.styles import IStyleManager
+from mailman.interfaces.templates import ITemplateLoader
 from mailman.utilities.filesystem import makedirs
 from mailman.utilities.modules import call_name
 
@@ -70,6 +71,9 @@ class Configuration:
         self.handlers = {}
         self.pipelines = {}
         self.commands = {}
+        # The process-wide pool of outgoing SMTP connections.  This is set by
+        # the outgoing runner for the duration of a delivery.
+        self.smtp_pool = None
 
     def _clear(self):
         """Clear the cached configuration variables."""
@@ -102,6 +106,11 @@ class Configuration:
                 config_file.close()
         self._post_process()
 
+    def reload(self):
+        """Reload the configuration from the schema and config files."""
+        self._clear()
+        self.load(self.filename)
+
     def push(self, config_name, config_string):
         """Push a new configuration onto the stack."""
         self._clear()
@@ -135,6 +144,8 @@ class Configuration:
             self._config.mailman.default_language)
         self.ensure_directories_exist()
         getUtility(IStyleManager).populate()
+        # Templates may now be found somewhere else.
+        getUtility(ITemplateLoader).invalidate()
         # Set the default system language.
         from mailman.core.i18n import _
         _.default = self.mailman.default_language
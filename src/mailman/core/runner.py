@@ -26,6 +26,7 @@ __all__ = [
 
 
 import time
+import errno
 import logging
 import traceback
 
@@ -67,16 +68,26 @@ class Runner:
         substitutions['name'] = name
         self.queue_directory = expand(section.path, substitutions)
         numslices = int(section.instances)
+        rescan_interval = as_timedelta(section.rescan_interval)
+        durability_window = as_timedelta(section.durability_window)
+        steal_after = as_timedelta(section.steal_after).total_seconds()
         self.switchboard = Switchboard(
-            name, self.queue_directory, slice, numslices, True)
+            name, self.queue_directory, slice, numslices, True,
+            rescan_interval.total_seconds(), section.queue_format,
+            section.durability, durability_window.total_seconds(),
+            section.slicing, (steal_after if steal_after > 0 else None))
         self.sleep_time = as_timedelta(section.sleep_time)
         # sleep_time is a timedelta; turn it into a float for time.sleep().
         self.sleep_float = (86400 * self.sleep_time.days +
                             self.sleep_time.seconds +
                             self.sleep_time.microseconds / 1.0e6)
         self.max_restarts = int(section.max_restarts)
+        self.batch_size = int(section.batch_size)
+        self.batch_time = as_timedelta(section.batch_time).total_seconds()
         self.start = as_boolean(section.start)
         self._stop = False
+        # The time at which each periodic job is next due, by job name.
+        self._next_jobs = {}
 
     def __repr__(self):
         return '<{0} at {1:#x}>'.format(self.__class__.__name__, id(self))
@@ -106,21 +117,40 @@ class Runner:
             pass
         finally:
             self._clean_up()
+            self.switchboard.close()
 
     def _one_iteration(self):
         """See `IRunner`."""
         me = self.__class__.__name__
         dlog.debug('[%s] starting oneloop', me)
-        # List all the files in our queue directory.  The switchboard is
+        # The queue files which have been processed in the current database
+        # transaction.  They are only finished once it has been committed.
+        # Queue files are processed in batches of up to `batch_size` files,
+        # or `batch_time` seconds, per transaction.  Each file gets its own
+        # savepoint so that a failure only throws away that file's changes.
+        # Without savepoints, every file is committed on its own.
+        batch = []
+        batch_size = (self.batch_size
+                      if config.db.supports_savepoints
+                      else 1)
+        batch_started = None
+        # Iterate over the files in our queue directory.  The switchboard is
         # guaranteed to hand us the files in FIFO order.
-        files = self.switchboard.files
-        for filebase in files:
+        filecnt = 0
+        for filebase in self.switchboard.next_files():
+            filecnt += 1
             dlog.debug('[%s] processing filebase: %s', me, filebase)
+            if batch_size > 1:
+                config.db.savepoint('runner')
             try:
                 # Ask the switchboard for the message and metadata objects
                 # associated with this queue file.
                 msg, msgdata = self.switchboard.dequeue(filebase)
             except Exception as error:
+                if isinstance(error, OSError) and error.errno == errno.ENOENT:
+                    # Another runner claimed this file first.
+                    dlog.debug('[%s] lost filebase: %s', me, filebase)
+                    continue
                 # This used to just catch email.Errors.MessageParseError, but
                 # other problems can occur in message parsing, e.g.
                 # ValueError, and exceptions can occur in unpickling too.  We
@@ -130,13 +160,12 @@ class Runner:
                 elog.error('Skipping and preserving unparseable message: %s',
                            filebase)
                 self.switchboard.finish(filebase, preserve=True)
-                config.db.abort()
+                self._abort_one(batch_size)
                 continue
             try:
                 dlog.debug('[%s] processing onefile', me)
                 self._process_one_file(msg, msgdata)
-                dlog.debug('[%s] finishing filebase: %s', me, filebase)
-                self.switchboard.finish(filebase)
+                batch.append(filebase)
             except Exception as error:
                 # All runners that implement _dispose() must guarantee that
                 # exceptions are caught and dealt with properly.  Still, there
@@ -153,6 +182,7 @@ class Runner:
                 try:
                     shunt = config.switchboards['shunt']
                     new_filebase = shunt.enqueue(msg, msgdata)
+                    shunt.sync()
                     elog.error('SHUNTING: %s', new_filebase)
                     self.switchboard.finish(filebase)
                 except Exception as error:
@@ -164,18 +194,56 @@ class Runner:
                         'SHUNTING FAILED, preserving original entry: %s',
                         filebase)
                     self.switchboard.finish(filebase, preserve=True)
-                config.db.abort()
+                self._abort_one(batch_size)
+                # Play it safe and fall back to committing each file for the
+                # rest of this pass.
+                batch_size = 1
             # Other work we want to do each time through the loop.
             dlog.debug('[%s] doing periodic', me)
             self._do_periodic()
-            dlog.debug('[%s] committing transaction', me)
-            config.db.commit()
+            if batch_started is None:
+                batch_started = time.time()
+            if (batch_size == 1 or len(batch) >= batch_size or
+                time.time() - batch_started >= self.batch_time):
+                self._commit_batch(batch)
+                batch_started = None
             dlog.debug('[%s] checking short circuit', me)
             if self._short_circuit():
                 dlog.debug('[%s] short circuiting', me)
                 break
-        dlog.debug('[%s] ending oneloop: %s', me, len(files))
-        return len(files)
+        if batch:
+            self._commit_batch(batch)
+        dlog.debug('[%s] ending oneloop: %s', me, filecnt)
+        return filecnt
+
+    def _abort_one(self, batch_size):
+        """Throw away the database changes made by the current queue file."""
+        if batch_size > 1:
+            config.db.abort_to_savepoint('runner')
+        else:
+            config.db.abort()
+
+    def _commit_batch(self, batch):
+        """Commit the current transaction and finish its queue files.
+
+        :param batch: The base names of the queue files which were processed
+            in the current transaction.  This list is emptied.
+        :type batch: list
+        """
+        me = self.__class__.__name__
+        dlog.debug('[%s] committing transaction', me)
+        config.db.commit()
+        # The files enqueued while processing the batch must be durable
+        # before the files they came from are removed.  This includes the
+        # files kept in our own queue, which our switchboard enqueued.
+        switchboards = set(config.switchboards.values())
+        switchboards.add(self.switchboard)
+        for switchboard in switchboards:
+            switchboard.sync()
+        for filebase in batch:
+            dlog.debug('[%s] finishing filebase: %s', me, filebase)
+            self.switchboard.finish(filebase)
+        del batch[:]
 
     def _process_one_file(self, msg, msgdata):
         """See `IRunner`."""
@@ -238,11 +306,57 @@ class Runner:
         """See `IRunner`."""
         pass
 
+    def _run_periodic_job(self, name, interval, job, batch_size):
+        """Run a database job in batched transactions, if it's time to.
+
+        Call this between passes through the queue, when the processed queue
+        files have been committed.  The job is run repeatedly, each batch in
+        its own transaction, until it handles fewer items than it was asked
+        to.  If it fails, it is tried again after the next interval.
+
+        :param name: The name of the job, used to schedule and log it.
+        :type name: str
+        :param interval: How often to run the job.  Zero disables it.
+        :type interval: timedelta
+        :param job: The job, which is called with the maximum number of items
+            to handle, or None for no limit, and returns the number of items
+            it handled.
+        :type job: callable
+        :param batch_size: The maximum number of items to handle in each
+            transaction.  Sizes below 1 mean no limit.
+        :type batch_size: int
+        :return: None if the job was not due, otherwise the number of items
+            handled and the number of seconds it took.
+        :rtype: tuple
+        """
+        seconds = interval.total_seconds()
+        if seconds <= 0 or time.time() < self._next_jobs.get(name, 0):
+            return None
+        limit = (batch_size if batch_size > 0 else None)
+        start = time.time()
+        handled = 0
+        try:
+            while True:
+                count = job(limit)
+                config.db.commit()
+                handled += count
+                if limit is None or count < limit:
+                    break
+        except Exception:
+            # Try again next time around.
+            config.db.abort()
+            elog.exception('%s runner: %s failed', self.name, name)
+        end = time.time()
+        self._next_jobs[name] = end + seconds
+        return handled, end - start
+
     def _snooze(self, filecnt):
         """See `IRunner`."""
         if filecnt or self.sleep_float <= 0:
             return
-        time.sleep(self.sleep_float)
+        # Wake up as soon as something new is queued; sleep_time is only the
+        # polling interval used when the queue directory can't be watched.
+        self.switchboard.wait(self.sleep_float)
 
     def _short_circuit(self):
         """See `IRunner`."""
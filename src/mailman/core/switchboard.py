@@ -15,31 +15,57 @@
 # You should have received a copy of the GNU General Public License along with
 # GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Queuing and dequeuing message/metadata pickle files.
+"""Queuing and dequeuing message/metadata files.
 
 Messages are represented as email.message.Message objects (or an instance ofa
 subclass).  Metadata is represented as a Python dictionary.  For every
-message/metadata pair in a queue, a single file containing two pickles is
-written.  First, the message is written to the pickle, then the metadata
-dictionary is written.
+message/metadata pair in a queue, a single file is written, in one of two
+formats.
+
+In the `pickle` format, the file contains two pickles.  First, the message is
+written to the pickle, then the metadata dictionary is written.
+
+In the `binary` format, the file starts with a small fixed size header giving
+the format version and the size of the metadata block.  The header is
+followed by the pickled metadata dictionary, and then by the raw RFC 822 text
+of the message.  The metadata can be read without reading or parsing the
+message.
+
+Both formats can always be read, whichever format the queue is configured to
+write.
+
+A message which is enqueued to several queues can be wrapped in a
+`SharedPayload`, so that its text is only flattened and written once.  Each
+of its queue files is written in the binary format, without the text of the
+message, and the text is hard linked next to it in a .msg file.
 """
 
 from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'QueueIndex',
+    'SharedPayload',
     'Switchboard',
+    'hash_slice',
+    'read_queue_file',
     ]
 
 
 import os
 import time
 import email
+import errno
+import heapq
 import pickle
+import select
+import struct
 import cPickle
 import hashlib
 import logging
+import threading
 
+from lazr.config import as_timedelta
 from zope.interface import implementer
 
 from mailman.config import config
@@ -58,9 +84,363 @@ DELTA = .0001
 # In order to prevent loops and a message flood, when the count reaches this
 # value, we move the file to the bad queue as a .psv.
 MAX_BAK_COUNT = 3
+# The header of binary format queue files: the magic bytes, the format
+# version, and the size of the pickled metadata which follows it.
+MAGIC = b'MMQF'
+FORMAT_VERSION = 1
+HEADER = struct.Struct(b'!4sBI')
+QUEUE_FORMATS = ('pickle', 'binary')
+# How queue files are made durable.  With 'strict', every file is fsynced
+# before it is renamed into place.  With 'group', files are renamed into place
+# immediately, and fsynced along with the queue directory at most a window of
+# time later, or whenever the switchboard is explicitly synced.  With 'none',
+# files are never fsynced.
+DURABILITY_POLICIES = ('strict', 'group', 'none')
+# How the queue files are split between slices.  With 'range', each slice
+# owns an equal range of the SHA hex digests, which requires the number of
+# slices to be a power of 2.  With 'hash', each slice owns the files for
+# which it has the highest rendezvous hash score.  Any number of slices is
+# possible, and changing the number of slices only moves the files which
+# belong to the added or removed slices.
+SLICING_MODES = ('range', 'hash')
 
 elog = logging.getLogger('mailman.error')
 
+# pyinotify is optional.  Without it, queue indexes notice the files written
+# by other processes only when they rescan the queue directory.
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+
+class QueueIndex:
+    """An incremental FIFO index of the .pck files in a queue directory.
+
+    Scanning a large queue directory and sorting its entries is expensive, so
+    rather than doing that on every pass through the queue, the index keeps
+    a heap of the entries ordered by their received time.  Files written by
+    the owning switchboard are added directly, files written by other
+    processes are noticed through inotify when pyinotify is available, and
+    the queue directory is fully rescanned every `rescan_interval` seconds as
+    a fallback.  Without inotify, the directory is also rescanned whenever
+    the index runs dry.  The inotify watch also lets runners block until new
+    files arrive, instead of polling the queue directory.
+    """
+
+    def __init__(self, queue_directory, accept=None, rescan_interval=60):
+        """Create a queue index.
+
+        :param queue_directory: The queue directory to index.
+        :type queue_directory: str
+        :param accept: An optional predicate which is passed the SHA hex
+            digest of each file name.  Only files for which it returns True
+            are indexed.
+        :type accept: callable
+        :param rescan_interval: The number of seconds between full rescans of
+            the queue directory.
+        :type rescan_interval: float
+        """
+        self.queue_directory = queue_directory
+        self.rescan_interval = rescan_interval
+        self._accept = accept
+        self._heap = []
+        self._filebases = set()
+        self._last_scan = None
+        self._notifier = None
+        self._fd = None
+        # Only start watching the queue directory when the index is first
+        # used, since every watch uses up an inotify instance.
+        self._watching = (pyinotify is not None)
+
+    def __len__(self):
+        return len(self._filebases)
+
+    def add(self, filebase):
+        """Add a queue file to the index.
+
+        Files outside this index's slice, and files which are already
+        indexed, are ignored.
+
+        :param filebase: The base name of the queue file.
+        :type filebase: str
+        """
+        if filebase in self._filebases:
+            return
+        when, plus, digest = filebase.partition('+')
+        if self._accept is not None and not self._accept(digest):
+            return
+        self._filebases.add(filebase)
+        heapq.heappush(self._heap, (float(when), filebase))
+
+    def pop(self):
+        """Remove and return the oldest indexed queue file.
+
+        Files which have disappeared from the queue directory since they were
+        indexed are skipped.
+
+        :return: The base name of the oldest queue file, or None if the index
+            is empty.
+        :rtype: str or None
+        """
+        while self._heap:
+            when, filebase = heapq.heappop(self._heap)
+            self._filebases.discard(filebase)
+            path = os.path.join(self.queue_directory, filebase + '.pck')
+            if os.path.exists(path):
+                return filebase
+        return None
+
+    def rescan(self):
+        """Rebuild the index from the contents of the queue directory."""
+        self._heap = []
+        self._filebases = set()
+        for filename in os.listdir(self.queue_directory):
+            # By ignoring anything that doesn't end in .pck, we ignore
+            # tempfiles and avoid a race condition.
+            filebase, extension = os.path.splitext(filename)
+            if extension == '.pck':
+                self.add(filebase)
+        self._last_scan = time.time()
+
+    def _watch(self):
+        self._watching = False
+        try:
+            watch_manager = pyinotify.WatchManager()
+        except OSError as error:
+            elog.error('Cannot watch queue directory %s: %s',
+                       self.queue_directory, error)
+            return
+        try:
+            # Queue files are always renamed into place.
+            watch_manager.add_watch(
+                self.queue_directory, pyinotify.IN_MOVED_TO, quiet=False)
+        except pyinotify.WatchManagerError as error:
+            elog.error('Cannot watch queue directory %s: %s',
+                       self.queue_directory, error)
+            watch_manager.close()
+            return
+        self._notifier = pyinotify.Notifier(
+            watch_manager, self._process_event, timeout=0)
+        self._fd = watch_manager.get_fd()
+        # Files written before the watch was added must be picked up.
+        self._last_scan = None
+
+    def refresh(self):
+        """Bring the index up to date with the queue directory."""
+        if self._watching:
+            self._watch()
+        self._read_events()
+        if (self._last_scan is None
+            or (self._notifier is None and len(self) == 0)
+            or time.time() - self._last_scan >= self.rescan_interval):
+            self.rescan()
+
+    def wait(self, timeout):
+        """Wait for new files to arrive in the queue directory.
+
+        This returns as soon as the index has files to hand out, or a new file
+        in this index's slice is renamed into the queue directory, or
+        `timeout` seconds have passed, or a signal is received.  The files of
+        other slices, and the backup files renamed by other runners, don't
+        cut the wait short.  Without inotify, this simply sleeps
+        for `timeout` seconds.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: float
+        """
+        if self._watching:
+            self._watch()
+        # Consume the events which are already pending, such as those for the
+        # files we renamed to .bak ourselves.
+        self._read_events()
+        if len(self) > 0:
+            return
+        if self._notifier is None:
+            time.sleep(timeout)
+            return
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            # pyinotify's own Notifier.check_events() retries when it is
+            # interrupted, which would hold up a runner being told to stop.
+            try:
+                readable = select.select([self._fd], [], [], remaining)[0]
+            except select.error as error:
+                if error.args[0] != errno.EINTR:
+                    raise
+                return
+            if not readable:
+                return
+            self._read_events()
+            if len(self) > 0 or self._last_scan is None:
+                return
+
+    def close(self):
+        """Stop watching the queue directory."""
+        if self._notifier is not None:
+            self._notifier.stop()
+            self._notifier = None
+            self._fd = None
+
+    def _read_events(self):
+        if self._notifier is not None:
+            while self._notifier.check_events():
+                self._notifier.read_events()
+                self._notifier.process_events()
+
+    def _process_event(self, event):
+        if event.mask & pyinotify.IN_Q_OVERFLOW:
+            # Some events were lost, so force a rescan.
+            self._last_scan = None
+            return
+        filebase, extension = os.path.splitext(event.name)
+        if extension == '.pck':
+            self.add(filebase)
+
+
+
+def hash_slice(digest, numslices):
+    """Return the slice which owns a queue file, with 'hash' slicing.
+
+    :param digest: The SHA hex digest part of the queue file's name.
+    :type digest: str
+    :param numslices: The total number of slices.
+    :type numslices: int
+    :return: The slice number, in [0..`numslices`).
+    :rtype: int
+    """
+    scores = [(hashlib.sha1(b'{0}:{1}'.format(digest, i)).digest(), i)
+              for i in range(numslices)]
+    return max(scores)[1]
+
+
+
+def _read_header(fp):
+    """Read the header of a binary format queue file.
+
+    :param fp: The queue file, positioned at its start.
+    :return: The size of the metadata block, or None if this is a pickle
+        format queue file.  In that case, the file is left at its start.
+    :rtype: int or None
+    :raises ValueError: If the file has an unknown format version.
+    """
+    header = fp.read(HEADER.size)
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        fp.seek(0)
+        return None
+    magic, version, size = HEADER.unpack(header)
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            'Unknown queue file format version: {0}'.format(version))
+    return size
+
+
+
+def _write_binary(fp, msgsave, data):
+    """Write a binary format queue file.
+
+    :param fp: The queue file, positioned at its start.
+    :param msgsave: The RFC 822 text of the message.
+    :type msgsave: str
+    :param data: The metadata.
+    :type data: dict
+    """
+    metadata = cPickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    fp.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(metadata)))
+    fp.write(metadata)
+    fp.write(msgsave)
+
+
+
+def read_queue_file(fp, metadata_only=False, msgfile=None):
+    """Read the message and metadata from a queue file of either format.
+
+    :param fp: The queue file, positioned at its start.
+    :param metadata_only: If True, the message is not returned.  For binary
+        format queue files, it is not even read.
+    :type metadata_only: bool
+    :param msgfile: The path of the file holding a shared payload.  By
+        default, this is the .msg file next to the queue file, with the same
+        base name.
+    :type msgfile: str
+    :return: The message and the metadata.  The message is either a message
+        object or its text, in which case the metadata's `_parsemsg` key is
+        True.  With `metadata_only`, the message is None.
+    :rtype: 2-tuple of (message, dict)
+    """
+    size = _read_header(fp)
+    if size is None:
+        msg = cPickle.load(fp)
+        data = cPickle.load(fp)
+        return (None if metadata_only else msg), data
+    data = cPickle.loads(fp.read(size))
+    if metadata_only:
+        return None, data
+    if data.get('_shared'):
+        # The text of the message is in a .msg file next to the queue file.
+        if msgfile is None:
+            msgfile = os.path.splitext(fp.name)[0] + '.msg'
+        with open(msgfile, 'rb') as msgfp:
+            return msgfp.read(), data
+    return fp.read(), data
+
+
+
+class SharedPayload:
+    """The text of a message which is enqueued to several queues.
+
+    Pass this to `Switchboard.enqueue()` in place of the message.  The message
+    is flattened, hashed and written to disk only once, and every queue file
+    it is enqueued to gets a hard link to the text.  The file system counts
+    the links, so the text is garbage collected when the last of the queue
+    files is finished.
+    """
+
+    def __init__(self, msg):
+        """Create a shared payload.
+
+        :param msg: The message, which must not be changed while it is being
+            enqueued.
+        :type msg: `Message`
+        """
+        # Flatten the message like the binary format does.
+        self.text = msg.as_string(unixfrom=(msg.get_unixfrom() is not None))
+        self.digest = hashlib.sha1(self.text).hexdigest()
+        # The last .msg file written or linked for this payload.
+        self._path = None
+
+    def store(self, path, fsync=True):
+        """Store the text of the message in a .msg file.
+
+        :param path: The path of the .msg file.
+        :type path: str
+        :param fsync: Whether the text must be synced to disk if it is
+            written out rather than linked.
+        :type fsync: bool
+        """
+        if self._path is not None:
+            try:
+                os.link(self._path, path)
+            except OSError:
+                # The earlier queue file may already have been finished, or
+                # live on another file system.  Write another copy.
+                pass
+            else:
+                self._path = path
+                return
+        tmpfile = path + '.tmp'
+        with open(tmpfile, 'wb') as fp:
+            fp.write(self.text)
+            fp.flush()
+            if fsync:
+                os.fsync(fp.fileno())
+        os.rename(tmpfile, path)
+        self._path = path
+
 
 
 @implementer(ISwitchboard)
@@ -77,10 +457,16 @@ class Switchboard:
             substitutions = config.paths
             substitutions['name'] = name
             path = expand(conf.path, substitutions)
-            config.switchboards[name] = Switchboard(name, path)
+            config.switchboards[name] = Switchboard(
+                name, path, queue_format=conf.queue_format,
+                durability=conf.durability,
+                durability_window=as_timedelta(
+                    conf.durability_window).total_seconds())
 
     def __init__(self, name, queue_directory,
-                 slice=None, numslices=1, recover=False):
+                 slice=None, numslices=1, recover=False, rescan_interval=None,
+                 queue_format='pickle', durability='strict',
+                 durability_window=1.0, slicing='range', steal_after=None):
         """Create a switchboard object.
 
         :param name: The queue name.
@@ -91,25 +477,76 @@ class Switchboard:
             None, it must be [0..`numslices`).
         :type slice: int or None
         :param numslices: The total number of slices to split this queue
-            directory into.  It must be a power of 2.
+            directory into.  With 'range' slicing, it must be a power of 2.
         :type numslices: int
         :param recover: True if backup files should be recovered.
         :type recover: bool
+        :param rescan_interval: If not None, `next_files()` is served from a
+            `QueueIndex` of this switchboard's slice, and this is the number
+            of seconds between full rescans of the queue directory.
+        :type rescan_interval: float or None
+        :param queue_format: The format of the queue files written by
+            `enqueue()`, either 'pickle' or 'binary'.  Queue files of both
+            formats can be read.
+        :type queue_format: str
+        :param durability: How queue files written by `enqueue()` are made
+            durable, either 'strict', 'group', or 'none'.
+        :type durability: str
+        :param durability_window: With 'group' durability, the maximum
+            number of seconds between enqueuing a file and syncing it, as
+            long as files keep being enqueued.
+        :type durability_window: float
+        :param slicing: How the queue files are split between slices, either
+            'range' or 'hash'.
+        :type slicing: str
+        :param steal_after: If not None, `next_files()` also returns the
+            files of other slices which have been queued for at least this
+            many seconds, whenever this switchboard's own slice is empty.
+        :type steal_after: float or None
         """
-        assert (numslices & (numslices - 1)) == 0, (
+        assert slicing in SLICING_MODES, (
+            'Unknown slicing mode: {0}'.format(slicing))
+        assert slicing == 'hash' or (numslices & (numslices - 1)) == 0, (
             'Not a power of 2: {0}'.format(numslices))
+        assert queue_format in QUEUE_FORMATS, (
+            'Unknown queue format: {0}'.format(queue_format))
         self.name = name
         self.queue_directory = queue_directory
+        self.queue_format = queue_format
+        assert durability in DURABILITY_POLICIES, (
+            'Unknown durability policy: {0}'.format(durability))
+        self.durability = durability
+        self.durability_window = durability_window
+        # With group durability, the files which have not yet been synced,
+        # and when the oldest of them was enqueued.  Threads enqueuing to the
+        # same switchboard share the syncs; the lock makes sure that a file
+        # isn't forgotten while another thread is syncing.
+        self._unsynced = []
+        self._unsynced_since = None
+        self._sync_lock = threading.Lock()
         # If configured to, create the directory if it doesn't yet exist.
         if config.create_paths:
             makedirs(self.queue_directory, 0770)
+        self.steal_after = steal_after
+        # The received time of the oldest file of another slice which was not
+        # yet overdue at the last stealing scan, or the time of that scan.
+        self._steal_scan_due = None
+        # The backup file names of the stolen files we have dequeued.
+        self._claims = {}
         # Fast track for no slices
+        self._slice = None
+        self._numslices = numslices
         self._lower = None
         self._upper = None
         # BAW: test performance and end-cases of this algorithm
         if numslices <> 1:
-            self._lower = ((shamax + 1) * slice) / numslices
-            self._upper = (((shamax + 1) * (slice + 1)) / numslices) - 1
+            self._slice = slice
+            if slicing == 'range':
+                self._lower = ((shamax + 1) * slice) / numslices
+                self._upper = (((shamax + 1) * (slice + 1)) / numslices) - 1
+        self._index = (None if rescan_interval is None
+                       else QueueIndex(self.queue_directory, self._in_slice,
+                                       rescan_interval))
         if recover:
             self.recover_backup_files()
 
@@ -125,15 +562,32 @@ class Switchboard:
         listname = data.get('listname', '--nolist--')
         # Get some data for the input to the sha hash.
         now = time.time()
-        if data.get('_plaintext'):
-            protocol = 0
-            msgsave = cPickle.dumps(str(_msg), protocol)
+        shared = isinstance(_msg, SharedPayload)
+        binary = (shared or self.queue_format == 'binary')
+        if shared:
+            # The text of the message goes in a .msg file of its own.
+            plaintext = False
+            msgsave = b''
+        elif binary:
+            # The message is always stored as text, which is parsed again by
+            # dequeue().  Message objects keep their envelope sender, but
+            # unlike str(), flattening doesn't make one up.
+            plaintext = bool(data.get('_plaintext'))
+            if plaintext:
+                msgsave = str(_msg)
+            else:
+                msgsave = _msg.as_string(
+                    unixfrom=(_msg.get_unixfrom() is not None))
+        elif data.get('_plaintext'):
+            plaintext = True
+            msgsave = cPickle.dumps(str(_msg), 0)
         else:
-            protocol = pickle.HIGHEST_PROTOCOL
-            msgsave = cPickle.dumps(_msg, protocol)
+            plaintext = False
+            msgsave = cPickle.dumps(_msg, pickle.HIGHEST_PROTOCOL)
         # listname is unicode but the input to the hash function must be an
         # 8-bit string (eventually, a bytes object).
-        hashfood = msgsave + listname.encode('utf-8') + repr(now)
+        hashfood = ((_msg.digest if shared else msgsave) +
+                    listname.encode('utf-8') + repr(now))
         # Encode the current time into the file name for FIFO sorting.  The
         # file name consists of two parts separated by a '+': the received
         # time for this message (i.e. when it first showed up on this system)
@@ -148,31 +602,62 @@ class Switchboard:
         for k in data.keys():
             if k.startswith('_'):
                 del data[k]
-        # We have to tell the dequeue() method whether to parse the message
-        # object or not.
-        data['_parsemsg'] = (protocol == 0)
-        # Write to the pickle file the message object and metadata.
-        with open(tmpfile, 'w') as fp:
-            fp.write(msgsave)
-            cPickle.dump(data, fp, protocol)
+        # We have to tell the dequeue() method whether the message is plain
+        # text or not.
+        data['_parsemsg'] = plaintext
+        if shared:
+            # The .msg file must be in place before the queue file is.
+            data['_shared'] = True
+            _msg.store(os.path.join(self.queue_directory, filebase + '.msg'),
+                       fsync=(self.durability == 'strict'))
+        # Write the message object and metadata to the queue file.
+        with open(tmpfile, 'wb') as fp:
+            if binary:
+                _write_binary(fp, msgsave, data)
+            else:
+                fp.write(msgsave)
+                cPickle.dump(
+                    data, fp, 0 if plaintext else pickle.HIGHEST_PROTOCOL)
             fp.flush()
-            os.fsync(fp.fileno())
+            if self.durability == 'strict':
+                os.fsync(fp.fileno())
         os.rename(tmpfile, filename)
+        if self.durability == 'group':
+            with self._sync_lock:
+                self._unsynced.append(filebase)
+                if self._unsynced_since is None:
+                    self._unsynced_since = now
+                overdue = (time.time() - self._unsynced_since >=
+                           self.durability_window)
+            if overdue:
+                self.sync()
+        if self._index is not None:
+            self._index.add(filebase)
         return filebase
 
     def dequeue(self, filebase):
         """See `ISwitchboard`."""
         # Calculate the filename from the given filebase.
         filename = os.path.join(self.queue_directory, filebase + '.pck')
-        backfile = os.path.join(self.queue_directory, filebase + '.bak')
-        # Read the message object and metadata.
-        with open(filename) as fp:
-            # Move the file to the backup file name for processing.  If this
-            # process crashes uncleanly the .bak file will be used to
-            # re-instate the .pck file in order to try again.
-            os.rename(filename, backfile)
-            msg = cPickle.load(fp)
-            data = cPickle.load(fp)
+        # A file stolen from another slice is backed up under our own slice
+        # number, so that only we recover it if we crash, and its owner
+        # leaves it alone while we process it.
+        backup = filebase
+        if not self._in_slice(filebase.partition('+')[2]):
+            backup = '{0}+{1}'.format(filebase, self._slice)
+        backfile = os.path.join(self.queue_directory, backup + '.bak')
+        # Move the file to the backup file name for processing.  If this
+        # process crashes uncleanly the .bak file will be used to re-instate
+        # the .pck file in order to try again.  This also claims the file, so
+        # that no other process can dequeue it.
+        os.rename(filename, backfile)
+        if backup != filebase:
+            self._claims[filebase] = backup
+        # Read the message object and metadata.  A shared payload is always
+        # named after the original file, not its backup.
+        msgfile = os.path.join(self.queue_directory, filebase + '.msg')
+        with open(backfile, 'rb') as fp:
+            msg, data = read_queue_file(fp, msgfile=msgfile)
         if data.get('_parsemsg'):
             # Calculate the original size of the text now so that we won't
             # have to generate the message later when we do size restriction
@@ -181,18 +666,46 @@ class Switchboard:
             msg = email.message_from_string(msg, Message)
             msg.original_size = original_size
             data['original_size'] = original_size
+        elif isinstance(msg, basestring):
+            # A message object which was flattened into a binary format
+            # queue file.
+            msg = email.message_from_string(msg, Message)
+            if 'original_size' in data:
+                msg.original_size = data['original_size']
         return msg, data
 
+    def get_metadata(self, filebase):
+        """See `ISwitchboard`."""
+        filename = os.path.join(self.queue_directory, filebase + '.pck')
+        with open(filename, 'rb') as fp:
+            msg, data = read_queue_file(fp, metadata_only=True)
+        return data
+
     def finish(self, filebase, preserve=False):
         """See `ISwitchboard`."""
-        bakfile = os.path.join(self.queue_directory, filebase + '.bak')
+        self._finish(filebase, self._claims.pop(filebase, filebase), preserve)
+
+    def _finish(self, filebase, backup, preserve):
+        """Finish the queue file, given the base name of its backup file."""
+        bakfile = os.path.join(self.queue_directory, backup + '.bak')
+        msgfile = os.path.join(self.queue_directory, filebase + '.msg')
         try:
             if preserve:
                 bad_dir = config.switchboards['bad'].queue_directory
                 psvfile = os.path.join(bad_dir, filebase + '.psv')
                 os.rename(bakfile, psvfile)
+                if os.path.exists(msgfile):
+                    os.rename(msgfile,
+                              os.path.join(bad_dir, filebase + '.msg'))
             else:
                 os.unlink(bakfile)
+                # A shared payload is garbage collected once the last queue
+                # file linking to it is finished.
+                try:
+                    os.unlink(msgfile)
+                except OSError as error:
+                    if error.errno != errno.ENOENT:
+                        raise
         except EnvironmentError:
             elog.exception(
                 'Failed to unlink/preserve backup file: %s', bakfile)
@@ -202,11 +715,41 @@ class Switchboard:
         """See `ISwitchboard`."""
         return self.get_files()
 
-    def get_files(self, extension='.pck'):
-        """See `ISwitchboard`."""
+    def _in_slice(self, digest):
+        """Is the queue file with this SHA hex digest in our slice?"""
+        # BAW: test performance and end-cases of this algorithm.  MAS: both
+        # comparisons need to be <= to get complete range.
+        if self._slice is None:
+            return True
+        if self._lower is None:
+            return hash_slice(digest, self._numslices) == self._slice
+        return self._lower <= long(digest, 16) <= self._upper
+
+    def _owns(self, digest):
+        """Is the queue file with this file name digest ours to process?
+
+        The backup files of stolen queue files carry the stealer's slice
+        number after the SHA hex digest.  They belong to the stealer, unless
+        the queue has since been split into fewer slices.
+        """
+        digest, plus, owner = digest.partition('+')
+        if owner and self._slice is not None and int(owner) < self._numslices:
+            return int(owner) == self._slice
+        return self._in_slice(digest)
+
+    def _get_files(self, extension, accept):
+        """Return the matching files in the queue directory, in FIFO order.
+
+        :param extension: The file extension to match.
+        :type extension: str
+        :param accept: A predicate which is passed the received time and the
+            rest of each file name, i.e. the SHA hex digest and, for the
+            backups of stolen files, the stealer's slice number.
+        :type accept: callable
+        :return: The base names of the matching files.
+        :rtype: list
+        """
         times = {}
-        lower = self._lower
-        upper = self._upper
         for f in os.listdir(self.queue_directory):
             # By ignoring anything that doesn't end in .pck, we ignore
             # tempfiles and avoid a race condition.
@@ -214,53 +757,167 @@ class Switchboard:
             if ext <> extension:
                 continue
             when, digest = filebase.split('+', 1)
-            # Throw out any files which don't match our bitrange.  BAW: test
-            # performance and end-cases of this algorithm.  MAS: both
-            # comparisons need to be <= to get complete range.
-            if lower is None or (lower <= long(digest, 16) <= upper):
-                key = float(when)
+            key = float(when)
+            if accept(key, digest):
                 while key in times:
                     key += DELTA
                 times[key] = filebase
         # FIFO sort
         return [times[key] for key in sorted(times)]
 
+    def get_files(self, extension='.pck'):
+        """See `ISwitchboard`."""
+        # Throw out any files which don't match our slice.
+        return self._get_files(
+            extension, lambda when, digest: self._owns(digest))
+
+    def _get_overdue_files(self):
+        """Return the other slices' files which are waiting too long.
+
+        Scanning the queue directory is only worth it once a file of another
+        slice can have become overdue: either the oldest one which was still
+        waiting at the last scan, or one queued since.
+        """
+        now = time.time()
+        cutoff = now - self.steal_after
+        if self._steal_scan_due is not None and cutoff < self._steal_scan_due:
+            return []
+        waiting = []
+        def accept(when, digest):
+            if self._in_slice(digest):
+                return False
+            if when <= cutoff:
+                return True
+            waiting.append(when)
+            return False
+        overdue = self._get_files('.pck', accept)
+        self._steal_scan_due = min(waiting + [now])
+        return overdue
+
+    def next_files(self):
+        """See `ISwitchboard`."""
+        if self._index is None:
+            filebases = self.get_files()
+        else:
+            self._index.refresh()
+            # Only hand out the files which were queued when we started, so
+            # that files re-queued while we iterate are left for the next
+            # pass.
+            filebases = (self._index.pop() for i in range(len(self._index)))
+        count = 0
+        for filebase in filebases:
+            if filebase is None:
+                break
+            count += 1
+            yield filebase
+        # When our own slice is empty, help out with the other slices.
+        if count == 0 and self.steal_after is not None:
+            for filebase in self._get_overdue_files():
+                yield filebase
+
+    def wait(self, timeout):
+        """See `ISwitchboard`."""
+        if self._index is None:
+            time.sleep(timeout)
+        else:
+            self._index.wait(timeout)
+
+    def sync(self):
+        """See `ISwitchboard`."""
+        with self._sync_lock:
+            self._sync()
+
+    def _sync(self):
+        if len(self._unsynced) == 0:
+            return
+        for filebase in self._unsynced:
+            # The file may have been dequeued, or even finished, since it was
+            # enqueued.  Finished files no longer need syncing.
+            self._fsync_file(filebase, '.pck', '.bak')
+            # Shared payloads are synced through any of their links.
+            self._fsync_file(filebase, '.msg')
+        # Make the renames durable too.
+        fd = os.open(self.queue_directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        del self._unsynced[:]
+        self._unsynced_since = None
+
+    def _fsync_file(self, filebase, *extensions):
+        """Sync the first of the queue file's variants which exists."""
+        for extension in extensions:
+            path = os.path.join(self.queue_directory, filebase + extension)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            return
+
+    def close(self):
+        """See `ISwitchboard`."""
+        self.sync()
+        if self._index is not None:
+            self._index.close()
+
     def recover_backup_files(self):
         """See `ISwitchboard`."""
-        # Move all .bak files in our slice to .pck.  It's impossible for both
+        # Move all .bak files we own to .pck.  It's impossible for both
         # to exist at the same time, so the move is enough to ensure that our
         # normal dequeuing process will handle them.  We keep count in
         # _bak_count in the metadata of the number of times we recover this
         # file.  When the count reaches MAX_BAK_COUNT, we move the .bak file
         # to a .psv file in the bad queue.
-        for filebase in self.get_files('.bak'):
-            src = os.path.join(self.queue_directory, filebase + '.bak')
+        for backup in self.get_files('.bak'):
+            # The backups of stolen files go back under their original name.
+            filebase = '+'.join(backup.split('+')[:2])
+            src = os.path.join(self.queue_directory, backup + '.bak')
             dst = os.path.join(self.queue_directory, filebase + '.pck')
             with open(src, 'rb+') as fp:
                 try:
-                    msg = cPickle.load(fp)
-                    data_pos = fp.tell()
-                    data = cPickle.load(fp)
+                    binary = (_read_header(fp) is not None)
+                    fp.seek(0)
+                    if binary:
+                        msg, data = read_queue_file(fp, metadata_only=True)
+                        # A shared payload stays in its own file.
+                        msg = (b'' if data.get('_shared') else fp.read())
+                    else:
+                        msg = cPickle.load(fp)
+                        data_pos = fp.tell()
+                        data = cPickle.load(fp)
                 except Exception as error:
                     # If unpickling throws any exception, just log and
                     # preserve this entry
                     elog.error('Unpickling .bak exception: %s\n'
                                'Preserving file: %s', error, filebase)
-                    self.finish(filebase, preserve=True)
+                    self._finish(filebase, backup, preserve=True)
                 else:
                     data['_bak_count'] = data.get('_bak_count', 0) + 1
-                    fp.seek(data_pos)
-                    if data.get('_parsemsg'):
-                        protocol = 0
+                    if binary:
+                        # The metadata block changes size, so the whole file
+                        # is rewritten.
+                        fp.seek(0)
+                        _write_binary(fp, msg, data)
                     else:
-                        protocol = 1
-                    cPickle.dump(data, fp, protocol)
+                        fp.seek(data_pos)
+                        if data.get('_parsemsg'):
+                            protocol = 0
+                        else:
+                            protocol = 1
+                        cPickle.dump(data, fp, protocol)
                     fp.truncate()
                     fp.flush()
                     os.fsync(fp.fileno())
                     if data['_bak_count'] >= MAX_BAK_COUNT:
                         elog.error('.bak file max count, preserving file: %s',
                                    filebase)
-                        self.finish(filebase, preserve=True)
+                        self._finish(filebase, backup, preserve=True)
                     else:
                         os.rename(src, dst)
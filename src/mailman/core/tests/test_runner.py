@@ -0,0 +1,270 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the runner base class."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestBatchedTransactions',
+    'TestSavepoints',
+    ]
+
+
+import mock
+import unittest
+
+from zope.component import getUtility
+
+from mailman.app.lifecycle import create_list
+from mailman.config import config
+from mailman.core.runner import Runner
+from mailman.core.switchboard import Switchboard
+from mailman.interfaces.usermanager import IUserManager
+from mailman.testing.helpers import (
+    get_queue_messages,
+    specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer
+
+
+
+class AddressRunner(Runner):
+    """Register the sender of every message, failing when asked to."""
+
+    def _dispose(self, mlist, msg, msgdata):
+        getUtility(IUserManager).create_address(msg['from'])
+        if msgdata.get('fail', False):
+            raise RuntimeError('Fail')
+        return msgdata.pop('keep', False)
+
+
+
+class TestBatchedTransactions(unittest.TestCase):
+    """Test processing queue files in batched transactions."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        create_list('test@example.com')
+        config.db.commit()
+        config.push('batching', """
+        [runner.in]
+        batch_size: 10
+        batch_time: 1m
+        """)
+        self._runner = AddressRunner('in')
+        self._manager = getUtility(IUserManager)
+
+    def tearDown(self):
+        self._runner.switchboard.close()
+        config.pop('batching')
+
+    def _enqueue(self, *senders, **extra):
+        for sender in senders:
+            msg = mfs("""\
+From: {0}
+To: test@example.com
+
+""".format(sender))
+            msgdata = dict(listname='test@example.com')
+            msgdata.update(extra)
+            self._runner.switchboard.enqueue(msg, msgdata)
+
+    def _iterate(self):
+        # Run one pass over the queue, counting the commits along the way.
+        with mock.patch.object(
+                config.db, 'commit', wraps=config.db.commit) as commit:
+            filecnt = self._runner._one_iteration()
+        return filecnt, commit.call_count
+
+    def test_one_commit_per_batch(self):
+        # All the files in the batch share a single transaction.
+        self._enqueue('anne@example.com', 'bart@example.com',
+                      'cris@example.com')
+        self.assertEqual(self._iterate(), (3, 1))
+        self.assertEqual(self._runner.switchboard.files, [])
+        config.db.abort()
+        for email in ('anne@example.com', 'bart@example.com',
+                      'cris@example.com'):
+            self.assertIsNotNone(self._manager.get_address(email))
+
+    def test_batch_size(self):
+        # No more than batch_size files are processed per transaction.
+        self._runner.batch_size = 2
+        self._enqueue('anne@example.com', 'bart@example.com',
+                      'cris@example.com')
+        self.assertEqual(self._iterate(), (3, 2))
+
+    def test_batch_time(self):
+        # A batch is committed once batch_time has elapsed.
+        self._runner.batch_time = 0
+        self._enqueue('anne@example.com', 'bart@example.com',
+                      'cris@example.com')
+        self.assertEqual(self._iterate(), (3, 3))
+
+    def test_per_file_commits(self):
+        # A batch_size of 1 commits after every file.
+        self._runner.batch_size = 1
+        self._enqueue('anne@example.com', 'bart@example.com',
+                      'cris@example.com')
+        self.assertEqual(self._iterate(), (3, 3))
+
+    def test_no_savepoint_support(self):
+        # Files are committed one at a time when the database can't roll
+        # back to savepoints.
+        self._enqueue('anne@example.com', 'bart@example.com',
+                      'cris@example.com')
+        with mock.patch.object(
+                config.db.__class__, 'supports_savepoints', False):
+            self.assertEqual(self._iterate(), (3, 3))
+
+    def test_failure_discards_only_that_file(self):
+        # When a file fails, only its own changes are thrown away and it gets
+        # shunted.  Files before and after it in the batch are committed.
+        self._enqueue('anne@example.com')
+        self._enqueue('bart@example.com', fail=True)
+        self._enqueue('cris@example.com', 'dave@example.com')
+        filecnt, commits = self._iterate()
+        self.assertEqual(filecnt, 4)
+        # The failure commits the files before it, then the rest of the pass
+        # falls back to committing each file.
+        self.assertEqual(commits, 3)
+        self.assertEqual(self._runner.switchboard.files, [])
+        config.db.abort()
+        self.assertIsNotNone(self._manager.get_address('anne@example.com'))
+        self.assertIsNone(self._manager.get_address('bart@example.com'))
+        self.assertIsNotNone(self._manager.get_address('cris@example.com'))
+        self.assertIsNotNone(self._manager.get_address('dave@example.com'))
+        shunted = get_queue_messages('shunt')
+        self.assertEqual(len(shunted), 1)
+        self.assertEqual(shunted[0].msg['from'], 'bart@example.com')
+
+    def test_files_finished_after_commit(self):
+        # Queue files stay in the queue directory, as backups, until the
+        # transaction they were processed in has been committed.
+        self._enqueue('anne@example.com', 'bart@example.com')
+        backups = []
+        def commit():
+            backups.append(self._runner.switchboard.get_files('.bak'))
+            config.db.store.commit()
+        with mock.patch.object(config.db, 'commit', side_effect=commit):
+            self._runner._one_iteration()
+        self.assertEqual(len(backups), 1)
+        self.assertEqual(len(backups[0]), 2)
+        self.assertEqual(self._runner.switchboard.get_files('.bak'), [])
+
+    def test_file_claimed_by_another_runner(self):
+        # When another runner dequeues a file first, it is just skipped.
+        self._enqueue('anne@example.com')
+        filebase = self._runner.switchboard.files[0]
+        other = Switchboard('in', self._runner.queue_directory)
+        other.dequeue(filebase)
+        with mock.patch.object(self._runner.switchboard, 'next_files',
+                               return_value=[filebase]):
+            self.assertEqual(self._iterate(), (1, 0))
+        self.assertEqual(config.switchboards['bad'].get_files('.psv'), [])
+        self.assertEqual(config.switchboards['shunt'].files, [])
+        other.finish(filebase)
+
+    def test_switchboards_synced_before_finishing(self):
+        # Files enqueued while processing a batch are synced before the files
+        # they came from are removed.
+        self._enqueue('anne@example.com')
+        backups = []
+        def sync():
+            backups.append(self._runner.switchboard.get_files('.bak'))
+        virgin = config.switchboards['virgin']
+        with mock.patch.object(virgin, 'sync', side_effect=sync):
+            self._runner._one_iteration()
+        self.assertEqual(len(backups), 1)
+        self.assertEqual(len(backups[0]), 1)
+
+    def test_kept_files_synced_before_finishing(self):
+        # Files kept in the runner's own queue are re-enqueued by its own
+        # switchboard, which is synced before the original files are removed.
+        self._enqueue('anne@example.com', keep=True)
+        switchboard = self._runner.switchboard
+        original = switchboard.files
+        synced = []
+        def sync():
+            synced.append((switchboard.get_files('.bak'), switchboard.files))
+        with mock.patch.object(switchboard, 'sync', side_effect=sync):
+            self._runner._one_iteration()
+        self.assertEqual(len(synced), 1)
+        backups, files = synced[0]
+        self.assertEqual(backups, original)
+        self.assertEqual(len(files), 1)
+        self.assertEqual(switchboard.get_files('.bak'), [])
+
+
+
+class TestSavepoints(unittest.TestCase):
+    """Test rolling back to database savepoints."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._manager = getUtility(IUserManager)
+
+    def test_supports_savepoints(self):
+        # The Storm internals needed to roll back to a savepoint are there.
+        # If this fails after upgrading Storm, abort_to_savepoint() needs to
+        # be ported to the new version.
+        self.assertTrue(config.db.supports_savepoints)
+
+    def test_abort_to_savepoint(self):
+        # Changes made after the savepoint are thrown away, but changes made
+        # before it are kept.
+        self._manager.create_address('anne@example.com')
+        config.db.savepoint('test')
+        self._manager.create_address('bart@example.com')
+        config.db.abort_to_savepoint('test')
+        self.assertIsNotNone(self._manager.get_address('anne@example.com'))
+        self.assertIsNone(self._manager.get_address('bart@example.com'))
+        config.db.commit()
+        self.assertIsNotNone(self._manager.get_address('anne@example.com'))
+        self.assertIsNone(self._manager.get_address('bart@example.com'))
+
+    def test_abort_to_savepoint_reloads_objects(self):
+        # Objects modified after the savepoint get their old values back.
+        address = self._manager.create_address('anne@example.com')
+        address.display_name = 'Anne'
+        config.db.savepoint('test')
+        address.display_name = 'Anne Person'
+        config.db.abort_to_savepoint('test')
+        self.assertEqual(address.display_name, 'Anne')
+
+    def test_abort_to_unknown_savepoint(self):
+        # Aborting to a savepoint that was not marked in this transaction
+        # aborts the whole transaction.
+        config.db.savepoint('test')
+        config.db.commit()
+        self._manager.create_address('anne@example.com')
+        config.db.abort_to_savepoint('test')
+        self.assertIsNone(self._manager.get_address('anne@example.com'))
+
+    def test_abort_without_savepoint_support(self):
+        # Without savepoint support, the whole transaction is aborted.
+        self._manager.create_address('anne@example.com')
+        config.db.savepoint('test')
+        self._manager.create_address('bart@example.com')
+        with mock.patch.object(
+                config.db.__class__, 'supports_savepoints', False):
+            config.db.abort_to_savepoint('test')
+        self.assertIsNone(self._manager.get_address('anne@example.com'))
+        self.assertIsNone(self._manager.get_address('bart@example.com'))
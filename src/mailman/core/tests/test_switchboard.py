@@ -0,0 +1,729 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the switchboard."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestDurability',
+    'TestQueueFormats',
+    'TestQueueIndex',
+    'TestQueueIndexWithoutInotify',
+    'TestSharedPayload',
+    'TestSlicing',
+    ]
+
+
+import os
+import mock
+import errno
+import time
+import select
+import shutil
+import tempfile
+import unittest
+import threading
+
+from mailman.config import config
+from mailman.core import switchboard
+from mailman.core.switchboard import (
+    SharedPayload, Switchboard, hash_slice, read_queue_file)
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+
+
+
+class TestQueueIndex(unittest.TestCase):
+    """Test the indexed iteration over queue files."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._queue_directory = tempfile.mkdtemp()
+        self._switchboard = Switchboard(
+            'test', self._queue_directory, rescan_interval=3600)
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+
+""")
+
+    def tearDown(self):
+        self._switchboard.close()
+        shutil.rmtree(self._queue_directory)
+
+    def _process(self, switchboard=None):
+        # Process the next files like a runner would.
+        if switchboard is None:
+            switchboard = self._switchboard
+        filebases = []
+        for filebase in switchboard.next_files():
+            switchboard.dequeue(filebase)
+            switchboard.finish(filebase)
+            filebases.append(filebase)
+        return filebases
+
+    def _other(self, **kws):
+        # Another process's switchboard for the same queue directory.
+        return Switchboard('test', self._queue_directory, **kws)
+
+    def test_fifo_order(self):
+        filebases = [self._switchboard.enqueue(self._msg, n=i)
+                     for i in range(5)]
+        self.assertEqual(self._process(), filebases)
+        # The files were handed out.
+        self.assertEqual(self._process(), [])
+
+    def test_requeued_files_wait_for_next_pass(self):
+        # Files queued during an iteration are not returned until the next
+        # one, so a runner re-queuing a message can't loop forever.
+        first = self._switchboard.enqueue(self._msg)
+        seen = []
+        for filebase in self._switchboard.next_files():
+            seen.append(filebase)
+            msg, msgdata = self._switchboard.dequeue(filebase)
+            self._switchboard.finish(filebase)
+            requeued = self._switchboard.enqueue(msg, msgdata)
+        self.assertEqual(seen, [first])
+        self.assertEqual(self._process(), [requeued])
+
+    def test_files_from_other_processes(self):
+        # Files written by other switchboards are picked up.
+        self.assertEqual(self._process(), [])
+        filebase = self._other().enqueue(self._msg)
+        self.assertEqual(self._process(), [filebase])
+
+    def test_vanished_files_are_skipped(self):
+        first = self._switchboard.enqueue(self._msg, n=1)
+        second = self._switchboard.enqueue(self._msg, n=2)
+        os.remove(os.path.join(self._queue_directory, first + '.pck'))
+        self.assertEqual(self._process(), [second])
+
+    def test_slices(self):
+        # Each slice's index only holds the files in its slice.
+        slice_0 = self._other(slice=0, numslices=2, rescan_interval=3600)
+        slice_1 = self._other(slice=1, numslices=2, rescan_interval=3600)
+        filebases = [self._switchboard.enqueue(self._msg, n=i)
+                     for i in range(20)]
+        files_0 = self._process(slice_0)
+        files_1 = self._process(slice_1)
+        slice_0.close()
+        slice_1.close()
+        self.assertEqual(files_0, [filebase for filebase in filebases
+                                   if filebase in files_0])
+        self.assertEqual(sorted(files_0 + files_1), sorted(filebases))
+        self.assertEqual(set(files_0) & set(files_1), set())
+
+    def test_unindexed_switchboard(self):
+        # Without an index, the queue directory is scanned every time.
+        unindexed = self._other()
+        filebases = [unindexed.enqueue(self._msg, n=i) for i in range(3)]
+        self.assertEqual(list(unindexed.next_files()), filebases)
+        self.assertEqual(list(unindexed.next_files()), filebases)
+
+    def test_wait_with_indexed_files(self):
+        # There's no waiting while the index still has files to hand out.
+        self._switchboard.enqueue(self._msg)
+        with mock.patch('mailman.core.switchboard.time.sleep') as sleep:
+            self._switchboard.wait(60)
+        self.assertFalse(sleep.called)
+
+    def test_wait_for_other_processes(self):
+        # Waiting stops as soon as another process queues a file.
+        if switchboard.pyinotify is None:
+            self.skipTest('pyinotify is not available')
+        self.assertEqual(self._process(), [])
+        other = self._other()
+        thread = threading.Thread(
+            target=lambda: (time.sleep(0.1), other.enqueue(self._msg)))
+        start = time.time()
+        thread.start()
+        self._switchboard.wait(60)
+        thread.join()
+        self.assertLess(time.time() - start, 30)
+        self.assertEqual(len(self._process()), 1)
+
+    def test_wait_ignores_own_backup_files(self):
+        # Renaming our own files to .bak doesn't cut the next wait short.
+        if switchboard.pyinotify is None:
+            self.skipTest('pyinotify is not available')
+        self._switchboard.enqueue(self._msg)
+        self._process()
+        start = time.time()
+        self._switchboard.wait(0.5)
+        self.assertGreaterEqual(time.time() - start, 0.4)
+
+    def test_wait_ignores_other_slices(self):
+        # Files of other slices, and other runners renaming their files to
+        # .bak, don't wake up a waiting switchboard.
+        if switchboard.pyinotify is None:
+            self.skipTest('pyinotify is not available')
+        slice_0 = self._other(slice=0, numslices=2, rescan_interval=3600)
+        slice_1 = self._other(slice=1, numslices=2, rescan_interval=3600)
+        self.addCleanup(slice_0.close)
+        self.addCleanup(slice_1.close)
+        self.assertEqual(self._process(slice_0), [])
+        # Files are queued elsewhere first, and only the ones in slice 1 are
+        # moved into the queue directory.
+        elsewhere = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, elsewhere)
+        staging = Switchboard('test', elsewhere)
+        calls = []
+        def fake_select(rlist, wlist, xlist, timeout):
+            calls.append(timeout)
+            if len(calls) > 1:
+                # Time out instead of waiting for real.
+                return [], [], []
+            # While slice 0 is waiting, a slice 1 file is queued and
+            # processed.
+            while True:
+                filebase = staging.enqueue(self._msg)
+                if slice_1._in_slice(filebase.split('+', 1)[1]):
+                    break
+            os.rename(os.path.join(elsewhere, filebase + '.pck'),
+                      os.path.join(self._queue_directory, filebase + '.pck'))
+            self.assertEqual(self._process(slice_1), [filebase])
+            return select.select(rlist, wlist, xlist, 0)
+        with mock.patch('mailman.core.switchboard.select', **{
+                'select.side_effect': fake_select, 'error': select.error}):
+            slice_0.wait(3600)
+        # The events were read, but didn't end the wait before it timed out.
+        self.assertEqual(len(calls), 2)
+
+
+
+class TestQueueIndexWithoutInotify(TestQueueIndex):
+    """Test the queue index's fallback rescanning."""
+
+    def setUp(self):
+        self._patcher = mock.patch.object(switchboard, 'pyinotify', None)
+        self._patcher.start()
+        super(TestQueueIndexWithoutInotify, self).setUp()
+
+    def tearDown(self):
+        super(TestQueueIndexWithoutInotify, self).tearDown()
+        self._patcher.stop()
+
+    def test_no_rescan_while_busy(self):
+        # While the index still holds files, new files written by other
+        # processes are only picked up by the periodic rescan.
+        first = self._switchboard.enqueue(self._msg, n=1)
+        second = self._switchboard.enqueue(self._msg, n=2)
+        files = self._switchboard.next_files()
+        self.assertEqual(next(files), first)
+        files.close()
+        self._switchboard.dequeue(first)
+        self._switchboard.finish(first)
+        third = self._other().enqueue(self._msg, n=3)
+        self.assertEqual(self._process(), [second])
+        self.assertEqual(self._process(), [third])
+
+    def test_wait_sleeps(self):
+        # Without inotify, waiting just sleeps.
+        with mock.patch('mailman.core.switchboard.time.sleep') as sleep:
+            self._switchboard.wait(60)
+        sleep.assert_called_once_with(60)
+
+
+
+
+class TestQueueFormats(unittest.TestCase):
+    """Test the queue file formats."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._queue_directory = tempfile.mkdtemp()
+        self._switchboard = Switchboard(
+            'test', self._queue_directory, queue_format='binary')
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: A test
+
+Testing.
+""")
+        self._msg.set_unixfrom('From anne@example.com')
+
+    def tearDown(self):
+        shutil.rmtree(self._queue_directory)
+
+    def _path(self, filebase, extension='.pck'):
+        return os.path.join(self._queue_directory, filebase + extension)
+
+    def test_binary_format(self):
+        # The header and metadata come before the text of the message.
+        filebase = self._switchboard.enqueue(
+            self._msg, listname='test@example.com')
+        with open(self._path(filebase), 'rb') as fp:
+            contents = fp.read()
+        self.assertTrue(contents.startswith(switchboard.MAGIC))
+        self.assertTrue(contents.endswith(str(self._msg)))
+
+    def test_binary_round_trip(self):
+        # Message objects are flattened, and parsed again when dequeued.
+        filebase = self._switchboard.enqueue(
+            self._msg, listname='test@example.com', _volatile=True)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self._switchboard.finish(filebase)
+        self.assertEqual(str(msg), str(self._msg))
+        self.assertEqual(msg.get_unixfrom(), 'From anne@example.com')
+        self.assertEqual(msg['subject'], 'A test')
+        self.assertEqual(msgdata['listname'], 'test@example.com')
+        self.assertEqual(msgdata['version'], config.QFILE_SCHEMA_VERSION)
+        self.assertFalse(msgdata['_parsemsg'])
+        self.assertFalse('_volatile' in msgdata)
+        self.assertFalse('original_size' in msgdata)
+
+    def test_binary_no_envelope_sender(self):
+        # Flattening doesn't make up an envelope sender.
+        self._msg.set_unixfrom(None)
+        filebase = self._switchboard.enqueue(self._msg)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self._switchboard.finish(filebase)
+        self.assertEqual(msg.get_unixfrom(), None)
+        self.assertEqual(msg.senders, ['anne@example.com'])
+
+    def test_binary_plaintext(self):
+        # Plain text messages get their original size, as with pickles.
+        text = str(self._msg)
+        filebase = self._switchboard.enqueue(text, _plaintext=True)
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self._switchboard.finish(filebase)
+        self.assertEqual(msg['subject'], 'A test')
+        self.assertEqual(msg.original_size, len(text))
+        self.assertEqual(msgdata['original_size'], len(text))
+
+    def test_get_metadata(self):
+        # The metadata can be read without the message, and without removing
+        # the file from the queue.
+        filebase = self._switchboard.enqueue(
+            self._msg, listname='test@example.com')
+        with open(self._path(filebase), 'ab') as fp:
+            fp.write(b'\0 not part of any message')
+        msgdata = self._switchboard.get_metadata(filebase)
+        self.assertEqual(msgdata['listname'], 'test@example.com')
+        self.assertEqual(self._switchboard.files, [filebase])
+
+    def test_get_metadata_pickle(self):
+        pickles = Switchboard('test', self._queue_directory)
+        filebase = pickles.enqueue(self._msg, listname='test@example.com')
+        msgdata = self._switchboard.get_metadata(filebase)
+        self.assertEqual(msgdata['listname'], 'test@example.com')
+
+    def test_read_pickle_files(self):
+        # Switching a queue to the binary format leaves the pickle files
+        # already in it readable, and vice versa.
+        pickles = Switchboard('test', self._queue_directory)
+        first = pickles.enqueue(self._msg, listname='test@example.com')
+        second = self._switchboard.enqueue(
+            self._msg, listname='test@example.com')
+        for reader, filebase in ((self._switchboard, first),
+                                 (pickles, second)):
+            msg, msgdata = reader.dequeue(filebase)
+            reader.finish(filebase)
+            self.assertEqual(msg['subject'], 'A test')
+            self.assertEqual(msgdata['listname'], 'test@example.com')
+
+    def test_recover_binary_backup_files(self):
+        # Backup files in the binary format are recovered, and their backup
+        # count is bumped.
+        filebase = self._switchboard.enqueue(
+            self._msg, listname='test@example.com')
+        self._switchboard.dequeue(filebase)
+        self.assertEqual(self._switchboard.files, [])
+        Switchboard('test', self._queue_directory, recover=True)
+        self.assertEqual(self._switchboard.files, [filebase])
+        msg, msgdata = self._switchboard.dequeue(filebase)
+        self.assertEqual(msgdata['_bak_count'], 1)
+        self.assertEqual(str(msg), str(self._msg))
+        # Eventually, the backup file is preserved in the bad queue.
+        Switchboard('test', self._queue_directory, recover=True)
+        for count in range(2, switchboard.MAX_BAK_COUNT):
+            self._switchboard.dequeue(filebase)
+            Switchboard('test', self._queue_directory, recover=True)
+        self.assertEqual(self._switchboard.files, [])
+        self.assertEqual(self._switchboard.get_files('.bak'), [])
+        bad = config.switchboards['bad']
+        self.assertEqual(bad.get_files('.psv'), [filebase])
+        os.remove(os.path.join(bad.queue_directory, filebase + '.psv'))
+
+    def test_unknown_format_version(self):
+        filebase = self._switchboard.enqueue(self._msg)
+        with open(self._path(filebase), 'rb+') as fp:
+            fp.seek(len(switchboard.MAGIC))
+            fp.write(b'\x63')
+        with open(self._path(filebase), 'rb') as fp:
+            self.assertRaises(ValueError, read_queue_file, fp)
+
+
+
+
+class TestSharedPayload(unittest.TestCase):
+    """Test enqueuing a message to several queues."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._queue_directory = tempfile.mkdtemp()
+        self._switchboards = []
+        for name in ('one', 'two'):
+            path = os.path.join(self._queue_directory, name)
+            os.mkdir(path)
+            self._switchboards.append(Switchboard(name, path))
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: A test
+
+Testing.
+""")
+
+    def tearDown(self):
+        shutil.rmtree(self._queue_directory)
+
+    def _path(self, switchboard, filebase, extension):
+        return os.path.join(switchboard.queue_directory, filebase + extension)
+
+    def _enqueue(self, payload):
+        return [switchboard.enqueue(payload, listname=switchboard.name)
+                for switchboard in self._switchboards]
+
+    def test_text_written_once(self):
+        one, two = self._switchboards
+        filebases = self._enqueue(SharedPayload(self._msg))
+        # The queue files only hold the metadata, and the text is linked
+        # next to each of them.
+        stats = []
+        for switchboard, filebase in zip(self._switchboards, filebases):
+            path = self._path(switchboard, filebase, '.pck')
+            with open(path, 'rb') as fp:
+                self.assertFalse(fp.read().endswith(self._msg.as_string()))
+            stats.append(os.stat(self._path(switchboard, filebase, '.msg')))
+        self.assertEqual(stats[0].st_ino, stats[1].st_ino)
+        self.assertEqual(stats[0].st_nlink, 2)
+        for switchboard, filebase in zip(self._switchboards, filebases):
+            msg, msgdata = switchboard.dequeue(filebase)
+            self.assertEqual(msg.as_string(), self._msg.as_string())
+            self.assertEqual(msgdata['listname'], switchboard.name)
+            self.assertEqual(switchboard.get_files('.bak'), [filebase])
+
+    def test_garbage_collected(self):
+        # The text goes away with the last queue file which shares it.
+        one, two = self._switchboards
+        first, second = self._enqueue(SharedPayload(self._msg))
+        one.dequeue(first)
+        one.finish(first)
+        self.assertFalse(os.path.exists(self._path(one, first, '.msg')))
+        path = self._path(two, second, '.msg')
+        self.assertEqual(os.stat(path).st_nlink, 1)
+        msg, msgdata = two.dequeue(second)
+        two.finish(second)
+        self.assertEqual(msg['subject'], 'A test')
+        self.assertFalse(os.path.exists(path))
+
+    def test_finished_before_linked(self):
+        # When the first queue file is finished before the message is
+        # enqueued again, the text is written out again.
+        one, two = self._switchboards
+        payload = SharedPayload(self._msg)
+        first = one.enqueue(payload)
+        one.dequeue(first)
+        one.finish(first)
+        second = two.enqueue(payload)
+        msg, msgdata = two.dequeue(second)
+        two.finish(second)
+        self.assertEqual(msg.as_string(), self._msg.as_string())
+        self.assertEqual(os.listdir(two.queue_directory), [])
+
+    def test_recover_backup_files(self):
+        one, two = self._switchboards
+        filebase = one.enqueue(SharedPayload(self._msg))
+        one.dequeue(filebase)
+        Switchboard('one', one.queue_directory, recover=True)
+        msg, msgdata = one.dequeue(filebase)
+        self.assertEqual(msgdata['_bak_count'], 1)
+        self.assertEqual(msg.as_string(), self._msg.as_string())
+
+    def test_preserve(self):
+        # The text is preserved in the bad queue along with the metadata.
+        one, two = self._switchboards
+        filebase = one.enqueue(SharedPayload(self._msg))
+        one.dequeue(filebase)
+        one.finish(filebase, preserve=True)
+        bad = config.switchboards['bad']
+        path = os.path.join(bad.queue_directory, filebase + '.psv')
+        try:
+            with open(path, 'rb') as fp:
+                msg, msgdata = read_queue_file(fp)
+            self.assertEqual(msg, self._msg.as_string())
+        finally:
+            os.remove(path)
+            os.remove(os.path.join(bad.queue_directory, filebase + '.msg'))
+
+    def test_strict_durability(self):
+        # The text is only synced once.
+        with mock.patch('mailman.core.switchboard.os.fsync') as fsync:
+            self._enqueue(SharedPayload(self._msg))
+        self.assertEqual(fsync.call_count, 3)
+
+
+
+
+class TestDurability(unittest.TestCase):
+    """Test the durability policies."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._queue_directory = tempfile.mkdtemp()
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+
+""")
+        self._patcher = mock.patch('mailman.core.switchboard.os.fsync')
+        self._fsync = self._patcher.start()
+
+    def tearDown(self):
+        self._patcher.stop()
+        shutil.rmtree(self._queue_directory)
+
+    def _switchboard(self, durability, window=3600):
+        return Switchboard('test', self._queue_directory,
+                           durability=durability, durability_window=window)
+
+    def test_strict(self):
+        # Every file is synced as it is enqueued.
+        switchboard = self._switchboard('strict')
+        for i in range(3):
+            switchboard.enqueue(self._msg)
+        self.assertEqual(self._fsync.call_count, 3)
+        switchboard.sync()
+        self.assertEqual(self._fsync.call_count, 3)
+
+    def test_none(self):
+        switchboard = self._switchboard('none')
+        for i in range(3):
+            switchboard.enqueue(self._msg)
+        switchboard.sync()
+        self.assertEqual(self._fsync.call_count, 0)
+
+    def test_group(self):
+        # Files are only synced, along with the queue directory, when the
+        # switchboard is synced.
+        switchboard = self._switchboard('group')
+        for i in range(3):
+            switchboard.enqueue(self._msg)
+        self.assertEqual(self._fsync.call_count, 0)
+        self.assertEqual(len(switchboard.files), 3)
+        switchboard.sync()
+        self.assertEqual(self._fsync.call_count, 4)
+        # Nothing is left to sync.
+        switchboard.sync()
+        self.assertEqual(self._fsync.call_count, 4)
+
+    def test_group_window(self):
+        # Once the window has passed, the next enqueue syncs everything.
+        switchboard = self._switchboard('group', window=0)
+        switchboard.enqueue(self._msg)
+        self.assertEqual(self._fsync.call_count, 2)
+        switchboard.enqueue(self._msg)
+        self.assertEqual(self._fsync.call_count, 4)
+
+    def test_group_skips_finished_files(self):
+        # Files which are finished before the switchboard is synced are no
+        # longer synced, but dequeued files still are.
+        switchboard = self._switchboard('group')
+        first = switchboard.enqueue(self._msg)
+        second = switchboard.enqueue(self._msg)
+        switchboard.enqueue(self._msg)
+        switchboard.dequeue(first)
+        switchboard.finish(first)
+        switchboard.dequeue(second)
+        switchboard.sync()
+        self.assertEqual(self._fsync.call_count, 3)
+
+    def test_close_syncs(self):
+        switchboard = self._switchboard('group')
+        switchboard.enqueue(self._msg)
+        switchboard.close()
+        self.assertEqual(self._fsync.call_count, 2)
+
+
+
+
+class TestSlicing(unittest.TestCase):
+    """Test splitting a queue between several switchboards."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._queue_directory = tempfile.mkdtemp()
+        self._msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+
+""")
+
+    def tearDown(self):
+        shutil.rmtree(self._queue_directory)
+
+    def _slices(self, count, **kws):
+        return [Switchboard('test', self._queue_directory, slice_number,
+                            count, **kws)
+                for slice_number in range(count)]
+
+    def _digest(self, filebase):
+        return filebase.split('+', 1)[1]
+
+    def test_range_slicing_needs_power_of_2(self):
+        self.assertRaises(AssertionError, self._slices, 3)
+
+    def test_hash_slicing(self):
+        # With hash slicing, any number of slices is possible, and every file
+        # belongs to exactly one of them.
+        switchboards = self._slices(3, slicing='hash')
+        filebases = [switchboards[0].enqueue(self._msg, n=i)
+                     for i in range(30)]
+        owned = [switchboard.files for switchboard in switchboards]
+        self.assertEqual(sorted(sum(owned, [])), sorted(filebases))
+        for number, files in enumerate(owned):
+            # With 30 files, every slice gets some.
+            self.assertNotEqual(files, [])
+            for filebase in files:
+                self.assertEqual(
+                    hash_slice(self._digest(filebase), 3), number)
+
+    def test_hash_slicing_is_consistent(self):
+        # Adding a slice only moves files to the new slice.
+        filebases = [Switchboard('test', self._queue_directory).enqueue(
+            self._msg, n=i) for i in range(50)]
+        moved = 0
+        for filebase in filebases:
+            digest = self._digest(filebase)
+            old, new = hash_slice(digest, 3), hash_slice(digest, 4)
+            if old != new:
+                self.assertEqual(new, 3)
+                moved += 1
+        self.assertTrue(0 < moved < len(filebases))
+
+    def _other_slice_file(self, switchboard, count=2):
+        # Enqueue a file which doesn't belong to the switchboard's slice.
+        while True:
+            filebase = switchboard.enqueue(self._msg)
+            if hash_slice(self._digest(filebase), count) != 0:
+                return filebase
+            os.remove(os.path.join(self._queue_directory, filebase + '.pck'))
+
+    def test_steal_overdue_files(self):
+        # A switchboard with an empty slice takes over the files of other
+        # slices once they are overdue.
+        idle = Switchboard('test', self._queue_directory, 0, 2,
+                           slicing='hash', steal_after=3600)
+        filebase = self._other_slice_file(idle)
+        self.assertEqual(list(idle.next_files()), [])
+        idle.steal_after = 0
+        self.assertEqual(list(idle.next_files()), [filebase])
+
+    def test_no_stealing_while_busy(self):
+        # Nothing is taken from other slices while there is work in the
+        # switchboard's own slice.
+        idle = Switchboard('test', self._queue_directory, 0, 2,
+                           slicing='hash', steal_after=0)
+        self._other_slice_file(idle)
+        while True:
+            own = idle.enqueue(self._msg)
+            if hash_slice(self._digest(own), 2) == 0:
+                break
+            os.remove(os.path.join(self._queue_directory, own + '.pck'))
+        self.assertEqual(list(idle.next_files()), [own])
+
+    def test_dequeue_claimed_file(self):
+        # Only one switchboard can dequeue a file.
+        first, second = self._slices(2, slicing='hash')
+        filebase = first.enqueue(self._msg)
+        first.dequeue(filebase)
+        with self.assertRaises(OSError) as cm:
+            second.dequeue(filebase)
+        self.assertEqual(cm.exception.errno, errno.ENOENT)
+        first.finish(filebase)
+
+    def test_no_rescan_until_overdue(self):
+        # The queue directory isn't scanned for overdue files again before
+        # any of them can be overdue.
+        idle = Switchboard('test', self._queue_directory, 0, 2,
+                           slicing='hash', steal_after=3600)
+        self._other_slice_file(idle)
+        self.assertEqual(list(idle.next_files()), [])
+        with mock.patch('os.listdir') as listdir:
+            listdir.return_value = []
+            self.assertEqual(list(idle.next_files()), [])
+            # Only our own, empty slice was listed.
+            self.assertEqual(listdir.call_count, 1)
+
+    def test_stolen_file_recovered_by_stealer(self):
+        # A stolen file is backed up under the stealer's slice, so that the
+        # stealer recovers it, and its owner leaves it alone.
+        owner, stealer = self._slices(2, slicing='hash')
+        while True:
+            filebase = owner.enqueue(self._msg)
+            if hash_slice(self._digest(filebase), 2) == 0:
+                break
+            os.remove(os.path.join(self._queue_directory, filebase + '.pck'))
+        stealer.steal_after = 0
+        self.assertEqual(list(stealer.next_files()), [filebase])
+        stealer.dequeue(filebase)
+        self.assertEqual(owner.get_files('.bak'), [])
+        self.assertEqual(stealer.get_files('.bak'), [filebase + '+1'])
+        owner.recover_backup_files()
+        self.assertEqual(owner.files, [])
+        stealer.recover_backup_files()
+        self.assertEqual(owner.files, [filebase])
+
+    def test_finish_stolen_file(self):
+        # Finishing a stolen file removes its backup.
+        owner, stealer = self._slices(2, slicing='hash')
+        filebase = self._other_slice_file(stealer)
+        stealer.dequeue(filebase)
+        stealer.finish(filebase)
+        self.assertEqual(os.listdir(self._queue_directory), [])
+
+    def test_steal_shared_payload(self):
+        # The text of a stolen shared payload is read from the file named
+        # after the original queue file, not its backup.
+        owner, stealer = self._slices(2, slicing='hash', steal_after=0)
+        while True:
+            filebase = owner.enqueue(SharedPayload(self._msg))
+            if hash_slice(self._digest(filebase), 2) == 0:
+                break
+            for extension in ('.pck', '.msg'):
+                os.remove(os.path.join(
+                    self._queue_directory, filebase + extension))
+        self.assertEqual(list(stealer.next_files()), [filebase])
+        msg, msgdata = stealer.dequeue(filebase)
+        self.assertEqual(msg.as_string(), self._msg.as_string())
+        # The stolen backup is recovered, and still readable.
+        stealer.recover_backup_files()
+        self.assertEqual(owner.files, [filebase])
+        msg, msgdata = owner.dequeue(filebase)
+        self.assertEqual(msg.as_string(), self._msg.as_string())
+        self.assertEqual(msgdata['_bak_count'], 1)
+        owner.finish(filebase)
+        self.assertEqual(os.listdir(self._queue_directory), [])
@@ -43,6 +43,15 @@ log = logging.getLogger('mailman.config')
 
 NL = '\n'
 
+# Storm knows nothing about savepoints.  Throwing away the changes made since
+# a savepoint uses Storm's private bookkeeping of unflushed changes, which may
+# not be there in other versions of Storm.
+try:
+    from storm.store import PENDING_ADD, PENDING_REMOVE
+except ImportError:
+    PENDING_ADD = PENDING_REMOVE = None
+STORE_INTERNALS = ('_dirty', '_enable_lazy_resolving')
+
 
 
 @implementer(IDatabase)
@@ -59,6 +68,8 @@ class StormBaseDatabase:
     def __init__(self):
         self.url = None
         self.store = None
+        # The savepoints marked in the current transaction.
+        self._savepoints = set()
 
     def initialize(self, debug=None):
         """See `IDatabase`."""
@@ -74,12 +85,50 @@ class StormBaseDatabase:
 
     def commit(self):
         """See `IDatabase`."""
+        self._savepoints.clear()
         self.store.commit()
 
     def abort(self):
         """See `IDatabase`."""
+        self._savepoints.clear()
         self.store.rollback()
 
+    @property
+    def supports_savepoints(self):
+        """See `IDatabase`."""
+        return (PENDING_ADD is not None and
+                all(hasattr(self.store, name) for name in STORE_INTERNALS))
+
+    def savepoint(self, name):
+        """See `IDatabase`."""
+        # Executing a statement flushes all pending changes to the database
+        # first, so they all end up before the savepoint.
+        self.store.execute('SAVEPOINT {0}'.format(name))
+        self._savepoints.add(name)
+
+    def abort_to_savepoint(self, name):
+        """See `IDatabase`."""
+        if name not in self._savepoints or not self.supports_savepoints:
+            self.abort()
+            return
+        # Throw away the changes Storm has not yet flushed the same way
+        # `Store.rollback()` does, and make it reload every object from the
+        # database.
+        store = self.store
+        store.block_implicit_flushes()
+        try:
+            for obj_info in store._dirty:
+                pending = obj_info.pop('pending', None)
+                if pending is PENDING_ADD:
+                    del obj_info['store']
+                elif pending is PENDING_REMOVE:
+                    store._enable_lazy_resolving(obj_info)
+            store._dirty.clear()
+            store.invalidate()
+            store.execute('ROLLBACK TO SAVEPOINT {0}'.format(name))
+        finally:
+            store.unblock_implicit_flushes()
+
     def _database_exists(self):
         """Return True if the database exists and is initialized.
 
@@ -215,6 +264,7 @@ class StormBaseDatabase:
     def _reset(self):
         """See `IDatabase`."""
         from mailman.database.model import ModelMeta
+        self._savepoints.clear()
         self.store.rollback()
         ModelMeta._reset(self.store)
         self.store.commit()
@@ -66,6 +66,8 @@ CREATE TABLE bounceevent (
     processed BOOLEAN,
     PRIMARY KEY (id)
     );
+CREATE INDEX ix_bounceevent_email ON bounceevent (email);
+CREATE INDEX ix_bounceevent_processed ON bounceevent (processed);
 
 CREATE TABLE contentfilter (
     id INTEGER NOT NULL,
@@ -109,6 +111,7 @@ CREATE TABLE mailinglist (
     digest_last_sent_at TIMESTAMP,
     volume INTEGER,
     last_post_at TIMESTAMP,
+    membership_generation INTEGER,
     accept_these_nonmembers BLOB,
     acceptable_aliases_id INTEGER,
     admin_immed_notify BOOLEAN,
@@ -218,6 +221,8 @@ CREATE TABLE member (
     address_id INTEGER,
     preferences_id INTEGER,
     user_id INTEGER,
+    bounce_score INTEGER,
+    last_bounce_received TIMESTAMP,
     PRIMARY KEY (id),
     CONSTRAINT member_address_id_fk
         FOREIGN KEY (address_id) REFERENCES address (id),
@@ -303,8 +308,11 @@ CREATE TABLE version (
     );
 
 CREATE INDEX ix__request_mailing_list_id ON _request (mailing_list_id);
+CREATE INDEX ix_address_email ON address (email);
 CREATE INDEX ix_address_preferences_id ON address (preferences_id);
 CREATE INDEX ix_address_user_id ON address (user_id);
+CREATE INDEX ix_pended_expiration_date ON pended (expiration_date);
+CREATE INDEX ix_pended_token ON pended (token);
 CREATE INDEX ix_pendedkeyvalue_pended_id ON pendedkeyvalue (pended_id);
 CREATE INDEX ix_user_preferences_id ON user (preferences_id);
 
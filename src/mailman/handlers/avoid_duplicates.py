@@ -82,17 +82,20 @@ class AvoidDuplicates:
             # No one was explicitly addressed, so we can't do any dup
             # collapsing
             return
+        # Look up the list copy preferences of all the explicitly addressed
+        # members at once.
+        receive_list_copy = dict(
+            (record.email, record.receive_list_copy)
+            for record in mlist.members.get_delivery_records(
+                explicit_recips.intersection(recips)))
         newrecips = set()
         for r in recips:
             # If this recipient is explicitly addressed...
             if r in explicit_recips:
-                send_duplicate = True
                 # If the member wants to receive duplicates, or if the
                 # recipient is not a member at all, they will get a copy.
                 # header.
-                member = mlist.members.get_member(r)
-                if member and not member.receive_list_copy:
-                    send_duplicate = False
+                send_duplicate = receive_list_copy.get(r, True)
                 # We'll send a duplicate unless the user doesn't wish it.  If
                 # personalization is enabled, the add-dupe-header flag will
                 # add a X-Mailman-Duplicate: yes header for this user's
@@ -29,6 +29,7 @@ import re
 import logging
 
 from email.mime.text import MIMEText
+from string import Template
 from urllib2 import URLError
 from zope.component import getUtility
 from zope.interface import implementer
@@ -40,8 +41,23 @@ from mailman.interfaces.templates import ITemplateLoader
 from mailman.utilities.string import expand
 
 
+EMPTYSTRING = ''
 log = logging.getLogger('mailman.error')
 
+# The substitutions calculated for each member.
+MEMBER_SUBSTITUTIONS = (
+    'user_address',
+    'user_delivered_to',
+    'user_language',
+    'user_name',
+    'user_optionsurl',
+    )
+
+# Parsed decoration templates, keyed by the template text.  The template
+# loader hands out the same text until the template file changes.
+_parsed_templates = {}
+MAX_PARSED_TEMPLATES = 100
+
 
 
 def process(mlist, msg, msgdata):
@@ -54,13 +70,7 @@ def process(mlist, msg, msgdata):
     if member is not None:
         # Calculate the extra personalization dictionary.
         recipient = msgdata.get('recipient', member.address.original_email)
-        d['user_address'] = recipient
-        d['user_delivered_to'] = member.address.original_email
-        d['user_language'] = member.preferred_language.description
-        d['user_name'] = (member.user.display_name
-                          if member.user.display_name
-                          else member.address.original_email)
-        d['user_optionsurl'] = member.options_url
+        d.update(member_substitutions(member, recipient))
     # These strings are descriptive for the log file and shouldn't be i18n'd
     d.update(msgdata.get('decoration-data', {}))
     try:
@@ -200,6 +210,28 @@ def process(mlist, msg, msgdata):
 
 
 
+def member_substitutions(member, recipient):
+    """Calculate a member's header and footer substitutions.
+
+    :param member: The member receiving the message.
+    :type member: `IMember`
+    :param recipient: The address the message is delivered to.
+    :type recipient: string
+    :return: The substitutions for each of `MEMBER_SUBSTITUTIONS`.
+    :rtype: dictionary
+    """
+    return dict(
+        user_address=recipient,
+        user_delivered_to=member.address.original_email,
+        user_language=member.preferred_language.description,
+        user_name=(member.user.display_name
+                   if member.user.display_name
+                   else member.address.original_email),
+        user_optionsurl=member.options_url,
+        )
+
+
+
 def decorate(mlist, uri, extradict=None):
     """Expand the decoration template."""
     if uri is None:
@@ -226,11 +258,63 @@ def decorate(mlist, uri, extradict=None):
         )
     if extradict is not None:
         substitutions.update(extradict)
-    text = expand(template, substitutions)
+    # The template is only parsed the first time it is used, so expanding it
+    # just fills in the placeholders.
+    expanded = []
+    try:
+        for piece in _parse_template(template):
+            if not isinstance(piece, basestring):
+                name, placeholder = piece
+                piece = ('%s' % (substitutions[name],)
+                         if name in substitutions
+                         else placeholder)
+            expanded.append(piece)
+        text = EMPTYSTRING.join(expanded)
+    except (TypeError, ValueError):
+        # The template or its substitutions are really screwed up.
+        log.exception('broken template: %s', template)
+        return ''
     # Turn any \r\n line endings into just \n
     return re.sub(r' *\r?\n', r'\n', text)
 
 
+
+def _parse_template(template):
+    """Split a template into its literal text and its placeholders.
+
+    The placeholders are treated like string.Template.safe_substitute() does.
+    Each template is only parsed once.
+
+    :param template: A PEP 292 $-string template.
+    :type template: string
+    :return: The pieces of the template: literal strings, and (name,
+        placeholder) tuples.
+    :rtype: list
+    """
+    pieces = _parsed_templates.get(template)
+    if pieces is not None:
+        return pieces
+    pieces = []
+    start = 0
+    for match in Template.pattern.finditer(template):
+        pieces.append(template[start:match.start()])
+        name = match.group('named') or match.group('braced')
+        if name is not None:
+            # The placeholder is kept when there's no substitution for it.
+            pieces.append((name, match.group()))
+        elif match.group('escaped') is not None:
+            pieces.append('$')
+        else:
+            pieces.append(match.group())
+        start = match.end()
+    pieces.append(template[start:])
+    # Old versions of changed templates are simply forgotten.
+    if len(_parsed_templates) >= MAX_PARSED_TEMPLATES:
+        _parsed_templates.clear()
+    _parsed_templates[template] = pieces
+    return pieces
+
+
 
 @implementer(IHandler)
 class Decorate:
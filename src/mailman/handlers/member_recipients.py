@@ -49,17 +49,52 @@ class MemberRecipients:
     name = 'member-recipients'
     description = _('Calculate the regular recipients of the message.')
 
+    def __init__(self):
+        # Map mailing list names to their most recently calculated regular
+        # recipients.  See `_get_recipients()`.
+        self._cache = {}
+
+    def flush(self):
+        """Forget all the cached recipients."""
+        self._cache.clear()
+
+    def _get_recipients(self, mlist):
+        """Calculate the regular recipients of the mailing list.
+
+        Calculating the recipients is expensive for large mailing lists, so
+        the results are cached until the mailing list's membership generation
+        changes.  The list's creation time is included in the cache key so
+        that a deleted and recreated mailing list is not confused with the
+        original.
+
+        :param mlist: The mailing list.
+        :type mlist: `IMailingList`
+        :return: The enabled regular recipients, and those recipients who do
+            not want to receive their own postings.
+        :rtype: 2-tuple of frozensets of email addresses
+        """
+        key = (mlist.created_at, mlist.membership_generation)
+        cached = self._cache.get(mlist.fqdn_listname)
+        if cached is not None and cached[0] == key:
+            return cached[1:]
+        recipients = set()
+        not_own_postings = set()
+        for record in mlist.regular_members.get_delivery_records():
+            if record.delivery_status != DeliveryStatus.enabled:
+                continue
+            recipients.add(record.email)
+            if not record.receive_own_postings:
+                not_own_postings.add(record.email)
+        cached = (key, frozenset(recipients), frozenset(not_own_postings))
+        self._cache[mlist.fqdn_listname] = cached
+        return cached[1:]
+
     def process(self, mlist, msg, msgdata):
         """See `IHandler`."""
         # Short circuit if we've already calculated the recipients list,
         # regardless of whether the list is empty or not.
         if 'recipients' in msgdata:
             return
-        # Should the original sender should be included in the recipients list?
-        include_sender = True
-        member = mlist.members.get_member(msg.sender)
-        if member and not member.receive_own_postings:
-            include_sender = False
         # Support for urgent messages, which bypasses digests and disabled
         # delivery and forces an immediate delivery to all members Right Now.
         # We are specifically /not/ allowing the site admins password to work
@@ -87,13 +122,12 @@ Your urgent message to the $mlist.display_name mailing list was not authorized
 for delivery.  The original message as received by Mailman is attached.
 """)
                 raise errors.RejectMessage(wrap(text))
-        # Calculate the regular recipients of the message
-        recipients = set(member.address.email
-                         for member in mlist.regular_members.members
-                         if member.delivery_status == DeliveryStatus.enabled)
-        # Remove the sender if they don't want to receive their own posts
-        if not include_sender and member.address.email in recipients:
-            recipients.remove(member.address.email)
+        # Calculate the regular recipients of the message.
+        enabled, not_own_postings = self._get_recipients(mlist)
+        recipients = set(enabled)
+        # Remove the sender if they don't want to receive their own posts.
+        if msg.sender in not_own_postings:
+            recipients.discard(msg.sender)
         # Handle topic classifications
         do_topic_filters(mlist, msg, msgdata, recipients)
         # Bookkeeping
@@ -0,0 +1,116 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the compiled decoration templates."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestDecorate',
+    ]
+
+
+import os
+import mock
+import shutil
+import tempfile
+import unittest
+
+from mailman.app.lifecycle import create_list
+from mailman.config import config
+from mailman.handlers.decorate import decorate
+from mailman.testing.layers import ConfigLayer
+from mailman.utilities.string import expand
+
+
+
+class TestDecorate(unittest.TestCase):
+    """Test expanding decoration templates."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._mlist.description = 'A $5 list'
+        self._template_dir = tempfile.mkdtemp()
+        config.push('templates', """
+        [paths.testing]
+        template_dir: {0}
+        """.format(self._template_dir))
+        self._path = os.path.join(
+            self._template_dir, 'site', 'en', 'footer.txt')
+        os.makedirs(os.path.dirname(self._path))
+
+    def tearDown(self):
+        config.pop('templates')
+        shutil.rmtree(self._template_dir)
+
+    def _decorate(self, template, extradict=None):
+        with open(self._path, 'w') as fp:
+            print(template, end='', file=fp)
+        return decorate(self._mlist, 'mailman:///footer.txt', extradict)
+
+    def test_no_uri(self):
+        self.assertEqual(decorate(self._mlist, None), '')
+
+    def test_substitutions(self):
+        template = ('$display_name: ${description} $user_name  \r\n'
+                    'Costs $$1 $missing ${missing} $ $1\n')
+        self.assertEqual(self._decorate(template), """\
+Test: A $5 list $user_name
+Costs $1 $missing ${missing} $ $1
+""")
+        text = self._decorate(template, dict(user_name='Anne'))
+        self.assertEqual(text, """\
+Test: A $5 list Anne
+Costs $1 $missing ${missing} $ $1
+""")
+        # Extra substitutions win over the list's.
+        text = self._decorate(template, dict(description='Free'))
+        self.assertEqual(text, """\
+Test: Free $user_name
+Costs $1 $missing ${missing} $ $1
+""")
+
+    def test_same_as_expand(self):
+        # The template expands exactly like string.Template does.
+        template = '${user_address} $info$list_name $$ ${bad $'
+        extra = dict(user_address='anne@example.com', info=3)
+        substitutions = dict(
+            user_address='anne@example.com', info=3,
+            list_name=self._mlist.list_name)
+        self.assertEqual(self._decorate(template, extra),
+                         expand(template, substitutions))
+
+    def test_template_parsed_once(self):
+        # Expanding the same template again reuses the parsed template.
+        self._decorate('$list_name $user_name')
+        with mock.patch('mailman.handlers.decorate.Template') as template:
+            text = decorate(self._mlist, 'mailman:///footer.txt',
+                            dict(user_name='Anne'))
+        self.assertFalse(template.pattern.finditer.called)
+        self.assertEqual(text, 'test Anne')
+
+    def test_broken_substitution(self):
+        # Substitutions which can't be expanded are logged, like expand()
+        # does.
+        with mock.patch('mailman.handlers.decorate.log') as log:
+            text = self._decorate('$list_name $user_name',
+                                  dict(user_name=b'\xe4'))
+        self.assertEqual(text, '')
+        self.assertTrue(log.exception.called)
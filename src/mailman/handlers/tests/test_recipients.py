@@ -33,7 +33,8 @@ from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.interfaces.member import DeliveryMode, DeliveryStatus, MemberRole
 from mailman.interfaces.usermanager import IUserManager
-from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.helpers import (
+    query_counter, specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
 
 
@@ -88,6 +89,54 @@ To: test@example.com
                                                      'bart@example.com',
                                                      'dave@example.com')))
 
+    def test_cached_recipients(self):
+        # The recipients are only calculated once while the membership
+        # doesn't change.
+        self._process(self._mlist, self._msg, {})
+        with query_counter() as counter:
+            msgdata = {}
+            self._process(self._mlist, self._msg, msgdata)
+        self.assertEqual(counter.count, 0)
+        self.assertEqual(len(msgdata['recipients']), 4)
+
+    def test_cache_invalidated_by_subscription(self):
+        self._process(self._mlist, self._msg, {})
+        elle = self._manager.create_address('elle@example.com')
+        self._mlist.subscribe(elle, MemberRole.member)
+        self._dave.unsubscribe()
+        msgdata = {}
+        self._process(self._mlist, self._msg, msgdata)
+        self.assertEqual(msgdata['recipients'], set(('anne@example.com',
+                                                     'bart@example.com',
+                                                     'cris@example.com',
+                                                     'elle@example.com')))
+
+    def test_cache_invalidated_by_preferences(self):
+        self._process(self._mlist, self._msg, {})
+        self._bart.preferences.delivery_status = DeliveryStatus.by_user
+        self._cris.address.preferences.delivery_mode = (
+            DeliveryMode.plaintext_digests)
+        msgdata = {}
+        self._process(self._mlist, self._msg, msgdata)
+        self.assertEqual(msgdata['recipients'], set(('anne@example.com',
+                                                     'dave@example.com')))
+
+    def test_sender_receive_own_postings(self):
+        # A member who doesn't want their own postings is excluded when they
+        # are the sender, even when the recipients are cached.
+        self._anne.preferences.receive_own_postings = False
+        self._msg.replace_header('From', 'anne@example.com')
+        msgdata = {}
+        self._process(self._mlist, self._msg, msgdata)
+        self.assertEqual(msgdata['recipients'], set(('bart@example.com',
+                                                     'cris@example.com',
+                                                     'dave@example.com')))
+        del self._msg['from']
+        self._msg['From'] = 'bart@example.com'
+        msgdata = {}
+        self._process(self._mlist, self._msg, msgdata)
+        self.assertEqual(len(msgdata['recipients']), 4)
+
 
 
 class TestOwnerRecipients(unittest.TestCase):
@@ -22,11 +22,13 @@ from __future__ import absolute_import, print_function, unicode_literals
 __metaclass__ = type
 __all__ = [
     'ToDigest',
+    'summarize',
     ]
 
 
 import os
 
+from email.utils import getaddresses
 from zope.interface import implementer
 
 from mailman.config import config
@@ -35,7 +37,12 @@ from mailman.email.message import Message
 from mailman.interfaces.digests import DigestFrequency
 from mailman.interfaces.handler import IHandler
 from mailman.utilities.datetime import now as right_now
-from mailman.utilities.mailbox import Mailbox
+from mailman.utilities.mailbox import Mailbox, MailboxIndex
+from mailman.utilities.string import oneline
+
+
+# The size of a table of contents entry, not counting the subject and author.
+TOC_ENTRY_OVERHEAD = 10
 
 
 
@@ -53,15 +60,37 @@ class ToDigest:
             return
         # Open the mailbox that will be used to collect the current digest.
         mailbox_path = os.path.join(mlist.data_path, 'digest.mmdf')
-        # Lock the mailbox and append the message.
+        index = MailboxIndex(mailbox_path)
+        # Lock the mailbox and append the message.  The index is updated
+        # along with the mailbox, so that the digest runner can build the
+        # table of contents and find the messages without parsing the whole
+        # mailbox.  Each index entry also keeps the running estimate of the
+        # digest's size, so only the last entry has to be read here.
         with Mailbox(mailbox_path, create=True) as mbox:
-            mbox.add(msg)
-        # Calculate the current size of the mailbox file.  This will not tell
-        # us exactly how big the resulting MIME and rfc1153 digest will
-        # actually be, but it's the most easily available metric to decide
-        # whether the size threshold has been reached.
-        size = os.path.getsize(mailbox_path)
-        if size >= mlist.digest_size_threshold * 1024.0:
+            last = index.last()
+            if (index.is_current(last, os.path.getsize(mailbox_path))
+                and (last is None or 'total' in last)):
+                start, stop = mbox.append(msg)
+                subject, author = summarize(msg)
+                entry = dict(start=start, stop=stop,
+                             subject=subject, author=author)
+                entry['total'] = (
+                    (0 if last is None else last['total']) + _estimate(entry))
+                entry['size'] = os.path.getsize(mailbox_path)
+                index.append(entry)
+            else:
+                # The mailbox was written without updating the index, so
+                # index all of its messages again.
+                mbox.add(msg)
+                entries = [_make_entry(mbox, mbox_key, mbox[mbox_key])
+                           for mbox_key in mbox.iterkeys()]
+                total = 0
+                for entry in entries:
+                    total += _estimate(entry)
+                    entry['total'] = total
+                entry['size'] = os.path.getsize(mailbox_path)
+                index.write(entries)
+        if entry['total'] >= mlist.digest_size_threshold * 1024.0:
             # The digest is ready to send.  Because we don't want to hold up
             # this process with crafting the digest, we're going to move the
             # digest file to a safe place, then craft a fake message for the
@@ -73,6 +102,7 @@ class ToDigest:
             digest_number = mlist.next_digest_number
             bump_digest_number_and_volume(mlist)
             os.rename(mailbox_path, mailbox_dest)
+            index.rename(mailbox_dest)
             config.switchboards['digest'].enqueue(
                 Message(),
                 listname=mlist.fqdn_listname,
@@ -82,6 +112,48 @@ class ToDigest:
 
 
 
+def summarize(msg):
+    """Summarize a message for the digest's table of contents.
+
+    :param msg: The message.
+    :type msg: `Message`
+    :return: The message's subject, or None if it has no subject, and the name
+        or email address of its author, or the empty string.
+    :rtype: 2-tuple of (unicode or None, unicode)
+    """
+    subject = msg.get('subject')
+    if subject is not None:
+        subject = oneline(subject, in_unicode=True)
+    # Take only the first author we find.
+    author = ''
+    addresses = getaddresses([oneline(msg.get('from', ''), in_unicode=True)])
+    if addresses:
+        author = addresses[0][0]
+        if not author:
+            author = addresses[0][1]
+    return subject, author
+
+
+
+def _make_entry(mbox, key, msg):
+    # Return the digest index entry for a message in the mailbox.
+    start, stop = mbox.get_offsets(key)
+    subject, author = summarize(msg)
+    return dict(start=start, stop=stop, subject=subject, author=author)
+
+
+
+def _estimate(entry):
+    # Estimate how much a message adds to the size of the digest, from the
+    # size of the message and of its table of contents entry.  This will not
+    # tell us exactly how big the resulting MIME and rfc1153 digest will
+    # actually be, but it's good enough to decide whether the size threshold
+    # has been reached.
+    return (entry['stop'] - entry['start'] + len(entry['subject'] or '') +
+            len(entry['author']) + TOC_ENTRY_OVERHEAD)
+
+
+
 def bump_digest_number_and_volume(mlist):
     """Bump the digest number and volume."""
     now = right_now()
@@ -22,6 +22,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 __metaclass__ = type
 __all__ = [
     'AddressAlreadyLinkedError',
+    'AddressDeletingEvent',
     'AddressError',
     'AddressNotLinkedError',
     'AddressVerificationEvent',
@@ -96,6 +97,18 @@ class AddressVerificationEvent:
              else self.address.verified_on))
 
 
+
+class AddressDeletingEvent:
+    """Triggered when an address is about to be deleted."""
+
+    def __init__(self, address):
+        self.address = address
+
+    def __str__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                                  self.address.email)
+
+
 
 class IAddress(Interface):
     """Email address related information."""
@@ -23,6 +23,7 @@ __metaclass__ = type
 __all__ = [
     'ClobberDate',
     'IArchiver',
+    'IBatchArchiver',
     ]
 
 
@@ -65,6 +66,11 @@ class IArchiver(Interface):
     def archive_message(mlist, msg):
         """Send the message to the archiver.
 
+        The message may be shared with other archivers, so it must not be
+        changed.  If the archiver can't get hold of a lock in time, it should
+        let the `flufl.lock.TimeOutError` propagate, so that the message is
+        requeued and tried again later.
+
         :param mlist: The IMailingList object.
         :param msg: The message object.
         :returns: The url string or None if the message's archive url cannot
@@ -72,3 +78,22 @@ class IArchiver(Interface):
         """
 
     # XXX How to handle attachments?
+
+
+
+class IBatchArchiver(IArchiver):
+    """An archiver which can archive several messages at once.
+
+    The archive runner collects the messages for these archivers, and hands
+    them over in batches, once per database transaction.
+    """
+
+    def archive_messages(mlist, messages):
+        """Send several messages to the archiver.
+
+        As with `archive_message()`, the messages must not be changed, and a
+        `flufl.lock.TimeOutError` causes all of them to be requeued.
+
+        :param mlist: The IMailingList object.
+        :param messages: The message objects.
+        """
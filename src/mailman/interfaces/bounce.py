@@ -105,3 +105,22 @@ class IBounceProcessor(Interface):
 
     unprocessed = Attribute(
         """An iterator over all unprocessed bounce events.""")
+
+    def process(limit=None):
+        """Score a batch of unprocessed bounce events.
+
+        The oldest unprocessed events are grouped by mailing list and email
+        address.  Each bouncing member's bounce score goes up by the number of
+        their events, and their last bounce date is updated.  Members whose
+        probes bounced have their delivery disabled.  Members whose score
+        reaches their mailing list's bounce score threshold are sent a probe
+        if VERP probes are enabled, otherwise their delivery is disabled.
+        Either way, their bounce score starts over.  Finally, the events are
+        marked as processed.
+
+        :param limit: The maximum number of events to process, or None to
+            process all of them.
+        :type limit: int
+        :return: The number of events processed.
+        :rtype: int
+        """
@@ -64,5 +64,29 @@ class IDatabase(Interface):
     def abort():
         """Abort the current transaction."""
 
+    supports_savepoints = Attribute(
+        """Whether `abort_to_savepoint()` can keep the changes made before
+        the savepoint.  This depends on the version of the ORM.""")
+
+    def savepoint(name):
+        """Mark a savepoint in the current transaction.
+
+        :param name: The name of the savepoint.  Marking a savepoint with the
+            same name again moves it.
+        :type name: str
+        """
+
+    def abort_to_savepoint(name):
+        """Abort the current transaction back to the named savepoint.
+
+        The changes made since the savepoint are thrown away, while the
+        changes made before it are kept in the current transaction.  If the
+        transaction has been completed since the savepoint was marked, or if
+        `supports_savepoints` is false, this is the same as `abort()`.
+
+        :param name: The name of the savepoint.
+        :type name: str
+        """
+
     store = Attribute(
         """The underlying Storm store on which you can do queries.""")
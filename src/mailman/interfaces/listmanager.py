@@ -137,3 +137,8 @@ class IListManager(Interface):
     name_components = Attribute(
         """An iterator over the 2-tuple of (list_name, mail_host) for all
         mailing lists managed by this list manager.""")
+
+    generation = Attribute(
+        """An opaque value which changes whenever a mailing list is created
+        or deleted.  This is much cheaper to check than `names`, so it can be
+        used to tell when a cache of the list names has gone stale.""")
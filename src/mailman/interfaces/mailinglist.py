@@ -253,6 +253,13 @@ class IMailingList(Interface):
     last_post_at = Attribute(
         """The date and time a message was last posted to the mailing list.""")
 
+    membership_generation = Attribute(
+        """A counter which is incremented every time the mailing list's
+        membership changes in a way that may affect its recipients, e.g. when
+        someone subscribes or unsubscribes, or a member's delivery preferences
+        change.  This lets calculated recipient sets be cached until the
+        membership changes again.""")
+
     post_id = Attribute(
         """A monotonically increasing integer sequentially assigned to each
         list posting.""")
@@ -26,10 +26,13 @@ __all__ = [
     'DeliveryStatus',
     'IMember',
     'MemberRole',
+    'MembershipChangeEvent',
     'MembershipError',
     'MembershipIsBannedError',
     'MissingPreferredAddressError',
     'NotAMemberError',
+    'SubscriptionEvent',
+    'UnsubscriptionEvent',
     ]
 
 
@@ -129,6 +132,32 @@ class NotAMemberError(MembershipError):
             self._address, self._mlist)
 
 
+
+class MembershipChangeEvent:
+    """Triggered when a membership changes.
+
+    The mailing list may be None if the membership changes because the
+    mailing list has already been deleted.
+    """
+
+    def __init__(self, mlist, member):
+        self.mlist = mlist
+        self.member = member
+
+    def __str__(self):
+        return '<{0} {1} {2}>'.format(
+            self.__class__.__name__,
+            self.member.mailing_list, self.member.address)
+
+
+class SubscriptionEvent(MembershipChangeEvent):
+    """Triggered when a new member is subscribed to a mailing list."""
+
+
+class UnsubscriptionEvent(MembershipChangeEvent):
+    """Triggered when a member is unsubscribed from a mailing list."""
+
+
 
 class IMember(Interface):
     """A member of a mailing list."""
@@ -154,6 +183,14 @@ class IMember(Interface):
     moderation_action = Attribute(
         """The moderation action for this member as an `Action`.""")
 
+    bounce_score = Attribute(
+        """The number of bounces registered against this member since its
+        delivery was last disabled or probed.""")
+
+    last_bounce_received = Attribute(
+        """The date and time of the member's last registered bounce, or None
+        if the member has never bounced.""")
+
     def unsubscribe():
         """Unsubscribe (and delete) this member from the mailing list."""
 
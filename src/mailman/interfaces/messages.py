@@ -74,18 +74,24 @@ class IMessageStore(Interface):
             find, but disallows collisions.
         """
 
-    def get_message_by_id(message_id):
+    def get_message_by_id(message_id, headers_only=False):
         """Return the message with a matching Message-ID.
 
         :param message_id: The Message-ID header contents to search for.
+        :param headers_only: If True, only the message's headers need to be
+            loaded, e.g. for listing messages.  The returned message's body
+            may then be empty.
         :returns: The message, or None if no matching message was found.
         """
 
-    def get_message_by_hash(message_id_hash):
+    def get_message_by_hash(message_id_hash, headers_only=False):
         """Return the message with the matching X-Message-ID-Hash.
         
         :param message_id_hash: The X-Message-ID-Hash header contents to
             search for.
+        :param headers_only: If True, only the message's headers need to be
+            loaded, e.g. for listing messages.  The returned message's body
+            may then be empty.
         :returns: The message, or None if no matching message was found.
         """
 
@@ -99,6 +105,35 @@ class IMessageStore(Interface):
     messages = Attribute(
         """An iterator over all messages in this message store.""")
 
+    pickled_message_ids = Attribute(
+        """An iterator over the Message-IDs of the messages stored in the
+        pickle format.""")
+
+    def pack_message(message_id):
+        """Convert a message stored in the pickle format to the packed format.
+
+        The pickle file is left in place, because the database transaction
+        has not yet been committed.
+
+        :param message_id: The Message-ID of the message.
+        :type message_id: string
+        :return: The path of the pickle file, which should be removed once
+            the transaction is committed.
+        :rtype: string
+        :raises LookupError: if there is no such message.
+        """
+
+    def remove_empty_packs():
+        """Remove the pack files which no longer hold any messages.
+
+        The newest pack file is kept, since messages are still being added
+        to it.  So are pack files written to within the last hour, since the
+        messages added to them may not be committed yet.
+
+        :return: The names of the removed pack files.
+        :rtype: list of strings
+        """
+
 
 
 class IMessage(Interface):
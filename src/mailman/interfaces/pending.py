@@ -95,5 +95,12 @@ class IPendings(Interface):
         :return: The matching IPendable or None if no match was found.
         """
 
-    def evict():
-        """Remove all pended items whose lifetime has expired."""
+    def evict(limit=None):
+        """Remove all pended items whose lifetime has expired.
+
+        :param limit: The maximum number of pended items to remove, or None
+            to remove all the expired pended items.
+        :type limit: int
+        :return: The number of pended items removed.
+        :rtype: int
+        """
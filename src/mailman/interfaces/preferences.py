@@ -22,12 +22,25 @@ from __future__ import absolute_import, unicode_literals
 __metaclass__ = type
 __all__ = [
     'IPreferences',
+    'PreferencesChangeEvent',
     ]
 
 
 from zope.interface import Interface, Attribute
 
 
+
+class PreferencesChangeEvent:
+    """Triggered when a delivery related preference changes."""
+
+    def __init__(self, preferences, name):
+        self.preferences = preferences
+        self.name = name
+
+    def __str__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, self.name)
+
+
 
 class IPreferences(Interface):
     """Delivery related information."""
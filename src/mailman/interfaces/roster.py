@@ -21,13 +21,29 @@ from __future__ import absolute_import, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'DeliveryRecord',
     'IRoster',
     ]
 
 
+from collections import namedtuple
 from zope.interface import Interface, Attribute
 
 
+
+# The effective delivery-related settings of a single member, as returned by
+# `IRoster.get_delivery_records()`.  The preferences have already been
+# resolved through the member, address, user and system preferences.
+DeliveryRecord = namedtuple('DeliveryRecord', [
+    'email',
+    'original_email',
+    'delivery_mode',
+    'delivery_status',
+    'receive_own_postings',
+    'receive_list_copy',
+    ])
+
+
 
 class IRoster(Interface):
     """A roster is a collection of `IMembers`."""
@@ -64,3 +80,31 @@ class IRoster(Interface):
         :return: The member if found, otherwise None
         :rtype: `IMember` or None
         """
+
+    def get_members(emails):
+        """Get the members for a set of email addresses.
+
+        This is much cheaper than calling `get_member()` for each address,
+        since the members, along with their addresses, users and
+        preferences, are loaded with a single database query.
+
+        :param emails: The email addresses to search for.
+        :type emails: sequence of text
+        :return: The members subscribed with any of the addresses, keyed by
+            email address.  Addresses without a member are left out.
+        :rtype: mapping of `IMember`
+        """
+
+    def get_delivery_records(emails=None):
+        """Get the effective delivery settings of the roster's members.
+
+        This is much cheaper than iterating over `members` and asking each
+        member for its preferences, since all the settings are calculated
+        with a single database query.
+
+        :param emails: If given, only the members subscribed with one of
+            these email addresses are returned.
+        :type emails: sequence of text
+        :return: The delivery records.
+        :rtype: list of `DeliveryRecord`
+        """
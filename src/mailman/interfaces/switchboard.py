@@ -49,6 +49,10 @@ class ISwitchboard(Interface):
         keyword arguments are added to the metadata dictonary, with precedence
         given to the keyword arguments.
 
+        The message may be a `SharedPayload`, when it is enqueued to several
+        queues.  Its text is then written only once, and shared by the
+        message files.
+
         The base name of the message file is returned.
         """
 
@@ -58,16 +62,32 @@ class ISwitchboard(Interface):
         filebase is the base name of the message file as returned by the
         .enqueue() method.  This file must exist and contain a message and
         metadata.  The message file is preserved in a backup file, which must
-        be removed by calling the .finish() method.
+        be removed by calling the .finish() method.  Moving the file to the
+        backup file claims it, so if another process has already dequeued
+        the file, an OSError with errno ENOENT is raised.
 
         Returned is a 2-tuple of the form (message, metadata).
         """
 
+    def get_metadata(filebase):
+        """Return the metadata contained in the named file.
+
+        Unlike .dequeue(), the file is left in the queue.  For binary format
+        queue files, the message is not read at all.
+
+        :param filebase: The base name of the message file as returned by
+            the .enqueue() method.
+        :type filebase: str
+        :return: The metadata.
+        :rtype: dict
+        """
+
     def finish(filebase, preserve=False):
         """Remove the backup file for filebase.
 
         If preserve is True, then the backup file is actually just renamed to
-        a preservation file instead of being unlinked.
+        a preservation file instead of being unlinked.  The text of a shared
+        payload is removed once the last message file sharing it is finished.
         """
 
     files = Attribute(
@@ -84,6 +104,42 @@ class ISwitchboard(Interface):
         returned.
         """
 
+    def next_files():
+        """Iterate over the .pck files in this switchboard's slice.
+
+        The base names of the files are returned in FIFO order.  Unlike
+        `files`, the iterator may be served from an index of the queue
+        directory rather than a full scan of it, and files which are queued
+        while iterating are not returned until the next call.  If the slice
+        is empty and the switchboard steals work, the overdue files of the
+        other slices are returned instead.
+        """
+
+    def wait(timeout):
+        """Wait until there may be new files to process.
+
+        When the queue directory can be watched, this returns as soon as a new
+        file is queued in this switchboard's slice.  Files queued in other
+        slices, and other switchboards claiming their files, don't wake it
+        up.  Otherwise, or when no file arrives, it returns after `timeout`
+        seconds.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type timeout: float
+        """
+
+    def sync():
+        """Make sure all the files enqueued so far are durable.
+
+        Depending on the switchboard's durability policy, enqueued files may
+        not yet have been flushed to disk.  This flushes them, along with the
+        queue directory.
+        """
+
+    def close():
+        """Sync and release any resources used to watch the queue directory.
+        """
+
     def recover_backup_files():
         """Move all backup files to active message files.
 
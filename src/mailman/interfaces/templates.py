@@ -39,8 +39,24 @@ class ITemplateLoader(Interface):
 
         .. _`urllib2`: http://docs.python.org/library/urllib2.html
 
+        The contents of `mailman:` URIs are cached, until `invalidate()` is
+        called.  Changes to the template files, including new templates which
+        take precedence, are noticed within a few seconds.
+
         :param uri: The URI of the resource.  These may be any URI supported
             by `urllib2` and also `mailman:` URIs for internal resources.
         :type uri: string
         :return: An open file object as defined by urllib2.
         """
+
+    def invalidate(uri=None):
+        """Forget the cached contents of `mailman:` URIs.
+
+        This is needed when a template is added which takes precedence over
+        the template a URI was previously found in, e.g. a list specific
+        template overriding a site template.
+
+        :param uri: The URI to forget.  If not given, the whole cache is
+            cleared.
+        :type uri: string
+        """
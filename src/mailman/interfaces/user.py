@@ -21,9 +21,12 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'AddressLinkChangeEvent',
     'IUser',
     'PasswordChangeEvent',
+    'PreferredAddressChangeEvent',
     'UnverifiedAddressError',
+    'UserDeletingEvent',
     ]
 
 
@@ -49,6 +52,44 @@ class PasswordChangeEvent:
                                   self.user.display_name)
 
 
+
+class PreferredAddressChangeEvent:
+    """Triggered when a user's preferred address changes."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def __str__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                                  self.user.display_name)
+
+
+
+class AddressLinkChangeEvent:
+    """Triggered when an address is linked to or unlinked from a user."""
+
+    def __init__(self, user, address):
+        self.user = user
+        self.address = address
+
+    def __str__(self):
+        return '<{0} {1} {2}>'.format(self.__class__.__name__,
+                                      self.user.display_name,
+                                      self.address.email)
+
+
+
+class UserDeletingEvent:
+    """Triggered when a user is about to be deleted."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def __str__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                                  self.user.display_name)
+
+
 
 class IUser(Interface):
     """A basic user."""
@@ -26,17 +26,48 @@ __all__ = [
     ]
 
 
+from lazr.config import as_boolean
+from storm.expr import (
+    And, Coalesce, Count, Desc, Exists, Expr, Max, Or, Select, Update,
+    compile)
 from storm.locals import Bool, Int, DateTime, Unicode
+from zope.component import getUtility
 from zope.interface import implementer
 
+from mailman.app.bounces import send_probe
+from mailman.config import config
 from mailman.database.model import Model
 from mailman.database.transaction import dbconnection
 from mailman.database.types import Enum
 from mailman.interfaces.bounce import (
     BounceContext, IBounceEvent, IBounceProcessor)
+from mailman.interfaces.listmanager import IListManager
+from mailman.interfaces.member import DeliveryStatus, MemberRole
+from mailman.model.address import Address
+from mailman.model.member import Member
+from mailman.model.preferences import Preferences
 from mailman.utilities.datetime import now
 
 
+
+class _Scalar(Expr):
+    """A subquery returning a single value, for use as a column value.
+
+    Storm only parenthesizes subqueries nested in operators, not the ones
+    appearing directly in an UPDATE's SET clause.
+    """
+
+    __slots__ = ('select',)
+
+    def __init__(self, select):
+        self.select = select
+
+
+@compile.when(_Scalar)
+def _compile_scalar(compile, expr, state):
+    return '({0})'.format(compile(expr.select, state))
+
+
 
 @implementer(IBounceEvent)
 class BounceEvent(Model):
@@ -84,3 +115,118 @@ class BounceProcessor:
         """See `IBounceProcessor`."""
         for event in store.find(BounceEvent, BounceEvent.processed == False):
             yield event
+
+    @dbconnection
+    def process(self, store, limit=None):
+        """See `IBounceProcessor`."""
+        # Import this here to avoid circular imports.
+        from mailman.model.user import User
+        # The batch is made up of the oldest unprocessed events.
+        event_ids = store.find(
+            BounceEvent.id,
+            BounceEvent.processed == False).order_by(BounceEvent.id)
+        if limit is not None:
+            event_ids = event_ids[:limit]
+        event_ids = list(event_ids)
+        if len(event_ids) == 0:
+            return 0
+        batch = And(BounceEvent.processed == False,
+                    BounceEvent.id <= event_ids[-1])
+        # Each member's bounce events are matched in SQL, so that all the
+        # members are scored by the same statement however many events there
+        # are.  Members subscribed through their user bounce at that user's
+        # preferred address.
+        member_email = Select(
+            Address.email,
+            Address.id == Coalesce(
+                Member.address_id,
+                Select(User._preferred_address_id,
+                       User.id == Member.user_id, tables=User)),
+            tables=Address)
+        def member_events(column, *conditions):
+            return Select(
+                column,
+                And(batch,
+                    BounceEvent.list_name == Member.mailing_list,
+                    BounceEvent.email == member_email,
+                    *conditions),
+                tables=BounceEvent)
+        # Only the members subscribed with, or through the user of, a bouncing
+        # address need to be checked for events.
+        addresses = Select(
+            Address.id,
+            Address.email.is_in(Select(BounceEvent.email, batch,
+                                       tables=BounceEvent)),
+            tables=Address)
+        bouncing = And(
+            Member.role == MemberRole.member,
+            Or(Member.address_id.is_in(addresses),
+               Member.user_id.is_in(Select(Address.user_id,
+                                           Address.id.is_in(addresses),
+                                           tables=Address))),
+            Exists(member_events(BounceEvent.id)))
+        store.find(Member, bouncing).set(
+            bounce_score=(Coalesce(Member.bounce_score, 0) +
+                          member_events(Count())),
+            last_bounce_received=_Scalar(
+                member_events(Max(BounceEvent.timestamp))))
+        # A bouncing probe disables the member's delivery right away.
+        self._disable(store, And(bouncing, Exists(member_events(
+            BounceEvent.id, BounceEvent.context == BounceContext.probe))))
+        # Any other member whose score reaches the mailing list's threshold is
+        # either probed or disabled.
+        verp_probes = as_boolean(config.mta.verp_probes)
+        list_names = store.find(BounceEvent.list_name, batch).config(
+            distinct=True)
+        list_manager = getUtility(IListManager)
+        for list_name in list(list_names):
+            mlist = list_manager.get(list_name)
+            if mlist is None or mlist.bounce_score_threshold is None:
+                continue
+            over_threshold = And(
+                bouncing,
+                Member.mailing_list == list_name,
+                Member.bounce_score >= mlist.bounce_score_threshold)
+            if not verp_probes:
+                self._disable(store, over_threshold)
+                continue
+            for member in store.find(Member, over_threshold):
+                message_id = store.find(
+                    BounceEvent.message_id,
+                    batch,
+                    BounceEvent.list_name == list_name,
+                    BounceEvent.email == member.address.email,
+                    ).order_by(Desc(BounceEvent.id)).first()
+                send_probe(member, message_id=message_id)
+            store.find(Member, over_threshold).set(bounce_score=0)
+        # ResultSet.set() would load every cached event to check whether it is
+        # part of the batch, so update the rows directly and let the cached
+        # events reload themselves.
+        store.execute(Update({BounceEvent.processed: True}, batch, BounceEvent),
+                      noresult=True)
+        store.invalidate()
+        return len(event_ids)
+
+    def _disable(self, store, members):
+        """Disable delivery to the matching members, and reset their scores."""
+        # Import this here to avoid circular imports.
+        from mailman.model.mailinglist import MailingList
+        # Changing the preferences directly doesn't notify anyone, so the
+        # mailing lists' membership generations are bumped here, invalidating
+        # their cached recipients.  See `bump_membership_generation()`.
+        list_names = list(store.find(Member.mailing_list, members).config(
+            distinct=True))
+        if len(list_names) > 0:
+            store.execute(Update(
+                {MailingList.membership_generation:
+                 MailingList.membership_generation + 1},
+                Or(*[And(MailingList.list_name == list_name,
+                         MailingList.mail_host == mail_host)
+                     for list_name, at, mail_host in (
+                         fqdn_listname.partition('@')
+                         for fqdn_listname in list_names)]),
+                MailingList), noresult=True)
+        store.find(Preferences, Preferences.id.is_in(Select(
+            Member.preferences_id, members, tables=Member))).set(
+                delivery_status=DeliveryStatus.by_bounces)
+        store.find(Member, members).set(bounce_score=0)
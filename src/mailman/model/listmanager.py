@@ -25,6 +25,7 @@ __all__ = [
     ]
 
 
+from storm.expr import Count, Max
 from zope.event import notify
 from zope.interface import implementer
 
@@ -107,3 +108,13 @@ class ListManager:
         for mail_host, list_name in result_set.values(MailingList.mail_host,
                                                       MailingList.list_name):
             yield list_name, mail_host
+
+    @property
+    @dbconnection
+    def generation(self, store):
+        """See `IListManager`."""
+        # Creating a list bumps the latest creation time and deleting one
+        # drops the count, so together they change whenever a list comes or
+        # goes, without having to read every list's name.
+        return store.find((Count(MailingList.id),
+                           Max(MailingList.created_at))).one()
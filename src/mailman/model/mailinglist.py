@@ -33,6 +33,7 @@ from storm.locals import (
     TimeDelta, Unicode)
 from urlparse import urljoin
 from zope.component import getUtility
+from zope.event import notify
 from zope.interface import implementer
 
 from mailman.config import config
@@ -49,7 +50,8 @@ from mailman.interfaces.mailinglist import (
     IAcceptableAlias, IAcceptableAliasSet, IMailingList, Personalization,
     ReplyToMunging)
 from mailman.interfaces.member import (
-    AlreadySubscribedError, MemberRole, MissingPreferredAddressError)
+    AlreadySubscribedError, MemberRole, MissingPreferredAddressError,
+    SubscriptionEvent)
 from mailman.interfaces.mime import FilterType
 from mailman.interfaces.nntp import NewsModeration
 from mailman.interfaces.user import IUser
@@ -94,6 +96,7 @@ class MailingList(Model):
     digest_last_sent_at = DateTime()
     volume = Int()
     last_post_at = DateTime()
+    membership_generation = Int()
     # Implicit destination.
     acceptable_aliases_id = Int()
     acceptable_alias = Reference(acceptable_aliases_id, 'AcceptableAlias.id')
@@ -204,6 +207,7 @@ class MailingList(Model):
         self.mail_host = hostname
         # For the pending database
         self.next_request_id = 1
+        self.membership_generation = 0
         # We need to set up the rosters.  Normally, this method will get
         # called when the MailingList object is loaded from the database, but
         # that's not the case when the constructor is called.  So, set up the
@@ -489,6 +493,7 @@ class MailingList(Model):
                         subscriber=subscriber)
         member.preferences = Preferences()
         store.add(member)
+        notify(SubscriptionEvent(self, member))
         return member
 
 
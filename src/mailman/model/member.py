@@ -24,9 +24,10 @@ __all__ = [
     'Member',
     ]
 
-from storm.locals import Int, Reference, Unicode
+from storm.locals import DateTime, Int, Reference, Unicode
 from storm.properties import UUID
 from zope.component import getUtility
+from zope.event import notify
 from zope.interface import implementer
 
 from mailman.core.constants import system_preferences
@@ -36,7 +37,9 @@ from mailman.database.types import Enum
 from mailman.interfaces.action import Action
 from mailman.interfaces.address import IAddress
 from mailman.interfaces.listmanager import IListManager
-from mailman.interfaces.member import IMember, MemberRole, MembershipError
+from mailman.interfaces.member import (
+    IMember, MemberRole, MembershipChangeEvent, MembershipError,
+    UnsubscriptionEvent)
 from mailman.interfaces.user import IUser, UnverifiedAddressError
 from mailman.interfaces.usermanager import IUserManager
 from mailman.utilities.uid import UniqueIDFactory
@@ -63,10 +66,14 @@ class Member(Model):
     user_id = Int()
     _user = Reference(user_id, 'User.id')
 
+    bounce_score = Int()
+    last_bounce_received = DateTime()
+
     def __init__(self, role, mailing_list, subscriber):
         self._member_id = uid_factory.new_uid()
         self.role = role
         self.mailing_list = mailing_list
+        self.bounce_score = 0
         if IAddress.providedBy(subscriber):
             self._address = subscriber
             # Look this up dynamically.
@@ -120,13 +127,15 @@ class Member(Model):
         if user is None or user != self.user:
             raise MembershipError('Address is not controlled by user')
         self._address = new_address
+        notify(MembershipChangeEvent(
+            getUtility(IListManager).get(self.mailing_list), self))
 
     @property
     def user(self):
         """See `IMember`."""
         return (self._user
                 if self._address is None
-                else getUtility(IUserManager).get_user(self._address.email))
+                else self._address.user)
 
     def _lookup(self, preference):
         pref = getattr(self.preferences, preference)
@@ -180,5 +189,7 @@ class Member(Model):
     @dbconnection
     def unsubscribe(self, store):
         """See `IMember`."""
+        notify(UnsubscriptionEvent(
+            getUtility(IListManager).get(self.mailing_list), self))
         store.remove(self.preferences)
         store.remove(self)
@@ -25,15 +25,22 @@ __all__ = [
     ]
 
 import os
+import time
+import zlib
+import email
 import errno
 import base64
 import hashlib
 import cPickle as pickle
 
+from cStringIO import StringIO
+from email.generator import Generator
+from email.parser import Parser
 from zope.interface import implementer
 
 from mailman.config import config
 from mailman.database.transaction import dbconnection
+from mailman.email.message import Message as EmailMessage
 from mailman.interfaces.messages import IMessageStore
 from mailman.model.message import Message
 from mailman.utilities.filesystem import makedirs
@@ -43,6 +50,60 @@ from mailman.utilities.filesystem import makedirs
 # value.  We'd need a script to reshuffle and resplit.
 MAX_SPLITS = 2
 EMPTYSTRING = ''
+STORE_FORMATS = ('pickle', 'packed')
+# Packed messages are stored in pack files in this subdirectory of the
+# messages directory.  Their paths look like
+#
+#   packs/00000001.pack:zlib:<offset>:<header size>:<body size>
+#
+# giving the pack file, how the message's text is compressed, and where the
+# message's headers and body are stored in the pack file.  Pickled messages'
+# paths never contain a colon.
+PACKS_DIR = 'packs'
+# Empty pack files are only removed once they haven't been written to for this
+# many seconds.
+PACK_GRACE_PERIOD = 3600
+COMPRESSORS = dict(
+    none=(lambda text: text),
+    zlib=zlib.compress,
+    )
+DECOMPRESSORS = dict(
+    none=(lambda data: data),
+    zlib=zlib.decompress,
+    )
+
+
+
+def _is_packed(path):
+    return b':' in path
+
+
+def _pack_path(name):
+    return os.path.join(config.MESSAGES_DIR, PACKS_DIR, name)
+
+
+def _pack_names():
+    try:
+        filenames = os.listdir(os.path.join(config.MESSAGES_DIR, PACKS_DIR))
+    except OSError as error:
+        if error.errno != errno.ENOENT:
+            raise
+        return []
+    return sorted(filename for filename in filenames
+                  if filename.endswith('.pack'))
+
+
+def _newest_pack():
+    # Return the name of the newest pack file, or of a new one if it's full.
+    names = _pack_names()
+    if len(names) == 0:
+        makedirs(os.path.join(config.MESSAGES_DIR, PACKS_DIR))
+        return '{0:08d}.pack'.format(1)
+    number = int(names[-1][:-5])
+    max_size = int(config.messages.max_pack_size) * 1024
+    if os.path.getsize(_pack_path(names[-1])) >= max_size:
+        number += 1
+    return '{0:08d}.pack'.format(number)
 
 
 
@@ -50,6 +111,11 @@ EMPTYSTRING = ''
 class MessageStore:
     """See `IMessageStore`."""
 
+    def __init__(self):
+        # The pack file which messages are appended to, so that the packs
+        # directory only has to be listed when it fills up.
+        self._pack_name = None
+
     @dbconnection
     def add(self, store, message):
         # Ensure that the message has the requisite headers.
@@ -68,6 +134,23 @@ class MessageStore:
         hash32 = base64.b32encode(shaobj.digest())
         del message['X-Message-ID-Hash']
         message['X-Message-ID-Hash'] = hash32
+        store_format = config.messages.store_format
+        assert store_format in STORE_FORMATS, (
+            'Unknown message store format: {0}'.format(store_format))
+        if store_format == 'packed':
+            relpath = self._write_packed(message)
+        else:
+            relpath = self._write_pickled(message, hash32)
+        # Store the message in the database.  This relies on the database
+        # providing a unique serial number, but to get this information, we
+        # have to use a straight insert instead of relying on Elixir to create
+        # the object.
+        Message(message_id=message_id,
+                message_id_hash=hash32,
+                path=relpath)
+        return hash32
+
+    def _write_pickled(self, message, hash32):
         # Calculate the path on disk where we're going to store this message
         # object, in pickled format.
         parts = []
@@ -76,13 +159,6 @@ class MessageStore:
             parts.append(split.pop(0) + split.pop(0))
         parts.append(hash32)
         relpath = os.path.join(*parts)
-        # Store the message in the database.  This relies on the database
-        # providing a unique serial number, but to get this information, we
-        # have to use a straight insert instead of relying on Elixir to create
-        # the object.
-        row = Message(message_id=message_id,
-                      message_id_hash=hash32,
-                      path=relpath)
         # Now calculate the full file system path.
         path = os.path.join(config.MESSAGES_DIR, relpath)
         # Write the file to the path, but catch the appropriate exception in
@@ -98,22 +174,81 @@ class MessageStore:
                 if error.errno <> errno.ENOENT:
                     raise
             makedirs(os.path.dirname(path))
-        return hash32
+        return relpath
 
-    def _get_message(self, row):
-        path = os.path.join(config.MESSAGES_DIR, row.path)
-        with open(path) as fp:
-            return pickle.load(fp)
+    def _write_packed(self, message):
+        # Append the text of the message to the current pack file.  The
+        # headers and the body are compressed separately, so that the headers
+        # can be read on their own.
+        compression = config.messages.compression
+        compress = COMPRESSORS[compression]
+        # Store the message text exactly, without escaping From_ lines.
+        fp = StringIO()
+        Generator(fp, mangle_from_=False).flatten(message)
+        text = fp.getvalue()
+        end = text.find(b'\n\n') + 1
+        if end == 0:
+            end = len(text)
+        headers = compress(text[:end])
+        body = compress(text[end:])
+        # Append to the current pack file.  Only when there is none yet, or
+        # it has filled up or been removed, is the newest pack file looked
+        # for, starting a new one if it's full.
+        fd = None
+        if self._pack_name is not None:
+            try:
+                fd = os.open(_pack_path(self._pack_name),
+                             os.O_WRONLY | os.O_APPEND)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+        if fd is None:
+            self._pack_name = _newest_pack()
+            fd = os.open(_pack_path(self._pack_name),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0666)
+        name = self._pack_name
+        # A single write to a file opened for appending is atomic on local
+        # file systems, so several processes can add messages to the same
+        # pack file at once without locking.  Afterward, the file position
+        # is just past the message.
+        try:
+            written = os.write(fd, headers + body)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+        finally:
+            os.close(fd)
+        if written != len(headers) + len(body):
+            raise IOError('Short write to pack file: {0}'.format(name))
+        offset = end - written
+        if end >= int(config.messages.max_pack_size) * 1024:
+            self._pack_name = None
+        return b'{0}/{1}:{2}:{3}:{4}:{5}'.format(
+            PACKS_DIR, name, compression, offset, len(headers), len(body))
+
+    def _get_message(self, row, headers_only=False):
+        if not _is_packed(row.path):
+            path = os.path.join(config.MESSAGES_DIR, row.path)
+            with open(path) as fp:
+                return pickle.load(fp)
+        relpath, compression, offset, header_size, body_size = (
+            row.path.split(b':'))
+        decompress = DECOMPRESSORS[compression]
+        with open(os.path.join(config.MESSAGES_DIR, relpath), 'rb') as fp:
+            fp.seek(int(offset))
+            headers = decompress(fp.read(int(header_size)))
+            if headers_only:
+                return Parser(EmailMessage).parsestr(headers, headersonly=True)
+            body = decompress(fp.read(int(body_size)))
+        return email.message_from_string(headers + body, EmailMessage)
 
     @dbconnection
-    def get_message_by_id(self, store, message_id):
+    def get_message_by_id(self, store, message_id, headers_only=False):
         row = store.find(Message, message_id=message_id).one()
         if row is None:
             return None
-        return self._get_message(row)
+        return self._get_message(row, headers_only)
 
     @dbconnection
-    def get_message_by_hash(self, store, message_id_hash):
+    def get_message_by_hash(self, store, message_id_hash, headers_only=False):
         # It's possible the hash came from a message header, in which case it
         # will be a Unicode.  However when coming from source code, it may be
         # an 8-string.  Coerce to the latter if necessary; it must be
@@ -123,7 +258,7 @@ class MessageStore:
         row = store.find(Message, message_id_hash=message_id_hash).one()
         if row is None:
             return None
-        return self._get_message(row)
+        return self._get_message(row, headers_only)
 
     @property
     @dbconnection
@@ -136,6 +271,40 @@ class MessageStore:
         row = store.find(Message, message_id=message_id).one()
         if row is None:
             raise LookupError(message_id)
-        path = os.path.join(config.MESSAGES_DIR, row.path)
-        os.remove(path)
+        # Pack files are append-only, so a packed message's space is only
+        # reclaimed by remove_empty_packs().
+        if not _is_packed(row.path):
+            os.remove(os.path.join(config.MESSAGES_DIR, row.path))
         store.remove(row)
+
+    @property
+    @dbconnection
+    def pickled_message_ids(self, store):
+        for row in store.find(Message):
+            if not _is_packed(row.path):
+                yield row.message_id
+
+    @dbconnection
+    def pack_message(self, store, message_id):
+        row = store.find(Message, message_id=message_id).one()
+        if row is None:
+            raise LookupError(message_id)
+        assert not _is_packed(row.path), 'Message is already packed'
+        path = os.path.join(config.MESSAGES_DIR, row.path)
+        row.path = self._write_packed(self._get_message(row))
+        return path
+
+    @dbconnection
+    def remove_empty_packs(self, store):
+        in_use = set(path.split(b':')[0]
+                     for path in store.find(Message).values(Message.path)
+                     if _is_packed(path))
+        removed = []
+        cutoff = time.time() - PACK_GRACE_PERIOD
+        for name in _pack_names()[:-1]:
+            path = _pack_path(name)
+            if (os.path.join(PACKS_DIR, name) not in in_use
+                    and os.path.getmtime(path) < cutoff):
+                os.remove(path)
+                removed.append(name)
+        return removed
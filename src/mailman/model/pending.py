@@ -26,11 +26,13 @@ __all__ = [
     ]
 
 
+import json
 import time
 import random
 import hashlib
 
 from lazr.config import as_timedelta
+from storm.expr import In, LeftJoin
 from storm.locals import DateTime, Int, RawStr, ReferenceSet, Unicode
 from zope.interface import implementer
 from zope.interface.verify import verifyObject
@@ -44,6 +46,16 @@ from mailman.utilities.datetime import now
 from mailman.utilities.modules import call_name
 
 
+PENDING_FORMATS = ('keyvalue', 'json')
+# In json format, all of a pending's data is stored in the value of a single
+# key/value pair, under this key.
+JSON_KEY = '__json__'
+# Tuples and sets are stored as JSON objects with this key naming their type.
+TYPE_TAG = '__type__'
+# The maximum number of pendings deleted by a single statement, keeping well
+# below SQLite's limit on the number of query parameters.
+IDS_PER_QUERY = 500
+
 
 @implementer(IPendedKeyValue)
 class PendedKeyValue(Model):
@@ -105,7 +117,7 @@ class Pendings:
             token = hashlib.sha1(repr(x)).hexdigest()
             # In practice, we'll never get a duplicate, but we'll be anal
             # about checking anyway.
-            if store.find(Pended, token=token).count() == 0:
+            if store.find(Pended, token=token).is_empty():
                 break
         else:
             raise AssertionError('Could not find a valid pendings token')
@@ -113,6 +125,17 @@ class Pendings:
         pending = Pended(
             token=token,
             expiration_date=now() + lifetime)
+        pending_format = config.mailman.pending_format
+        assert pending_format in PENDING_FORMATS, (
+            'Unknown pending format: {0}'.format(pending_format))
+        if pending_format == 'json':
+            # All the key/value pairs are serialized into a single row.
+            text = json.dumps(_encode(dict(pendable.items())),
+                              separators=(',', ':'))
+            pending.key_values.add(
+                PendedKeyValue(key=JSON_KEY, value=unicode(text)))
+            store.add(pending)
+            return token
         for key, value in pendable.items():
             if isinstance(key, str):
                 key = unicode(key, 'utf-8')
@@ -136,43 +159,82 @@ class Pendings:
     @dbconnection
     def confirm(self, store, token, expunge=True):
         # Token can come in as a unicode, but it's stored in the database as
-        # bytes.  They must be ascii.
-        pendings = store.find(Pended, token=str(token))
-        if pendings.count() == 0:
+        # bytes.  They must be ascii.  Fetch the pending object along with all
+        # of its PendedKeyValue entries in a single query.
+        origin = [Pended, LeftJoin(PendedKeyValue,
+                                   PendedKeyValue.pended_id == Pended.id)]
+        rows = list(store.using(*origin).find(
+            (Pended, PendedKeyValue), Pended.token == str(token)))
+        if len(rows) == 0:
             return None
-        assert pendings.count() == 1, (
-            'Unexpected token count: {0}'.format(pendings.count()))
-        pending = pendings[0]
+        pendings = set(pending for pending, keyvalue in rows)
+        assert len(pendings) == 1, (
+            'Unexpected token count: {0}'.format(len(pendings)))
+        pending = pendings.pop()
         pendable = UnpendedPendable()
-        # Find all PendedKeyValue entries that are associated with the pending
-        # object's ID.  Watch out for type conversions.
-        for keyvalue in store.find(PendedKeyValue,
-                                   PendedKeyValue.pended_id == pending.id):
-            if keyvalue.value is not None and '\1' in keyvalue.value:
+        # Watch out for type conversions.
+        for ignore, keyvalue in rows:
+            if keyvalue is None:
+                # The pendable was empty.
+                continue
+            if keyvalue.key == JSON_KEY:
+                pendable.update(json.loads(
+                    keyvalue.value, object_hook=_decode_object))
+            elif keyvalue.value is not None and '\1' in keyvalue.value:
                 type_name, value = keyvalue.value.split('\1', 1)
                 pendable[keyvalue.key] = call_name(type_name, value)
             else:
                 pendable[keyvalue.key] = keyvalue.value
-            if expunge:
-                store.remove(keyvalue)
         if expunge:
+            store.find(PendedKeyValue,
+                       PendedKeyValue.pended_id == pending.id).remove()
             store.remove(pending)
         return pendable
 
     @dbconnection
-    def evict(self, store):
-        right_now = now()
-        for pending in store.find(Pended):
-            if pending.expiration_date < right_now:
-                # Find all PendedKeyValue entries that are associated with the
-                # pending object's ID.
-                q = store.find(PendedKeyValue,
-                               PendedKeyValue.pended_id == pending.id)
-                for keyvalue in q:
-                    store.remove(keyvalue)
-                store.remove(pending)
+    def evict(self, store, limit=None):
+        # Find the expired pendings through the expiration date index, then
+        # delete them and their PendedKeyValue entries with one statement
+        # each per batch of ids.
+        expired = store.find(Pended.id, Pended.expiration_date < now())
+        if limit is not None:
+            expired = expired[:limit]
+        ids = list(expired)
+        for start in range(0, len(ids), IDS_PER_QUERY):
+            batch = ids[start:start + IDS_PER_QUERY]
+            store.find(PendedKeyValue,
+                       In(PendedKeyValue.pended_id, batch)).remove()
+            store.find(Pended, In(Pended.id, batch)).remove()
+        return len(ids)
 
 
 
 def unpack_list(value):
     return value.split('\2')
+
+
+
+def _encode(value):
+    # Prepare a value for serialization to JSON.  Byte strings are assumed to
+    # be utf-8 encoded, and the types JSON doesn't have are tagged.
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, dict):
+        return dict((_encode(key), _encode(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, (tuple, set)):
+        return {TYPE_TAG: type(value).__name__,
+                'items': [_encode(item) for item in value]}
+    return value
+
+
+def _decode_object(obj):
+    # Reverse the type tagging done by _encode().
+    type_name = obj.get(TYPE_TAG)
+    if type_name == 'tuple':
+        return tuple(obj['items'])
+    if type_name == 'set':
+        return set(obj['items'])
+    return obj
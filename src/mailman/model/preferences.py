@@ -27,13 +27,20 @@ __all__ = [
 
 from storm.locals import Bool, Int, Unicode
 from zope.component import getUtility
+from zope.event import notify
 from zope.interface import implementer
 
 from mailman.database.model import Model
 from mailman.database.types import Enum
 from mailman.interfaces.languages import ILanguageManager
 from mailman.interfaces.member import DeliveryMode, DeliveryStatus
-from mailman.interfaces.preferences import IPreferences
+from mailman.interfaces.preferences import (
+    IPreferences, PreferencesChangeEvent)
+from mailman.interfaces.roster import DeliveryRecord
+
+
+# The preferences which affect the recipients of a mailing list.
+DELIVERY_PREFERENCES = frozenset(DeliveryRecord._fields[2:])
 
 
 
@@ -53,6 +60,11 @@ class Preferences(Model):
     def __repr__(self):
         return '<Preferences object at {0:#x}>'.format(id(self))
 
+    def __setattr__(self, name, value):
+        super(Preferences, self).__setattr__(name, value)
+        if name in DELIVERY_PREFERENCES:
+            notify(PreferencesChangeEvent(self, name))
+
     @property
     def preferred_language(self):
         if self._preferred_language is None:
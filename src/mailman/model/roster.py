@@ -28,6 +28,7 @@ __metaclass__ = type
 __all__ = [
     'AdministratorRoster',
     'DigestMemberRoster',
+    'MemberMap',
     'MemberRoster',
     'Memberships',
     'ModeratorRoster',
@@ -37,14 +38,174 @@ __all__ = [
     ]
 
 
-from storm.expr import And, Or
+from collections import Mapping
+from storm.expr import And, Coalesce, Join, LeftJoin, Or
+from storm.info import ClassAlias
 from zope.interface import implementer
 
+from mailman.core.constants import system_preferences
 from mailman.database.transaction import dbconnection
 from mailman.interfaces.member import DeliveryMode, MemberRole
-from mailman.interfaces.roster import IRoster
+from mailman.interfaces.roster import DeliveryRecord, IRoster
 from mailman.model.address import Address
 from mailman.model.member import Member
+from mailman.model.preferences import Preferences
+
+
+# The preferences resolved by get_delivery_records(), in DeliveryRecord order.
+DELIVERY_PREFERENCES = DeliveryRecord._fields[2:]
+# The maximum number of email addresses looked up by a single query, keeping
+# well below SQLite's limit on the number of query parameters.
+EMAILS_PER_QUERY = 500
+
+
+
+def _member_join():
+    """Join members to their addresses, users and preferences.
+
+    Members subscribed through their user are joined to that user's preferred
+    address.  The address's user is joined as `User`, and the member's user
+    and all the preferences under aliases.
+
+    :return: The joined tables, and the aliases of the member's user, and of
+        the member's, address's and user's preferences.
+    :rtype: 5-tuple
+    """
+    # Import this here to avoid circular imports.
+    from mailman.model.user import User
+    member_user = ClassAlias(User, 'member_user')
+    member_preferences = ClassAlias(Preferences, 'member_preferences')
+    address_preferences = ClassAlias(Preferences, 'address_preferences')
+    user_preferences = ClassAlias(Preferences, 'user_preferences')
+    tables = (
+        Member,
+        LeftJoin(member_user, Member.user_id == member_user.id),
+        Join(Address, Address.id == Coalesce(
+            Member.address_id, member_user._preferred_address_id)),
+        LeftJoin(member_preferences,
+                 Member.preferences_id == member_preferences.id),
+        LeftJoin(address_preferences,
+                 Address.preferences_id == address_preferences.id),
+        LeftJoin(User, Address.user_id == User.id),
+        LeftJoin(user_preferences,
+                 User.preferences_id == user_preferences.id),
+        )
+    return (tables, member_user, member_preferences, address_preferences,
+            user_preferences)
+
+
+
+def _get_delivery_records(store, members, emails=None):
+    """Calculate the delivery records for a set of members.
+
+    Preferences are looked up first on the member, then on the subscribed
+    address, then on the address's user, falling back to the system
+    preferences.  See `Member._lookup()`.  Rather than walking these
+    references one member at a time, all the preference rows are joined
+    together in a single query.
+
+    :param store: The Storm store.
+    :param members: The members to calculate delivery records for.
+    :type members: A Storm result set of `Member`
+    :param emails: Optional email addresses to restrict the results to.
+    :type emails: sequence of text
+    :return: The delivery records.
+    :rtype: list of `DeliveryRecord`
+    """
+    (tables, member_user, member_preferences, address_preferences,
+     user_preferences) = _member_join()
+    columns = [Address.email, Address._original]
+    for name in DELIVERY_PREFERENCES:
+        columns.extend((getattr(member_preferences, name),
+                        getattr(address_preferences, name),
+                        getattr(user_preferences, name)))
+    conditions = [Member.id.is_in(members.get_select_expr(Member.id))]
+    if emails is not None:
+        conditions.append(Address.email.is_in(list(emails)))
+    results = store.using(*tables).find(tuple(columns), *conditions)
+    records = []
+    for row in results:
+        email, original = row[:2]
+        values = []
+        for index, name in enumerate(DELIVERY_PREFERENCES):
+            # The first non-None of the member, address, and user values.
+            for value in row[2 + 3 * index:5 + 3 * index]:
+                if value is not None:
+                    break
+            else:
+                value = getattr(system_preferences, name)
+            values.append(value)
+        records.append(DeliveryRecord(
+            email, (email if original is None else original), *values))
+    return records
+
+
+
+class MemberMap(Mapping):
+    """Members by email address, as returned by `IRoster.get_members()`.
+
+    Storm only keeps a limited number of objects in its cache, so this also
+    holds on to each member's address, user and preferences, which were
+    loaded along with the member.
+    """
+
+    def __init__(self):
+        self._members = {}
+        self._loaded = []
+
+    def add(self, row):
+        """Add a member, along with the objects loaded with it.
+
+        :param row: The member, followed by the other loaded objects, the
+            member's address being the third.
+        :type row: tuple
+        """
+        member, address = row[0], row[2]
+        self._members.setdefault(address.email, member)
+        self._loaded.append(row)
+
+    def __getitem__(self, email):
+        return self._members[email]
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+
+
+def _get_members(store, members, emails):
+    """Load the members subscribed with any of the given email addresses.
+
+    Along with the members, their addresses, users and preferences are loaded
+    by the same query, so that looking up the members' preferences, names
+    and addresses doesn't have to go back to the database.
+
+    :param store: The Storm store.
+    :param members: The members to search.
+    :type members: A Storm result set of `Member`
+    :param emails: The email addresses to search for.
+    :type emails: sequence of text
+    :return: The members, keyed by their email address.
+    :rtype: `MemberMap`
+    """
+    # Import this here to avoid circular imports.
+    from mailman.model.user import User
+    (tables, member_user, member_preferences, address_preferences,
+     user_preferences) = _member_join()
+    columns = (Member, member_user, Address, member_preferences,
+               address_preferences, User, user_preferences)
+    results = MemberMap()
+    emails = list(emails)
+    for start in range(0, len(emails), EMAILS_PER_QUERY):
+        rows = store.using(*tables).find(
+            columns,
+            Member.id.is_in(members.get_select_expr(Member.id)),
+            Address.email.is_in(emails[start:start + EMAILS_PER_QUERY]))
+        for row in rows:
+            results.add(row)
+    return results
 
 
 
@@ -119,6 +280,16 @@ class AbstractRoster:
                 'Too many matching member results: {0}'.format(
                     results.count()))
 
+    @dbconnection
+    def get_members(self, store, emails):
+        """See `IRoster`."""
+        return _get_members(store, self._query(), emails)
+
+    @dbconnection
+    def get_delivery_records(self, store, emails=None):
+        """See `IRoster`."""
+        return _get_delivery_records(store, self._query(), emails)
+
 
 
 class MemberRoster(AbstractRoster):
@@ -189,16 +360,32 @@ class AdministratorRoster(AbstractRoster):
 class DeliveryMemberRoster(AbstractRoster):
     """Return all the members having a particular kind of delivery."""
 
+    # The delivery modes of the members in this roster.
+    delivery_modes = ()
+
     @property
     def member_count(self):
         """See `IRoster`."""
-        # XXX 2012-03-15 BAW: It would be nice to make this more efficient.
-        # The problem is that you'd have to change the loop in _get_members()
-        # checking the delivery mode to a query parameter.
-        return len(tuple(self.members))
+        # The effective delivery mode can come from any of the member's
+        # preferences, so it can't easily be turned into a query parameter.
+        # The delivery records at least resolve them all in a single query.
+        return len(self.get_delivery_records())
 
     @dbconnection
-    def _get_members(self, store, *delivery_modes):
+    def _query(self, store):
+        return store.find(
+            Member,
+            And(Member.mailing_list == self._mlist.fqdn_listname,
+                Member.role == MemberRole.member))
+
+    def get_delivery_records(self, emails=None):
+        """See `IRoster`."""
+        records = super(DeliveryMemberRoster, self).get_delivery_records(
+            emails)
+        return [record for record in records
+                if record.delivery_mode in self.delivery_modes]
+
+    def _get_members(self, *delivery_modes):
         """The set of members for a mailing list, filter by delivery mode.
 
         :param delivery_modes: The modes to filter on.
@@ -206,11 +393,7 @@ class DeliveryMemberRoster(AbstractRoster):
         :return: A generator of members.
         :rtype: generator
         """
-        results = store.find(
-            Member,
-            And(Member.mailing_list == self._mlist.fqdn_listname,
-                Member.role == MemberRole.member))
-        for member in results:
+        for member in self._query():
             if member.delivery_mode in delivery_modes:
                 yield member
 
@@ -219,11 +402,12 @@ class RegularMemberRoster(DeliveryMemberRoster):
     """Return all the regular delivery members of a list."""
 
     name = 'regular_members'
+    delivery_modes = (DeliveryMode.regular,)
 
     @property
     def members(self):
         """See `IRoster`."""
-        for member in self._get_members(DeliveryMode.regular):
+        for member in self._get_members(*self.delivery_modes):
             yield member
 
 
@@ -232,13 +416,14 @@ class DigestMemberRoster(DeliveryMemberRoster):
     """Return all the regular delivery members of a list."""
 
     name = 'digest_members'
+    delivery_modes = (DeliveryMode.plaintext_digests,
+                      DeliveryMode.mime_digests,
+                      DeliveryMode.summary_digests)
 
     @property
     def members(self):
         """See `IRoster`."""
-        for member in self._get_members(DeliveryMode.plaintext_digests,
-                                        DeliveryMode.mime_digests,
-                                        DeliveryMode.summary_digests):
+        for member in self._get_members(*self.delivery_modes):
             yield member
 
 
@@ -309,3 +494,13 @@ class Memberships:
             raise AssertionError(
                 'Too many matching member results: {0}'.format(
                     results.count()))
+
+    @dbconnection
+    def get_members(self, store, emails):
+        """See `IRoster`."""
+        return _get_members(store, self._query(), emails)
+
+    @dbconnection
+    def get_delivery_records(self, store, emails=None):
+        """See `IRoster`."""
+        return _get_delivery_records(store, self._query(), emails)
@@ -21,6 +21,8 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestBounceEvents',
+    'TestBounceProcessing',
     ]
 
 
@@ -30,11 +32,18 @@ from datetime import datetime
 from zope.component import getUtility
 
 from mailman.app.lifecycle import create_list
+from mailman.config import config
 from mailman.database.transaction import transaction
 from mailman.interfaces.bounce import BounceContext, IBounceProcessor
+from mailman.interfaces.member import DeliveryStatus
+from mailman.interfaces.usermanager import IUserManager
 from mailman.testing.helpers import (
+    configuration,
+    get_queue_messages,
+    query_counter,
     specialized_message_from_string as message_from_string)
 from mailman.testing.layers import ConfigLayer
+from mailman.utilities.datetime import now
 
 
 
@@ -98,3 +107,138 @@ Message-Id: <first>
         # Now there will be no unprocessed events.
         unprocessed = list(self._processor.unprocessed)
         self.assertEqual(len(unprocessed), 0)
+
+
+
+
+class TestBounceProcessing(unittest.TestCase):
+    """Test the scoring of bounce events."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._processor = getUtility(IBounceProcessor)
+        self._mlist = create_list('test@example.com')
+        self._mlist.bounce_score_threshold = 5
+        self._user_manager = getUtility(IUserManager)
+        self._anne = self._subscribe('anne@example.com')
+        self._bart = self._subscribe('bart@example.com')
+        self._msg = message_from_string("""\
+From: mail-daemon@example.com
+To: test-bounces@example.com
+Message-Id: <first>
+
+""")
+
+    def _subscribe(self, email):
+        address = self._user_manager.create_address(email)
+        return self._mlist.subscribe(address)
+
+    def _register(self, email, count=1, context=None):
+        with transaction():
+            for i in range(count):
+                self._processor.register(
+                    self._mlist, email, self._msg, context)
+
+    def test_score(self):
+        self._register('anne@example.com', 3)
+        self._register('bart@example.com')
+        # Cris is not a member.
+        self._register('cris@example.com')
+        self.assertEqual(self._processor.process(), 5)
+        self.assertEqual(self._anne.bounce_score, 3)
+        self.assertEqual(self._anne.last_bounce_received,
+                         datetime(2005, 8, 1, 7, 49, 23))
+        self.assertEqual(self._bart.bounce_score, 1)
+        self.assertEqual(self._anne.delivery_status, DeliveryStatus.enabled)
+        self.assertEqual(list(self._processor.unprocessed), [])
+        # There's nothing left to do.
+        self.assertEqual(self._processor.process(), 0)
+        # Scores accumulate over batches.
+        self._register('anne@example.com')
+        self.assertEqual(self._processor.process(), 1)
+        self.assertEqual(self._anne.bounce_score, 4)
+
+    def test_limit(self):
+        self._register('anne@example.com', 5)
+        self._mlist.bounce_score_threshold = 10
+        self.assertEqual(self._processor.process(2), 2)
+        self.assertEqual(self._anne.bounce_score, 2)
+        self.assertEqual(len(list(self._processor.unprocessed)), 3)
+        self.assertEqual(self._processor.process(10), 3)
+        self.assertEqual(self._anne.bounce_score, 5)
+
+    def test_user_subscription(self):
+        # Members subscribed through their user bounce at the user's
+        # preferred address.
+        user = self._user_manager.create_user('cris@example.com')
+        address = list(user.addresses)[0]
+        address.verified_on = now()
+        user.preferred_address = address
+        cris = self._mlist.subscribe(user)
+        self._register('cris@example.com', 2)
+        self._processor.process()
+        self.assertEqual(cris.bounce_score, 2)
+
+    def test_threshold_disables_delivery(self):
+        self._register('anne@example.com', 5)
+        self._register('bart@example.com', 4)
+        self._processor.process()
+        self.assertEqual(self._anne.delivery_status,
+                         DeliveryStatus.by_bounces)
+        # The score starts over.
+        self.assertEqual(self._anne.bounce_score, 0)
+        self.assertEqual(self._bart.delivery_status, DeliveryStatus.enabled)
+        self.assertEqual(self._bart.bounce_score, 4)
+        self.assertEqual(len(get_queue_messages('virgin')), 0)
+
+    @configuration('mta', verp_probes='yes')
+    def test_threshold_sends_probe(self):
+        self._register('anne@example.com', 5)
+        self._processor.process()
+        self.assertEqual(self._anne.delivery_status, DeliveryStatus.enabled)
+        self.assertEqual(self._anne.bounce_score, 0)
+        messages = get_queue_messages('virgin')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msgdata['recipients'],
+                         set(['anne@example.com']))
+        self.assertIsNotNone(messages[0].msgdata['probe_token'])
+        # Without the bouncing message, only the probe text is included.
+        self.assertEqual(len(messages[0].msg.get_payload()), 1)
+
+    def test_probe_bounce_disables_delivery(self):
+        self._register('anne@example.com', context=BounceContext.probe)
+        self._processor.process()
+        self.assertEqual(self._anne.delivery_status,
+                         DeliveryStatus.by_bounces)
+        self.assertEqual(self._bart.delivery_status, DeliveryStatus.enabled)
+
+    def test_disabled_members_leave_cached_recipients(self):
+        # Disabling delivery invalidates the mailing list's cached
+        # recipients.
+        handler = config.handlers['member-recipients']
+        recipients, not_own_postings = handler._get_recipients(self._mlist)
+        self.assertEqual(recipients,
+                         set(['anne@example.com', 'bart@example.com']))
+        self._register('anne@example.com', 5)
+        self._register('bart@example.com', context=BounceContext.probe)
+        self._processor.process()
+        recipients, not_own_postings = handler._get_recipients(self._mlist)
+        self.assertEqual(recipients, set())
+
+    def _count_queries(self, name, members):
+        for i in range(members):
+            email = '{0}{1}@example.com'.format(name, i)
+            self._subscribe(email)
+            self._register(email, 2)
+        config.db.store.flush()
+        with query_counter() as counter:
+            self._processor.process()
+            config.db.store.flush()
+        return counter.count
+
+    def test_constant_queries(self):
+        # The number of statements doesn't depend on the number of events or
+        # bouncing members.
+        count = self._count_queries('few', 2)
+        self.assertEqual(self._count_queries('many', 20), count)
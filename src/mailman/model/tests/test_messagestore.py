@@ -0,0 +1,228 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the packed message store format."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestPackedMessageStore',
+    ]
+
+
+import os
+import mock
+import time
+import zlib
+import unittest
+
+from zope.component import getUtility
+
+from mailman.config import config
+from mailman.interfaces.messages import IMessageStore
+from mailman.model.message import Message
+from mailman.testing.helpers import specialized_message_from_string as mfs
+from mailman.testing.layers import ConfigLayer
+
+
+
+class TestPackedMessageStore(unittest.TestCase):
+    """Test the packed message store format."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        config.push('packed', """
+        [messages]
+        store_format: packed
+        """)
+        self._store = getUtility(IMessageStore)
+        self._packs_dir = os.path.join(config.MESSAGES_DIR, 'packs')
+
+    def tearDown(self):
+        config.pop('packed')
+
+    def _message(self, message_id):
+        return mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: A message
+Message-ID: {0}
+
+From the body of a message.
+""".format(message_id))
+
+    def _packs(self):
+        return sorted(os.listdir(self._packs_dir))
+
+    def test_add_and_get(self):
+        msg = self._message('<ant>')
+        hash32 = self._store.add(msg)
+        self.assertEqual(self._packs(), ['00000001.pack'])
+        found = self._store.get_message_by_id('<ant>')
+        self.assertEqual(found.as_string(), msg.as_string())
+        self.assertEqual(found['x-message-id-hash'], hash32)
+        found = self._store.get_message_by_hash(hash32)
+        self.assertEqual(found.as_string(), msg.as_string())
+        # No pickle file is written.
+        self.assertFalse(os.path.exists(os.path.join(
+            config.MESSAGES_DIR, hash32[0:2], hash32[2:4], hash32)))
+
+    def test_headers_only(self):
+        self._store.add(self._message('<ant>'))
+        found = self._store.get_message_by_id('<ant>', headers_only=True)
+        self.assertEqual(found['subject'], 'A message')
+        self.assertEqual(found.get_payload(), '')
+
+    def test_headers_only_skips_body(self):
+        # Only the headers are read and decompressed.
+        self._store.add(self._message('<ant>'))
+        path = os.path.join(self._packs_dir, '00000001.pack')
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        # Pack paths end in :<offset>:<header size>:<body size>.
+        relpath = config.db.store.find(Message).one().path
+        header_size = int(relpath.split(b':')[-2])
+        with open(path, 'wb') as fp:
+            fp.write(data[:header_size] + b'garbage')
+        found = self._store.get_message_by_id('<ant>', headers_only=True)
+        self.assertEqual(found['message-id'], '<ant>')
+        self.assertEqual(found['subject'], 'A message')
+        self.assertRaises(zlib.error, self._store.get_message_by_id, '<ant>')
+
+    def test_current_pack_tracked(self):
+        # The packs directory is only listed for the first message.
+        self._store.add(self._message('<ant>'))
+        with mock.patch('os.listdir', side_effect=os.listdir) as listdir:
+            self._store.add(self._message('<bee>'))
+        self.assertFalse(listdir.called)
+        self.assertEqual(self._packs(), ['00000001.pack'])
+        found = self._store.get_message_by_id('<bee>')
+        self.assertEqual(found['message-id'], '<bee>')
+
+    def test_removed_pack(self):
+        # When the current pack file has been removed, the newest one is
+        # looked for again.
+        self._store.add(self._message('<ant>'))
+        self._store.delete_message('<ant>')
+        os.remove(os.path.join(self._packs_dir, '00000001.pack'))
+        self._store.add(self._message('<bee>'))
+        self.assertEqual(self._packs(), ['00000001.pack'])
+        found = self._store.get_message_by_id('<bee>')
+        self.assertEqual(found['message-id'], '<bee>')
+
+    def test_compression(self):
+        self._store.add(self._message('<ant>'))
+        with open(os.path.join(self._packs_dir, '00000001.pack')) as fp:
+            self.assertNotIn(b'From the body', fp.read())
+        config.push('uncompressed', """
+        [messages]
+        compression: none
+        """)
+        try:
+            self._store.add(self._message('<bee>'))
+        finally:
+            config.pop('uncompressed')
+        with open(os.path.join(self._packs_dir, '00000001.pack')) as fp:
+            self.assertIn(b'From the body', fp.read())
+        # Both messages can be read back.
+        for message_id in ('<ant>', '<bee>'):
+            found = self._store.get_message_by_id(message_id)
+            self.assertEqual(found['message-id'], message_id)
+            self.assertEqual(found.get_payload(),
+                             'From the body of a message.\n')
+
+    def test_pickled_messages(self):
+        # Messages stored in the pickle format can still be read.
+        config.push('pickled', """
+        [messages]
+        store_format: pickle
+        """)
+        try:
+            self._store.add(self._message('<ant>'))
+        finally:
+            config.pop('pickled')
+        self._store.add(self._message('<bee>'))
+        self.assertEqual(list(self._store.pickled_message_ids), ['<ant>'])
+        self.assertEqual(
+            sorted(message['message-id']
+                   for message in self._store.messages),
+            ['<ant>', '<bee>'])
+        found = self._store.get_message_by_id('<ant>', headers_only=True)
+        self.assertEqual(found['subject'], 'A message')
+
+    def test_pack_message(self):
+        config.push('pickled', """
+        [messages]
+        store_format: pickle
+        """)
+        try:
+            msg = self._message('<ant>')
+            self._store.add(msg)
+        finally:
+            config.pop('pickled')
+        path = self._store.pack_message('<ant>')
+        # The pickle file is left for the caller to remove.
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(list(self._store.pickled_message_ids), [])
+        os.remove(path)
+        found = self._store.get_message_by_id('<ant>')
+        self.assertEqual(found.as_string(), msg.as_string())
+
+    def test_pack_rotation(self):
+        config.push('small packs', """
+        [messages]
+        max_pack_size: 0
+        """)
+        try:
+            for message_id in ('<ant>', '<bee>', '<cat>'):
+                self._store.add(self._message(message_id))
+        finally:
+            config.pop('small packs')
+        self.assertEqual(self._packs(), [
+            '00000001.pack', '00000002.pack', '00000003.pack'])
+        found = self._store.get_message_by_id('<bee>')
+        self.assertEqual(found['message-id'], '<bee>')
+
+    def test_remove_empty_packs(self):
+        config.push('small packs', """
+        [messages]
+        max_pack_size: 0
+        """)
+        try:
+            for message_id in ('<ant>', '<bee>', '<cat>', '<dog>'):
+                self._store.add(self._message(message_id))
+        finally:
+            config.pop('small packs')
+        for message_id in ('<ant>', '<bee>', '<dog>'):
+            self._store.delete_message(message_id)
+        # Deleting messages leaves their pack files alone.
+        self.assertEqual(len(self._packs()), 4)
+        # Recently written pack files are kept.
+        self.assertEqual(self._store.remove_empty_packs(), [])
+        an_hour_ago = time.time() - 3601
+        for name in self._packs():
+            path = os.path.join(self._packs_dir, name)
+            os.utime(path, (an_hour_ago, an_hour_ago))
+        # The newest pack file is always kept, as are pack files which still
+        # hold messages.
+        self.assertEqual(self._store.remove_empty_packs(),
+                         ['00000001.pack', '00000002.pack'])
+        self.assertEqual(self._packs(), ['00000003.pack', '00000004.pack'])
+        found = self._store.get_message_by_id('<cat>')
+        self.assertEqual(found['message-id'], '<cat>')
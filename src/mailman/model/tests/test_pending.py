@@ -0,0 +1,189 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test pendings."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestJSONPendings',
+    'TestPendings',
+    ]
+
+
+import unittest
+
+from datetime import timedelta
+from zope.component import getUtility
+from zope.interface import implementer
+
+from mailman.config import config
+from mailman.interfaces.pending import IPendable, IPendings
+from mailman.model.pending import Pended, PendedKeyValue
+from mailman.testing.helpers import configuration, query_counter
+from mailman.testing.layers import ConfigLayer
+from mailman.utilities.datetime import now
+
+
+
+@implementer(IPendable)
+class SimplePendable(dict):
+    pass
+
+
+
+class TestPendings(unittest.TestCase):
+    """Test pendings."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._pendings = getUtility(IPendings)
+
+    def _add(self, count, lifetime=None):
+        return [self._pendings.add(
+                    SimplePendable(type='test', number=i, email='anne'),
+                    lifetime)
+                for i in range(count)]
+
+    def test_evict(self):
+        expired = self._add(5, timedelta(days=-1))
+        live = self._add(2)
+        self.assertEqual(self._pendings.evict(), 5)
+        for token in expired:
+            self.assertIsNone(self._pendings.confirm(token, expunge=False))
+        for token in live:
+            self.assertIsNotNone(self._pendings.confirm(token, expunge=False))
+        # The expired pendings' key/value pairs are gone too.
+        store = config.db.store
+        self.assertEqual(store.find(Pended).count(), 2)
+        self.assertEqual(store.find(PendedKeyValue).count(), 6)
+        self.assertEqual(self._pendings.evict(), 0)
+
+    def test_evict_limit(self):
+        self._add(5, timedelta(days=-1))
+        self.assertEqual(self._pendings.evict(2), 2)
+        self.assertEqual(self._pendings.evict(2), 2)
+        self.assertEqual(self._pendings.evict(2), 1)
+        self.assertEqual(self._pendings.evict(2), 0)
+        self.assertTrue(config.db.store.find(PendedKeyValue).is_empty())
+
+    def test_evict_is_set_based(self):
+        self._add(20, timedelta(days=-1))
+        config.db.store.flush()
+        with query_counter() as counter:
+            self._pendings.evict()
+        # One query to find the expired pendings, and one delete each for
+        # them and for their key/value pairs.
+        self.assertEqual(counter.count, 3)
+
+    def test_evict_many(self):
+        # More expired pendings than a single statement can have parameters
+        # for are evicted in batches.
+        store = config.db.store
+        yesterday = now() - timedelta(days=1)
+        for i in range(1200):
+            store.add(Pended(b'token{0}'.format(i), yesterday))
+        store.flush()
+        with query_counter() as counter:
+            self.assertEqual(self._pendings.evict(), 1200)
+        self.assertEqual(counter.count, 1 + 2 * 3)
+        self.assertTrue(store.find(Pended).is_empty())
+
+    def test_confirm_single_query(self):
+        token = self._add(1)[0]
+        config.db.store.flush()
+        config.db.store.invalidate()
+        with query_counter() as counter:
+            pendable = self._pendings.confirm(token, expunge=False)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual(pendable, dict(type='test', number=0, email='anne'))
+
+    def test_confirm_expunge(self):
+        token = self._add(1)[0]
+        pendable = self._pendings.confirm(token)
+        self.assertEqual(pendable['number'], 0)
+        self.assertIsNone(self._pendings.confirm(token))
+        self.assertTrue(config.db.store.find(PendedKeyValue).is_empty())
+
+    def test_confirm_empty_pendable(self):
+        token = self._pendings.add(SimplePendable())
+        self.assertEqual(self._pendings.confirm(token), {})
+        self.assertIsNone(self._pendings.confirm(token))
+
+
+
+class TestJSONPendings(unittest.TestCase):
+    """Test pendings stored in json format."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._pendings = getUtility(IPendings)
+
+    @configuration('mailman', pending_format='json')
+    def test_types(self):
+        pendable = SimplePendable(
+            bytes=b'caf\xc3\xa9', text='\u263a', int=7, float=1.5,
+            bool=True, none=None, list=['a', 'b'], tuple=(1, 'two'),
+            set=set(['x', 'y']), dict=dict(nested=[(1, 2)]))
+        token = self._pendings.add(pendable)
+        self.assertEqual(self._pendings.confirm(token), dict(
+            bytes='caf\xe9', text='\u263a', int=7, float=1.5, bool=True,
+            none=None, list=['a', 'b'], tuple=(1, 'two'),
+            set=set(['x', 'y']), dict=dict(nested=[(1, 2)])))
+
+    def _add(self, size):
+        # Return the token and the number of statements needed to add a
+        # pendable with the given number of items.
+        pendable = SimplePendable(('key{0}'.format(i), 'value')
+                                  for i in range(size))
+        config.db.store.flush()
+        with query_counter() as counter:
+            token = self._pendings.add(pendable)
+            config.db.store.flush()
+        return token, counter.count
+
+    @configuration('mailman', pending_format='json')
+    def test_single_row(self):
+        token, count = self._add(12)
+        self.assertEqual(config.db.store.find(PendedKeyValue).count(), 1)
+        self.assertEqual(len(self._pendings.confirm(token)), 12)
+        # Adding more items doesn't take more statements.
+        self.assertEqual(self._add(1)[1], count)
+
+    def test_mixed_formats(self):
+        # Pendings stored in either format can be confirmed in either.
+        pendable = SimplePendable(type='test', number=3, names=['a', 'b'])
+        keyvalue_token = self._pendings.add(pendable)
+        with configuration('mailman', pending_format='json'):
+            json_token = self._pendings.add(pendable)
+            self.assertEqual(
+                self._pendings.confirm(keyvalue_token, expunge=False),
+                pendable)
+        self.assertEqual(self._pendings.confirm(json_token), pendable)
+        self.assertEqual(self._pendings.confirm(keyvalue_token), pendable)
+        self.assertTrue(config.db.store.find(PendedKeyValue).is_empty())
+
+    @configuration('mailman', pending_format='json')
+    def test_evict(self):
+        token = self._pendings.add(SimplePendable(type='test'),
+                                   timedelta(days=-1))
+        self.assertEqual(self._pendings.evict(), 1)
+        self.assertIsNone(self._pendings.confirm(token))
+        self.assertTrue(config.db.store.find(PendedKeyValue).is_empty())
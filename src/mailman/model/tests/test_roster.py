@@ -21,6 +21,7 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestDeliveryRecords',
     'TestMailingListRoster',
     'TestMembershipsRoster',
     ]
@@ -31,8 +32,10 @@ import unittest
 from zope.component import getUtility
 
 from mailman.app.lifecycle import create_list
-from mailman.interfaces.member import DeliveryMode, MemberRole
+from mailman.interfaces.member import (
+    DeliveryMode, DeliveryStatus, MemberRole)
 from mailman.interfaces.usermanager import IUserManager
+from mailman.testing.helpers import query_counter
 from mailman.testing.layers import ConfigLayer
 from mailman.utilities.datetime import now
 
@@ -154,3 +157,156 @@ class TestMembershipsRoster(unittest.TestCase):
         self._ant.subscribe(self._anne)
         self._bee.subscribe(self._anne)
         self.assertEqual(self._anne.memberships.member_count, 2)
+
+
+
+
+class TestDeliveryRecords(unittest.TestCase):
+    """Test the bulk delivery records of a roster."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._user_manager = getUtility(IUserManager)
+
+    def _subscribe(self, count, start=0):
+        for i in range(start, start + count):
+            address = self._user_manager.create_address(
+                'Person{0}@example.com'.format(i))
+            self._mlist.subscribe(address)
+
+    def test_no_members(self):
+        self.assertEqual(self._mlist.members.get_delivery_records(), [])
+
+    def test_system_preferences(self):
+        # Without any explicit preferences, the system defaults are used.
+        anne = self._user_manager.create_address('Anne@example.com')
+        self._mlist.subscribe(anne)
+        records = self._mlist.members.get_delivery_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].email, 'anne@example.com')
+        self.assertEqual(records[0].original_email, 'Anne@example.com')
+        self.assertEqual(records[0].delivery_mode, DeliveryMode.regular)
+        self.assertEqual(records[0].delivery_status, DeliveryStatus.enabled)
+        self.assertTrue(records[0].receive_own_postings)
+        self.assertTrue(records[0].receive_list_copy)
+
+    def test_preference_precedence(self):
+        # Member preferences override address preferences, which override
+        # user preferences.
+        user = self._user_manager.create_user('anne@example.com')
+        anne = list(user.addresses)[0]
+        user.preferences.delivery_status = DeliveryStatus.by_user
+        user.preferences.receive_own_postings = False
+        anne.preferences.delivery_status = DeliveryStatus.by_moderator
+        member = self._mlist.subscribe(anne)
+        member.preferences.delivery_mode = DeliveryMode.mime_digests
+        records = self._mlist.members.get_delivery_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].delivery_mode, DeliveryMode.mime_digests)
+        self.assertEqual(records[0].delivery_status,
+                         DeliveryStatus.by_moderator)
+        self.assertFalse(records[0].receive_own_postings)
+        self.assertTrue(records[0].receive_list_copy)
+        # The records agree with the member's own preference lookups.
+        self.assertEqual(member.delivery_mode, records[0].delivery_mode)
+        self.assertEqual(member.delivery_status, records[0].delivery_status)
+        self.assertEqual(member.receive_own_postings,
+                         records[0].receive_own_postings)
+
+    def test_user_subscription(self):
+        # A user subscribed directly gets delivery to their preferred address.
+        user = self._user_manager.create_user('anne@example.com')
+        preferred = list(user.addresses)[0]
+        preferred.verified_on = now()
+        user.preferred_address = preferred
+        self._mlist.subscribe(user)
+        records = self._mlist.members.get_delivery_records()
+        self.assertEqual([record.email for record in records],
+                         ['anne@example.com'])
+
+    def test_delivery_mode_rosters(self):
+        self._subscribe(3)
+        member = self._mlist.members.get_member('person1@example.com')
+        member.preferences.delivery_mode = DeliveryMode.plaintext_digests
+        self.assertEqual(
+            sorted(record.email for record in
+                   self._mlist.regular_members.get_delivery_records()),
+            ['person0@example.com', 'person2@example.com'])
+        self.assertEqual(
+            [record.email for record in
+             self._mlist.digest_members.get_delivery_records()],
+            ['person1@example.com'])
+
+    def test_restrict_emails(self):
+        self._subscribe(3)
+        records = self._mlist.members.get_delivery_records(
+            ['person1@example.com', 'nobody@example.com'])
+        self.assertEqual([record.email for record in records],
+                         ['person1@example.com'])
+
+    def test_role(self):
+        # Only the members with the roster's role are included.
+        self._subscribe(1)
+        anne = self._user_manager.create_address('anne@example.com')
+        self._mlist.subscribe(anne, MemberRole.owner)
+        self.assertEqual(
+            [record.email for record in
+             self._mlist.owners.get_delivery_records()],
+            ['anne@example.com'])
+
+    def test_query_count(self):
+        # The number of queries does not depend on the size of the roster.
+        self._subscribe(2)
+        with query_counter() as small:
+            self._mlist.regular_members.get_delivery_records()
+        self._subscribe(20, start=2)
+        with query_counter() as large:
+            records = self._mlist.regular_members.get_delivery_records()
+        self.assertEqual(len(records), 22)
+        self.assertEqual(small.count, large.count)
+
+    def test_get_members(self):
+        self._subscribe(3)
+        members = self._mlist.members.get_members(
+            ['person1@example.com', 'person2@example.com',
+             'nobody@example.com'])
+        self.assertEqual(len(members), 2)
+        self.assertEqual(sorted(members),
+                         ['person1@example.com', 'person2@example.com'])
+        self.assertNotIn('nobody@example.com', members)
+        self.assertEqual(
+            members['person1@example.com'],
+            self._mlist.members.get_member('person1@example.com'))
+
+    def test_get_members_user_subscription(self):
+        user = self._user_manager.create_user('anne@example.com')
+        preferred = list(user.addresses)[0]
+        preferred.verified_on = now()
+        user.preferred_address = preferred
+        member = self._mlist.subscribe(user)
+        members = self._mlist.members.get_members(['anne@example.com'])
+        self.assertEqual(members, {'anne@example.com': member})
+
+    def test_get_members_preloads(self):
+        # The members' addresses, users and preferences come along with the
+        # members, so looking up their preferences doesn't hit the database.
+        user = self._user_manager.create_user('anne@example.com', 'Anne')
+        self._mlist.subscribe(list(user.addresses)[0])
+        self._subscribe(2)
+        emails = ['anne@example.com', 'person0@example.com',
+                  'person1@example.com']
+        with query_counter() as counter:
+            members = self._mlist.members.get_members(emails)
+            queries = counter.count
+            for email in emails:
+                member = members[email]
+                member.address.original_email
+                member.preferred_language
+                member.delivery_mode
+                if member.user is not None:
+                    member.user.display_name
+        self.assertEqual(counter.count, queries)
+        self.assertEqual(members['anne@example.com'].user.display_name,
+                         'Anne')
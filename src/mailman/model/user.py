@@ -35,7 +35,8 @@ from mailman.database.transaction import dbconnection
 from mailman.interfaces.address import (
     AddressAlreadyLinkedError, AddressNotLinkedError)
 from mailman.interfaces.user import (
-    IUser, PasswordChangeEvent, UnverifiedAddressError)
+    AddressLinkChangeEvent, IUser, PasswordChangeEvent,
+    PreferredAddressChangeEvent, UnverifiedAddressError)
 from mailman.model.address import Address
 from mailman.model.preferences import Preferences
 from mailman.model.roster import Memberships
@@ -104,12 +105,14 @@ class User(Model):
         if address.user is not None:
             raise AddressAlreadyLinkedError(address)
         address.user = self
+        notify(AddressLinkChangeEvent(self, address))
 
     def unlink(self, address):
         """See `IUser`."""
         if address.user is None:
             raise AddressNotLinkedError(address)
         address.user = None
+        notify(AddressLinkChangeEvent(self, address))
 
     @property
     def preferred_address(self):
@@ -129,11 +132,13 @@ class User(Model):
         elif address.user != self:
             raise AddressAlreadyLinkedError(address)
         self._preferred_address = address
+        notify(PreferredAddressChangeEvent(self))
 
     @preferred_address.deleter
     def preferred_address(self):
         """See `IUser`."""
         self._preferred_address = None
+        notify(PreferredAddressChangeEvent(self))
 
     @dbconnection
     def controls(self, store, email):
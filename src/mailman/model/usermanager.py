@@ -25,10 +25,13 @@ __all__ = [
     ]
 
 
+from zope.event import notify
 from zope.interface import implementer
 
 from mailman.database.transaction import dbconnection
-from mailman.interfaces.address import ExistingAddressError
+from mailman.interfaces.address import (
+    AddressDeletingEvent, ExistingAddressError)
+from mailman.interfaces.user import UserDeletingEvent
 from mailman.interfaces.usermanager import IUserManager
 from mailman.model.address import Address
 from mailman.model.member import Member
@@ -52,6 +55,7 @@ class UserManager:
     @dbconnection
     def delete_user(self, store, user):
         """See `IUserManager`."""
+        notify(UserDeletingEvent(user))
         store.remove(user)
 
     @dbconnection
@@ -99,6 +103,7 @@ class UserManager:
         """See `IUserManager`."""
         # If there's a user controlling this address, it has to first be
         # unlinked before the address can be deleted.
+        notify(AddressDeletingEvent(address))
         if address.user:
             address.user.unlink(address)
         store.remove(address)
@@ -35,25 +35,50 @@ from zope.interface import implementer
 
 from mailman.config import config
 from mailman.interfaces.mta import IMailTransportAgentDelivery
-from mailman.mta.connection import Connection
+from mailman.mta.connection import make_pool
+from mailman.mta.renderer import PersonalizedRenderer
 
 
 log = logging.getLogger('mailman.smtp')
 
 
+
+def _is_dropped(error):
+    """Whether an SMTP error means that the connection was dropped."""
+    if isinstance(error, (socket.error, smtplib.SMTPServerDisconnected)):
+        return True
+    # 421 is the server's way of saying that it is closing the connection.
+    return (isinstance(error, smtplib.SMTPResponseException)
+            and error.smtp_code == 421)
+
+
 
 @implementer(IMailTransportAgentDelivery)
 class BaseDelivery:
     """Base delivery class."""
 
-    def __init__(self):
-        """Create a basic deliverer."""
-        username = (config.mta.smtp_user if config.mta.smtp_user else None)
-        password = (config.mta.smtp_pass if config.mta.smtp_pass else None)
-        self._connection = Connection(
-            config.mta.smtp_host, int(config.mta.smtp_port),
-            int(config.mta.max_sessions_per_connection),
-            username, password)
+    def __init__(self, pool_size=1):
+        """Create a basic deliverer.
+
+        If the outgoing runner has installed a process-wide connection pool,
+        it is used, otherwise this deliverer gets a private pool.  The private
+        pool is closed by `close()`.
+
+        :param pool_size: The number of connections the private pool holds.
+        :type pool_size: integer
+        """
+        self._private_pool = (config.smtp_pool is None)
+        self._pool = (make_pool(pool_size)
+                      if self._private_pool
+                      else config.smtp_pool)
+
+    def close(self):
+        """Close the connections of this deliverer's private pool.
+
+        The process-wide connection pool is left open.
+        """
+        if self._private_pool:
+            self._pool.close()
 
     def _deliver_to_recipients(self, mlist, msg, msgdata, recipients):
         """Low-level delivery to a set of recipients.
@@ -71,10 +96,40 @@ class BaseDelivery:
         """
         # Do the actual sending.
         sender = self._get_sender(mlist, msg, msgdata)
-        message_id = msg['message-id']
+        return self._send(
+            msg['message-id'], sender, recipients, msg.as_string())
+
+    def _send(self, message_id, sender, recipients, msgtext):
+        """Send already flattened message text to a set of recipients.
+
+        This does not touch the mailing list or the message object, so it is
+        safe to call from multiple threads at the same time.
+
+        :param message_id: The Message-ID of the message, for logging.
+        :type message_id: string
+        :param sender: The envelope sender.
+        :type sender: string
+        :param recipients: The recipients of this message.
+        :type recipients: sequence
+        :param msgtext: The flattened message.
+        :type msgtext: string
+        :return: delivery failures as defined by `smtplib.SMTP.sendmail`
+        :rtype: dictionary
+        """
         try:
-            refused = self._connection.sendmail(
-                sender, recipients, msg.as_string())
+            with self._pool.connection() as connection:
+                reused = connection.connected
+                try:
+                    refused = connection.sendmail(sender, recipients, msgtext)
+                except (socket.error, smtplib.SMTPException) as error:
+                    # The server may have dropped a pooled connection while
+                    # it sat idle.  The failed connection has been closed, so
+                    # try once more over a new one.
+                    if not reused or not _is_dropped(error):
+                        raise
+                    log.info('%s retrying on a new connection: %s',
+                             message_id, error)
+                    refused = connection.sendmail(sender, recipients, msgtext)
         except smtplib.SMTPRecipientsRefused as error:
             log.error('%s recipients refused: %s', message_id, error)
             refused = error.recipients
@@ -134,8 +189,18 @@ class IndividualDelivery(BaseDelivery):
     The core concept here is that for each recipient, the deliver() method
     iterates over the list of registered callbacks, each of which have a
     chance to modify the message before final delivery.
+
+    Copying and flattening the whole message for each recipient is expensive
+    though, so when every callback `foo` has a `template_foo` counterpart,
+    the message is instead rendered from a template by the `renderer_class`.
+    The template callbacks are called once, with the mailing list, the
+    renderer and the message metadata, and they modify the renderer's message
+    using the renderer's placeholders for the recipient-specific parts.
     """
 
+    # Set this to None to always run the callbacks for every recipient.
+    renderer_class = PersonalizedRenderer
+
     def __init__(self):
         """See `BaseDelivery`."""
         super(IndividualDelivery, self).__init__()
@@ -150,25 +215,64 @@ class IndividualDelivery(BaseDelivery):
         """
         refused = {}
         recipients = msgdata.get('recipients', set())
+        renderer = self._get_renderer(mlist, msg, msgdata)
+        # See which of the recipients are members of the mailing list, and
+        # squirrel this information away for use by other modules, such as
+        # the header/footer decorator.  The members are all loaded at once,
+        # along with everything the decorator needs to know about them.
+        members = mlist.members.get_members(recipients)
         for recipient in recipients:
             log.debug('IndividualDelivery to: %s', recipient)
-            # Make a copy of the original messages and operator on it, since
-            # we're going to munge it repeatedly for each recipient.
-            message_copy = copy.deepcopy(msg)
             msgdata_copy = msgdata.copy()
             # Squirrel the current recipient away in the message metadata.
             # That way the subclass's _get_sender() override can encode the
             # recipient address in the sender, e.g. for VERP.
             msgdata_copy['recipient'] = recipient
-            # See if the recipient is a member of the mailing list, and if so,
-            # squirrel this information away for use by other modules, such as
-            # the header/footer decorator.  XXX 2012-03-05 this is probably
-            # highly inefficient on the database.
-            member = mlist.members.get_member(recipient)
-            msgdata_copy['member'] = member
-            for callback in self.callbacks:
-                callback(mlist, message_copy, msgdata_copy)
-            status = self._deliver_to_recipients(
-                mlist, message_copy, msgdata_copy, [recipient])
+            msgdata_copy['member'] = members.get(recipient)
+            msgtext = (None if renderer is None
+                       else renderer.render(msgdata_copy))
+            if msgtext is None:
+                # Make a copy of the original messages and operator on it,
+                # since we're going to munge it repeatedly for each recipient.
+                message_copy = copy.deepcopy(msg)
+                for callback in self.callbacks:
+                    callback(mlist, message_copy, msgdata_copy)
+                status = self._deliver_to_recipients(
+                    mlist, message_copy, msgdata_copy, [recipient])
+            else:
+                sender = self._get_sender(mlist, msg, msgdata_copy)
+                status = self._send(
+                    msg['message-id'], sender, [recipient], msgtext)
             refused.update(status)
         return refused
+
+    def _get_renderer(self, mlist, msg, msgdata):
+        """Return the renderer for the recipients' copies of the message.
+
+        :param mlist: The mailing list being delivered to.
+        :type mlist: `IMailingList`
+        :param msg: The original message being delivered.
+        :type msg: `Message`
+        :param msgdata: Additional message metadata for this delivery.
+        :type msgdata: dictionary
+        :return: The compiled renderer, or None if the callbacks must be run
+            for every recipient.
+        """
+        if self.renderer_class is None:
+            return None
+        template_callbacks = []
+        for callback in self.callbacks:
+            # Only our own callbacks can have template counterparts.
+            if getattr(callback, '__self__', None) is not self:
+                return None
+            template_callback = getattr(
+                self, 'template_' + callback.__name__, None)
+            if template_callback is None:
+                return None
+            template_callbacks.append(template_callback)
+        renderer = self.renderer_class(msg)
+        # The callbacks may scribble on the message metadata.
+        msgdata = msgdata.copy()
+        for template_callback in template_callbacks:
+            template_callback(mlist, renderer, msgdata)
+        return (renderer if renderer.compile() else None)
@@ -25,6 +25,8 @@ __all__ = [
     ]
 
 
+from multiprocessing.pool import ThreadPool
+
 from mailman.mta.base import BaseDelivery
 
 
@@ -45,18 +47,27 @@ CHUNKMAP = dict(
 class BulkDelivery(BaseDelivery):
     """Deliver messages to the MSA in as few sessions as possible."""
 
-    def __init__(self, max_recipients=None):
+    def __init__(self, max_recipients=None, max_threads=None):
         """See `BaseDelivery`.
 
         :param max_recipients: The maximum number of recipients per delivery
             chunk.  None, zero or less means to group all recipients into one
             big chunk.
         :type max_recipients: integer
+        :param max_threads: The maximum number of chunks to deliver in
+            parallel, each over its own connection to the MTA.  None, zero or
+            one means to deliver the chunks one after the other.
+        :type max_threads: integer
         """
-        super(BulkDelivery, self).__init__()
         self._max_recipients = (max_recipients
                                 if max_recipients is not None
                                 else 0)
+        self._max_threads = (max_threads
+                             if max_threads is not None
+                             else 0)
+        # A private connection pool must be able to hold one connection per
+        # delivery thread.
+        super(BulkDelivery, self).__init__(max(self._max_threads, 1))
 
     def chunkify(self, recipients):
         """Split a set of recipients into chunks.
@@ -103,9 +114,35 @@ class BulkDelivery(BaseDelivery):
     def deliver(self, mlist, msg, msgdata):
         """See `IMailTransportAgentDelivery`."""
         refused = {}
-        for recipients in self.chunkify(msgdata.get('recipients', set())):
+        chunks = list(self.chunkify(msgdata.get('recipients', set())))
+        if self._max_threads > 1 and len(chunks) > 1:
+            return self._deliver_in_parallel(mlist, msg, msgdata, chunks)
+        for recipients in chunks:
             chunk_refused = self._deliver_to_recipients(
                 mlist, msg, msgdata, recipients)
             refused.update(chunk_refused)
         return refused
 
+    def _deliver_in_parallel(self, mlist, msg, msgdata, chunks):
+        """Deliver the chunks over several concurrent SMTP connections.
+
+        The envelope sender and the message text are calculated up front in
+        this thread, since neither the database nor the message object may be
+        shared across threads.  Only the SMTP transactions run in parallel.
+        """
+        sender = self._get_sender(mlist, msg, msgdata)
+        message_id = msg['message-id']
+        msgtext = msg.as_string()
+        def send(recipients):
+            return self._send(message_id, sender, recipients, msgtext)
+        threads = ThreadPool(min(self._max_threads, len(chunks)))
+        try:
+            results = threads.map(send, chunks)
+        finally:
+            threads.close()
+            threads.join()
+        refused = {}
+        for chunk_refused in results:
+            refused.update(chunk_refused)
+        return refused
+
@@ -22,13 +22,19 @@ from __future__ import absolute_import, unicode_literals
 __metaclass__ = type
 __all__ = [
     'Connection',
+    'ConnectionPool',
+    'make_pool',
     ]
 
 
+import time
+import socket
 import logging
 import smtplib
+import threading
 
-from lazr.config import as_boolean
+from contextlib import contextmanager
+from lazr.config import as_boolean, as_timedelta
 from mailman.config import config
 
 
@@ -88,7 +94,7 @@ class Connection:
             log.debug('envsender: %s, recipients: %s, size(msgtext): %s',
                       envsender, recipients, len(msgtext))
             results = self._connection.sendmail(envsender, recipients, msgtext)
-        except smtplib.SMTPException:
+        except (socket.error, smtplib.SMTPException):
             # For safety, close this connection.  The next send attempt will
             # automatically re-open it.  Pass the exception on up.
             self.quit()
@@ -102,12 +108,213 @@ class Connection:
             self.quit()
         return results
 
+    @property
+    def connected(self):
+        """True if there is a currently open connection to the server."""
+        return self._connection is not None
+
+    def noop(self):
+        """Check that the connection to the server is still alive.
+
+        A NOOP command is sent over the open connection.  If that fails for
+        any reason, the connection is closed.
+
+        :return: True if the connection is open and the server responded to
+            the NOOP, otherwise False.
+        :rtype: bool
+        """
+        if self._connection is None:
+            return False
+        try:
+            code, response = self._connection.noop()
+        except (socket.error, smtplib.SMTPException):
+            code = None
+        if code == 250:
+            return True
+        self.quit()
+        return False
+
     def quit(self):
         """Mimic `smtplib.SMTP.quit`."""
         if self._connection is None:
             return
         try:
             self._connection.quit()
-        except smtplib.SMTPException:
-            pass
+        except (socket.error, smtplib.SMTPException):
+            # The connection is probably already broken, but make sure the
+            # socket gets closed.
+            self._connection.close()
         self._connection = None
+
+
+
+class ConnectionPool:
+    """A pool of connections to the SMTP server.
+
+    Connections are checked out of the pool for each SMTP transaction and
+    returned to the pool afterward, so that later deliveries can reuse an
+    already open and authenticated connection.  The pool is thread safe.
+    """
+
+    def __init__(self, host, port, sessions_per_connection,
+                 smtp_user=None, smtp_pass=None,
+                 size=1, keepalive=None, idle_timeout=None):
+        """Create a connection pool.
+
+        :param host: The host name of the SMTP server to connect to.
+        :type host: string
+        :param port: The port number of the SMTP server to connect to.
+        :type port: integer
+        :param sessions_per_connection: The number of SMTP sessions per
+            connection.  See `Connection`.
+        :type sessions_per_connection: integer
+        :param smtp_user: Optional SMTP authentication user name.
+        :type smtp_user: str
+        :param smtp_pass: Optional SMTP authentication password.
+        :type smtp_pass: str
+        :param size: The maximum number of idle connections to keep open.
+            Connections returned to a full pool are closed.  Zero means that
+            no connections are kept.
+        :type size: integer
+        :param keepalive: The number of seconds a connection can sit idle in
+            the pool before it is checked with a NOOP on reuse.  None means
+            never check.
+        :type keepalive: float
+        :param idle_timeout: The number of seconds a connection can sit idle
+            in the pool before it is closed.  None means never close idle
+            connections.
+        :type idle_timeout: float
+        """
+        self._host = host
+        self._port = port
+        self._sessions_per_connection = sessions_per_connection
+        self._username = smtp_user
+        self._password = smtp_pass
+        self._size = size
+        self._keepalive = keepalive
+        self._idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        # Idle connections as (time of last use, Connection) 2-tuples, most
+        # recently used at the end.
+        self._idle = []
+        # Statistics.
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<ConnectionPool {0}:{1} hits: {2} misses: {3}>'.format(
+            self._host, self._port, self.hits, self.misses)
+
+    def acquire(self):
+        """Check a connection out of the pool.
+
+        An idle open connection is returned if there is one, otherwise a new
+        connection is created.  Connections which have been idle too long are
+        closed, and stale connections which fail a NOOP check are replaced.
+
+        :return: The connection.
+        :rtype: `Connection`
+        """
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    self.misses += 1
+                    break
+                last_used, connection = self._idle.pop()
+            idle_time = time.time() - last_used
+            if (self._idle_timeout is not None
+                    and idle_time > self._idle_timeout):
+                connection.quit()
+                continue
+            if (self._keepalive is not None
+                    and idle_time > self._keepalive
+                    and not connection.noop()):
+                log.debug('Discarding stale SMTP connection')
+                continue
+            with self._lock:
+                self.hits += 1
+            return connection
+        return Connection(self._host, self._port,
+                          self._sessions_per_connection,
+                          self._username, self._password)
+
+    def release(self, connection):
+        """Return a connection to the pool.
+
+        Connections that have been closed, e.g. because of an error or
+        because they reached the maximum number of sessions, are discarded.
+
+        :param connection: The connection that was checked out.
+        :type connection: `Connection`
+        """
+        if not connection.connected:
+            return
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append((time.time(), connection))
+                return
+        connection.quit()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-statement."""
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def prune(self):
+        """Close all connections which have been idle too long."""
+        if self._idle_timeout is None:
+            return
+        cutoff = time.time() - self._idle_timeout
+        with self._lock:
+            expired = [connection for last_used, connection in self._idle
+                       if last_used < cutoff]
+            self._idle = [(last_used, connection)
+                          for last_used, connection in self._idle
+                          if last_used >= cutoff]
+        for connection in expired:
+            connection.quit()
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for last_used, connection in idle:
+            connection.quit()
+
+
+
+def make_pool(size=None):
+    """Create a connection pool from the [mta] configuration section.
+
+    :param size: The maximum number of idle connections to keep open.  If
+        not given, `connection_pool_size` is used, but the pool is always big
+        enough to hold one connection for each of `max_delivery_threads`.
+    :type size: integer
+    :return: The connection pool.
+    :rtype: `ConnectionPool`
+    """
+    username = (config.mta.smtp_user if config.mta.smtp_user else None)
+    password = (config.mta.smtp_pass if config.mta.smtp_pass else None)
+    if size is None:
+        size = max(int(config.mta.connection_pool_size),
+                   int(config.mta.max_delivery_threads))
+    return ConnectionPool(
+        config.mta.smtp_host, int(config.mta.smtp_port),
+        int(config.mta.max_sessions_per_connection),
+        username, password, size,
+        _as_seconds(config.mta.connection_keepalive),
+        _as_seconds(config.mta.connection_idle_timeout))
+
+
+def _as_seconds(value):
+    """Convert a configuration time interval to seconds, or None."""
+    if not value:
+        return None
+    interval = as_timedelta(value)
+    return (86400 * interval.days + interval.seconds +
+            interval.microseconds / 1.0e6)
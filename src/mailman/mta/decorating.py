@@ -27,6 +27,8 @@ __all__ = [
 
 
 from mailman.config import config
+from mailman.handlers.decorate import (
+    MEMBER_SUBSTITUTIONS, member_substitutions)
 from mailman.mta.verp import VERPDelivery
 
 
@@ -41,6 +43,35 @@ class DecoratingMixin:
         # Do not decorate a message more than once.
         msgdata['nodecorate'] = True
 
+    def template_decorate(self, mlist, renderer, msgdata):
+        """See `decorate()`."""
+        def substitution(key):
+            def field(msgdata):
+                # Without a member, the template's placeholders would stay
+                # as they are, which the renderer can't do.
+                member = msgdata.get('member')
+                if member is None:
+                    return None
+                # All of the recipient's substitutions are calculated the
+                # first time one of them is needed.
+                substitutions = msgdata.get('member-substitutions')
+                if substitutions is None:
+                    substitutions = member_substitutions(
+                        member, msgdata['recipient'])
+                    msgdata['member-substitutions'] = substitutions
+                return substitutions[key]
+            return field
+        decoration_data = dict(
+            (key, renderer.field(substitution(key)))
+            for key in MEMBER_SUBSTITUTIONS)
+        # As in the decorate handler, explicit decoration data wins.
+        decoration_data.update(msgdata.get('decoration-data', {}))
+        template_msgdata = msgdata.copy()
+        template_msgdata['decoration-data'] = decoration_data
+        decorator = config.handlers['decorate']
+        decorator.process(mlist, renderer.msg, template_msgdata)
+        msgdata['nodecorate'] = True
+
 
 
 class DecoratingDelivery(DecoratingMixin, VERPDelivery):
@@ -81,7 +81,8 @@ def deliver(mlist, msg, msgdata):
     elif mlist.personalize != Personalization.none:
         agent = Deliver()
     else:
-        agent = BulkDelivery(int(config.mta.max_recipients))
+        agent = BulkDelivery(int(config.mta.max_recipients),
+                             int(config.mta.max_delivery_threads))
     log.debug('Using agent: %s', agent)
     # Keep track of the original recipients and the original sender for
     # logging purposes.
@@ -90,7 +91,10 @@ def deliver(mlist, msg, msgdata):
     # Let the agent attempt to deliver to the recipients.  Record all failures
     # for re-delivery later.
     t0 = time.time()
-    refused = agent.deliver(mlist, msg, msgdata)
+    try:
+        refused = agent.deliver(mlist, msg, msgdata)
+    finally:
+        agent.close()
     t1 = time.time()
     # Log this posting.
     size = getattr(msg, 'original_size', msgdata.get('original_size'))
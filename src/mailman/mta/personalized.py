@@ -54,17 +54,32 @@ class PersonalizedMixin:
         # Personalize the To header if the list requests it.
         if mlist.personalize != Personalization.full:
             return
+        msg.replace_header('To', self._personalized_to(msgdata))
+
+    def template_personalize_to(self, mlist, renderer, msgdata):
+        """See `personalize_to()`."""
+        if mlist.personalize != Personalization.full:
+            return
+        renderer.msg.replace_header(
+            'To', renderer.header(self._personalized_to))
+
+    def _personalized_to(self, msgdata):
+        """Return the personalized To header for the recipient."""
         recipient = msgdata['recipient']
-        user_manager = getUtility(IUserManager)
-        user = user_manager.get_user(recipient)
-        if user is None:
-            msg.replace_header('To', recipient)
+        # The member was subscribed with the recipient's address, so it
+        # already knows the address's user.
+        member = msgdata.get('member')
+        if member is None:
+            user = getUtility(IUserManager).get_user(recipient)
         else:
-            # Convert the unicode name to an email-safe representation.
-            # Create a Header instance for the name so that it's properly
-            # encoded for email transport.
-            name = Header(user.display_name).encode()
-            msg.replace_header('To', formataddr((name, recipient)))
+            user = member.user
+        if user is None:
+            return recipient
+        # Convert the unicode name to an email-safe representation.  Create a
+        # Header instance for the name so that it's properly encoded for
+        # email transport.
+        name = Header(user.display_name).encode()
+        return formataddr((name, recipient))
 
 
 
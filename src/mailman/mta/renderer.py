@@ -0,0 +1,206 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Template based rendering of individualized messages."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'PersonalizedRenderer',
+    ]
+
+
+import re
+import copy
+import uuid
+import email.message
+
+
+EMPTYSTRING = b''
+ENCODED_CTES = ('base64', 'quoted-printable')
+
+
+
+def _format_header(name, value):
+    # Let the email package fold and encode the header exactly like it would
+    # when flattening the whole message.
+    msg = email.message.Message()
+    msg[name] = value
+    # Drop the blank line separating the (empty) body from the headers.
+    return msg.as_string()[:-1]
+
+
+
+class PersonalizedRenderer:
+    """Render the individualized copies of a message from a single template.
+
+    Rather than copying and flattening the whole message for every recipient,
+    the message is copied and flattened once, with placeholders standing in
+    for the recipient-specific parts.  Each recipient's copy is then rendered
+    by splicing the recipient's values into the flattened template.
+
+    The placeholders are handed out by `header()` and `field()`, for use in
+    the template message, `msg`.  When a recipient's values can't be spliced
+    in safely, `render()` returns None and the caller has to build that
+    recipient's copy the slow way.
+    """
+
+    def __init__(self, msg):
+        """Create a renderer.
+
+        :param msg: The original message, which is left untouched.
+        :type msg: `Message`
+        """
+        self.msg = copy.deepcopy(msg)
+        self._token = uuid.uuid4().hex
+        self._headers = {}
+        self._fields = {}
+        self._chunks = None
+
+    def _placeholder(self, kind):
+        return '_MAILMAN_{0}{1}_{2}_'.format(
+            kind, len(self._headers) + len(self._fields), self._token)
+
+    def header(self, function):
+        """Return a placeholder for a recipient-specific header value.
+
+        The placeholder must be used as the value of exactly one of the
+        message's headers.
+
+        :param function: Called with the recipient's message metadata, it
+            returns the header value, or None to leave the header out.
+        :type function: callable
+        :return: The placeholder.
+        :rtype: string
+        """
+        placeholder = self._placeholder('H')
+        self._headers[placeholder] = function
+        return placeholder
+
+    def field(self, function):
+        """Return a placeholder for recipient-specific text in the body.
+
+        The placeholder can be used any number of times in the text of
+        unencoded body parts.
+
+        :param function: Called with the recipient's message metadata, it
+            returns the text, or None if the recipient's copy can't be
+            rendered from the template.
+        :type function: callable
+        :return: The placeholder.
+        :rtype: string
+        """
+        placeholder = self._placeholder('F')
+        self._fields[placeholder] = function
+        return placeholder
+
+    def compile(self):
+        """Flatten the template message.
+
+        :return: False if the placeholders ended up where the recipients'
+            values can't be spliced in, e.g. in base64 encoded parts or in
+            folded headers, otherwise True.
+        :rtype: bool
+        """
+        text = self.msg.as_string()
+        # Find the end of the top-level header block.
+        end = text.find(b'\n\n') + 1
+        if end == 0:
+            end = len(text)
+        slots = []
+        if len(self._headers) > 0:
+            headers = re.compile('^([^:\n]+): ({0})\n'.format('|'.join(
+                re.escape(placeholder) for placeholder in self._headers)),
+                re.MULTILINE)
+            found = []
+            for match in headers.finditer(text, 0, end):
+                name, placeholder = match.groups()
+                found.append(placeholder)
+                slots.append((match.start(), match.end(),
+                              self._header_slot(name, placeholder)))
+            if sorted(found) != sorted(self._headers):
+                return False
+        if len(self._fields) > 0:
+            fields = re.compile('|'.join(
+                re.escape(placeholder) for placeholder in self._fields))
+            for part in self.msg.walk():
+                # Folding or encoding would mangle the placeholders in
+                # headers and encoded parts.
+                for value in part.values():
+                    if isinstance(value, basestring) and fields.search(value):
+                        return False
+                cte = part.get('content-transfer-encoding', '').lower()
+                if (not part.is_multipart() and cte in ENCODED_CTES
+                    and fields.search(part.get_payload(decode=True))):
+                    return False
+            for match in fields.finditer(text, end):
+                slots.append((match.start(), match.end(),
+                              self._field_slot(match.group(0))))
+        self._chunks = []
+        start = 0
+        for slot_start, slot_end, slot in slots:
+            self._chunks.append(text[start:slot_start])
+            self._chunks.append(slot)
+            start = slot_end
+        self._chunks.append(text[start:])
+        return True
+
+    def _header_slot(self, name, placeholder):
+        function = self._headers[placeholder]
+        def slot(msgdata):
+            value = function(msgdata)
+            return (EMPTYSTRING if value is None
+                    else _format_header(name, value))
+        return slot
+
+    def _field_slot(self, placeholder):
+        function = self._fields[placeholder]
+        def slot(msgdata):
+            text = function(msgdata)
+            if text is None:
+                return None
+            # The text must look the same in any context the placeholder
+            # could have been flattened into.
+            try:
+                text = text.encode('us-ascii')
+            except UnicodeError:
+                return None
+            if ('\n' in text or '\r' in text or text.endswith(' ')
+                or text.startswith('From ')):
+                return None
+            return text
+        return slot
+
+    def render(self, msgdata):
+        """Render a recipient's copy of the message.
+
+        :param msgdata: The recipient's message metadata.
+        :type msgdata: dictionary
+        :return: The flattened message, or None if the recipient's copy can't
+            be rendered from the template.
+        :rtype: string
+        """
+        assert self._chunks is not None, 'Template is not compiled'
+        pieces = []
+        for chunk in self._chunks:
+            if callable(chunk):
+                chunk = chunk(msgdata)
+                if chunk is None:
+                    return None
+            pieces.append(chunk)
+        return EMPTYSTRING.join(pieces)
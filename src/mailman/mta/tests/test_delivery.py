@@ -21,11 +21,15 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestBulkDelivery',
     'TestIndividualDelivery',
+    'TestPersonalizedRenderer',
+    'TestPooledConnections',
     ]
 
 
 import os
+import mock
 import shutil
 import tempfile
 import unittest
@@ -33,12 +37,18 @@ import unittest
 from mailman.app.lifecycle import create_list
 from mailman.app.membership import add_member
 from mailman.config import config
+from mailman.handlers.decorate import member_substitutions
 from mailman.interfaces.mailinglist import Personalization
 from mailman.interfaces.member import DeliveryMode
+from mailman.mta.base import BaseDelivery
+from mailman.mta.bulk import BulkDelivery
+from mailman.mta.connection import make_pool
 from mailman.mta.deliver import Deliver
+from mailman.mta.renderer import PersonalizedRenderer
 from mailman.testing.helpers import (
+    query_counter,
     specialized_message_from_string as mfs)
-from mailman.testing.layers import ConfigLayer
+from mailman.testing.layers import ConfigLayer, SMTPLayer
 
 
 
@@ -50,12 +60,41 @@ _deliveries = []
 # we just want to capture the messages and metadata dictionaries for
 # inspection.
 class DeliverTester(Deliver):
+    # Run the callbacks on a copy of the message for every recipient.
+    renderer_class = None
+
     def _deliver_to_recipients(self, mlist, msg, msgdata, recipients):
         _deliveries.append((mlist, msg, msgdata, recipients))
         # Nothing gets refused.
         return []
 
 
+
+# Capture the flattened messages, with and without a template renderer.
+class RenderingTester(Deliver):
+    def _send(self, message_id, sender, recipients, msgtext):
+        _deliveries.append((sender, recipients, msgtext))
+        return {}
+
+
+class CallbackTester(RenderingTester):
+    renderer_class = None
+
+
+
+# Refuse every recipient whose local part starts with 'bad', with the code
+# given in the remainder of the local part.
+class BulkTester(BulkDelivery):
+    def _send(self, message_id, sender, recipients, msgtext):
+        _deliveries.append(recipients)
+        refused = {}
+        for recipient in recipients:
+            if recipient.startswith('bad'):
+                code = int(recipient.split('@')[0][3:])
+                refused[recipient] = (code, 'Refused')
+        return refused
+
+
 
 class TestIndividualDelivery(unittest.TestCase):
     """Test personalized delivery details."""
@@ -117,6 +156,31 @@ options  : $user_optionsurl
         member = _msgdata.get('member')
         self.assertEqual(member, self._anne)
 
+    def test_member_lookup_query_count(self):
+        # The recipients' memberships are looked up all at once, so the
+        # number of queries doesn't depend on the number of recipients.  The
+        # footer's list-wide substitutions would still be looked up for each
+        # recipient.
+        self._mlist.footer_uri = None
+        def count_queries(recipients):
+            msgdata = dict(recipients=recipients)
+            with query_counter() as counter:
+                DeliverTester().deliver(self._mlist, self._msg, msgdata)
+            return counter.count
+        recipients = ['anne@example.org']
+        few = count_queries(recipients)
+        for i in range(5):
+            email = 'person{0}@example.org'.format(i)
+            add_member(self._mlist, email, 'Person {0}'.format(i),
+                       'xyz', DeliveryMode.regular, 'en')
+            recipients.append(email)
+        self._mlist.personalize = Personalization.full
+        many = count_queries(recipients)
+        self.assertEqual(few, many)
+        self.assertEqual(len(_deliveries), 7)
+        self.assertEqual(_deliveries[-1][2]['member'].address.email,
+                         'person4@example.org')
+
     def test_decoration(self):
         msgdata = dict(recipients=['anne@example.org'])
         agent = DeliverTester()
@@ -140,3 +204,276 @@ name     : Anne Person
 options  : http://example.com/anne@example.org
 
 """)
+
+
+
+class TestBulkDelivery(unittest.TestCase):
+    """Test parallel bulk delivery."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        del _deliveries[:]
+        self._msg = mfs("""\
+From: anne@example.org
+To: test@example.com
+Subject: test
+
+""")
+
+    def tearDown(self):
+        del _deliveries[:]
+
+    def test_parallel_chunks(self):
+        # Every chunk gets delivered exactly once.
+        recipients = set('person_{0:02d}@example.com'.format(i)
+                         for i in range(20))
+        agent = BulkTester(3, 4)
+        refused = agent.deliver(
+            self._mlist, self._msg, dict(recipients=recipients))
+        self.assertEqual(refused, {})
+        self.assertEqual(len(_deliveries), 7)
+        delivered = []
+        for chunk in _deliveries:
+            delivered.extend(chunk)
+        self.assertEqual(sorted(delivered), sorted(recipients))
+
+    def test_one_private_pool(self):
+        # Only one private connection pool is made, with a connection for
+        # every delivery thread.
+        with mock.patch('mailman.mta.base.make_pool') as make_pool:
+            BulkTester(2, 3)
+        make_pool.assert_called_once_with(3)
+
+    def test_parallel_refused(self):
+        # The refused recipients of all the chunks are merged.
+        recipients = set(['anne@example.com', 'bad450@example.com',
+                          'bart@example.com', 'bad550@example.com',
+                          'cris@example.com', 'bad552@example.com'])
+        agent = BulkTester(2, 3)
+        refused = agent.deliver(
+            self._mlist, self._msg, dict(recipients=recipients))
+        self.assertEqual(refused, {
+            'bad450@example.com': (450, 'Refused'),
+            'bad550@example.com': (550, 'Refused'),
+            'bad552@example.com': (552, 'Refused'),
+            })
+
+
+
+class TestPersonalizedRenderer(unittest.TestCase):
+    """Test the template rendering of individualized messages."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._mlist.personalize = Personalization.full
+        add_member(self._mlist, 'anne@example.org', 'Anne Person',
+                   'xyz', DeliveryMode.regular, 'en')
+        add_member(self._mlist, 'bart@example.org', 'Bart Person',
+                   'xyz', DeliveryMode.regular, 'en')
+        del _deliveries[:]
+        self._msg = mfs("""\
+From: cris@example.org
+To: test@example.com
+Subject: test
+X-Mailman-Copy: yes
+Message-ID: <first>
+
+Hello
+""")
+        self._template_dir = tempfile.mkdtemp()
+        path = os.path.join(self._template_dir,
+                            'site', 'en', 'member-footer.txt')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            print("""\
+$user_name <$user_address> $user_delivered_to
+options: $user_optionsurl ($user_language) $user_unknown""", file=fp)
+        config.push('templates', """
+        [paths.testing]
+        template_dir: {0}
+        """.format(self._template_dir))
+        self._mlist.footer_uri = 'mailman:///member-footer.txt'
+        self.maxDiff = None
+        self._msgdata = dict(
+            recipients=['anne@example.org', 'bart@example.org',
+                        'dave@example.org'],
+            verp=True,
+            # Bart gets the duplicate header.
+            **{'add-dup-header': set(['bart@example.org'])})
+
+    def tearDown(self):
+        del _deliveries[:]
+        shutil.rmtree(self._template_dir)
+        config.pop('templates')
+
+    def _deliver(self, agent_class, msg=None):
+        if msg is None:
+            msg = self._msg
+        del _deliveries[:]
+        refused = agent_class().deliver(self._mlist, msg, self._msgdata)
+        self.assertEqual(refused, {})
+        return sorted(_deliveries)
+
+    def _assert_same(self, msg=None):
+        self.assertEqual(self._deliver(RenderingTester, msg),
+                         self._deliver(CallbackTester, msg))
+
+    def test_same_as_callbacks(self):
+        # Rendering the messages from a template produces exactly what the
+        # callbacks do to copies of the message.
+        renderer = RenderingTester()._get_renderer(
+            self._mlist, self._msg, self._msgdata)
+        self.assertIsNotNone(renderer)
+        self._assert_same()
+        sender, recipients, msgtext = _deliveries[1]
+        self.assertEqual(recipients, ['bart@example.org'])
+        self.assertEqual(
+            sender, 'test-bounces+bart=example.org@example.com')
+        self.assertIn('To: Bart Person <bart@example.org>\n', msgtext)
+        self.assertIn('X-Mailman-Copy: yes\n', msgtext)
+        self.assertIn('Bart Person <bart@example.org> bart@example.org',
+                      msgtext)
+        self.assertIn('$user_unknown', msgtext)
+
+    def test_member_substitutions_once(self):
+        # The member substitutions are calculated once per recipient, however
+        # many of them the template uses.
+        with mock.patch('mailman.mta.decorating.member_substitutions',
+                        wraps=member_substitutions) as substitutions:
+            self._deliver(RenderingTester)
+        self.assertEqual(
+            sorted(call[0][1] for call in substitutions.call_args_list),
+            ['anne@example.org', 'bart@example.org'])
+
+    def test_multipart(self):
+        # The footer is added as a separate part.
+        msg = mfs("""\
+From: cris@example.org
+To: test@example.com
+Subject: test
+Message-ID: <first>
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="BOUNDARY"
+
+--BOUNDARY
+Content-Type: text/plain
+
+Hello
+--BOUNDARY
+Content-Type: application/octet-stream
+Content-Transfer-Encoding: base64
+
+AAAA
+--BOUNDARY--
+""")
+        self._assert_same(msg)
+
+    def test_non_ascii_values(self):
+        # Recipients whose values can't be spliced in verbatim get their
+        # copies built by the callbacks.
+        anne = self._mlist.members.get_member('anne@example.org')
+        anne.user.display_name = 'Anne \u00c9douard'
+        self._assert_same()
+
+    def test_encoded_footer(self):
+        # The placeholders don't survive encoding, so the template can't be
+        # used when the decoration gets encoded.
+        renderer = PersonalizedRenderer(self._msg)
+        field = renderer.field(lambda msgdata: 'anne')
+        renderer.msg.set_payload(
+            'H\xe9llo {0}'.format(field).encode('utf-8'), 'utf-8')
+        self.assertFalse(renderer.compile())
+        self._msg.set_payload('H\xe9llo'.encode('utf-8'), 'utf-8')
+        self._assert_same()
+
+    def test_renderer(self):
+        renderer = PersonalizedRenderer(self._msg)
+        renderer.msg.replace_header(
+            'To', renderer.header(lambda msgdata: msgdata['to']))
+        del renderer.msg['x-mailman-copy']
+        renderer.msg['X-Mailman-Copy'] = renderer.header(
+            lambda msgdata: None)
+        field = renderer.field(lambda msgdata: msgdata['name'])
+        renderer.msg.set_payload('Hello {0}, {0}\n'.format(field))
+        self.assertTrue(renderer.compile())
+        self.assertEqual(renderer.render(dict(to='a@example.com', name='A')),
+                         """\
+From: cris@example.org
+To: a@example.com
+Subject: test
+Message-ID: <first>
+
+Hello A, A
+""")
+        self.assertIsNone(renderer.render(dict(to='a@example.com',
+                                               name='A\nB')))
+        # The original message is untouched.
+        self.assertEqual(self._msg['x-mailman-copy'], 'yes')
+
+
+
+
+class TestPooledConnections(unittest.TestCase):
+    """Test delivery over pooled SMTP connections."""
+
+    layer = SMTPLayer
+
+    def setUp(self):
+        self._text = b"""\
+From: anne@example.com
+To: bart@example.com
+Subject: aardvarks
+
+"""
+        SMTPLayer.smtpd.reset()
+
+    def tearDown(self):
+        SMTPLayer.smtpd.clear()
+
+    def _send(self, agent):
+        return agent._send('<ant>', 'anne@example.com',
+                           ['bart@example.com'], self._text)
+
+    def test_stale_connection_replaced(self):
+        # When the server has dropped a pooled connection, the message is
+        # sent over a new connection instead of failing.
+        pool = make_pool()
+        config.smtp_pool = pool
+        try:
+            agent = BaseDelivery()
+            self.assertEqual(self._send(agent), {})
+            with pool.connection() as connection:
+                connection._connection.close()
+            self.assertEqual(self._send(agent), {})
+        finally:
+            config.smtp_pool = None
+            pool.close()
+        self.assertEqual(SMTPLayer.smtpd.get_connection_count(), 2)
+        self.assertEqual(len(list(SMTPLayer.smtpd.messages)), 2)
+
+    def test_new_connection_not_retried(self):
+        # A failure on a new connection is not retried.
+        config.push('no server', """
+        [mta]
+        smtp_port: 9
+        """)
+        try:
+            agent = BaseDelivery()
+            refused = self._send(agent)
+        finally:
+            config.pop('no server')
+        self.assertEqual(refused.keys(), ['bart@example.com'])
+        self.assertEqual(refused['bart@example.com'][0], 444)
+
+    def test_private_pool_closed(self):
+        # A deliverer without the process-wide pool closes its own
+        # connections.
+        agent = BaseDelivery()
+        self.assertEqual(self._send(agent), {})
+        self.assertEqual(len(agent._pool._idle), 1)
+        agent.close()
+        self.assertEqual(len(agent._pool._idle), 0)
@@ -92,6 +92,15 @@ class VERPMixin:
         if recipient in msgdata.get('add-dup-header', {}):
             msg['X-Mailman-Copy'] = 'yes'
 
+    def template_avoid_duplicates(self, mlist, renderer, msgdata):
+        """See `avoid_duplicates()`."""
+        def copy_header(msgdata):
+            recipient = msgdata['recipient']
+            return ('yes' if recipient in msgdata.get('add-dup-header', {})
+                    else None)
+        del renderer.msg['x-mailman-copy']
+        renderer.msg['X-Mailman-Copy'] = renderer.header(copy_header)
+
 
 
 class VERPDelivery(VERPMixin, IndividualDelivery):
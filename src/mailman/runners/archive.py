@@ -25,16 +25,17 @@ __all__ = [
     ]
 
 
-import copy
 import logging
 
+from collections import defaultdict
 from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime
+from flufl.lock import TimeOutError
 from lazr.config import as_timedelta
 
 from mailman.config import config
 from mailman.core.runner import Runner
-from mailman.interfaces.archiver import ClobberDate
+from mailman.interfaces.archiver import ClobberDate, IBatchArchiver
 from mailman.utilities.datetime import RFC822_DATE_FMT, now
 
 
@@ -84,24 +85,99 @@ def _should_clobber(msg, msgdata, archiver):
     return (abs(now() - claimed_date) > skew)
 
 
+
+def _clobber_date(msg, received_time):
+    """Return a copy of the message with its Date header clobbered.
+
+    Only the headers are copied; the payload is shared with the original
+    message, which is left untouched.
+    """
+    msg_copy = msg.__class__()
+    msg_copy.__dict__.update(msg.__dict__)
+    msg_copy._headers = list(msg._headers)
+    original_date = msg_copy['date']
+    del msg_copy['date']
+    del msg_copy['x-original-date']
+    msg_copy['Date'] = received_time.strftime(RFC822_DATE_FMT)
+    if original_date:
+        msg_copy['X-Original-Date'] = original_date
+    return msg_copy
+
+
+
 
 class ArchiveRunner(Runner):
     """The archive runner."""
 
+    def __init__(self, name, slice=None):
+        super(ArchiveRunner, self).__init__(name, slice)
+        # The messages waiting for the archivers which archive in batches.
+        # Each entry is the archiver, the mailing list, the message to
+        # archive, and the original message and metadata in case they must be
+        # requeued.
+        self._pending = []
+
     def _dispose(self, mlist, msg, msgdata):
         received_time = msgdata.get('received_time', now(strip_tzinfo=False))
+        # A requeued message only goes to the archivers which timed out.
+        names = msgdata.pop('archivers', None)
+        retry = []
+        # The archivers which don't clobber the Date header all share the
+        # original message, and the others all share a single copy.
+        clobbered = None
         for archiver in config.archivers:
-            msg_copy = copy.deepcopy(msg)
+            if names is not None and archiver.name not in names:
+                continue
             if _should_clobber(msg, msgdata, archiver.name):
-                original_date = msg_copy['date']
-                del msg_copy['date']
-                del msg_copy['x-original-date']
-                msg_copy['Date'] = received_time.strftime(RFC822_DATE_FMT)
-                if original_date:
-                    msg_copy['X-Original-Date'] = original_date
+                if clobbered is None:
+                    clobbered = _clobber_date(msg, received_time)
+                msg_copy = clobbered
+            else:
+                msg_copy = msg
+            if IBatchArchiver.providedBy(archiver):
+                self._pending.append(
+                    (archiver, mlist, msg_copy, msg, msgdata))
+                continue
             # A problem in one archiver should not prevent other archivers
             # from running.
             try:
                 archiver.archive_message(mlist, msg_copy)
+            except TimeOutError:
+                log.error('Archiver {0} timed out, requeuing: {1}'.format(
+                    archiver.name, msg.get('message-id', 'n/a')))
+                retry.append(archiver.name)
+            except Exception:
+                log.exception('Broken archiver: %s' % archiver.name)
+        if len(retry) > 0:
+            msgdata['archivers'] = retry
+            return True
+        return False
+
+    def _commit_batch(self, batch):
+        """See `Runner`."""
+        # The batching archivers must be done with the queue files before
+        # they are finished.
+        self._archive_pending()
+        super(ArchiveRunner, self)._commit_batch(batch)
+
+    def _archive_pending(self):
+        """Hand the pending messages to the archivers which batch them."""
+        batches = defaultdict(list)
+        for entry in self._pending:
+            archiver, mlist = entry[:2]
+            batches[archiver.name, mlist.fqdn_listname].append(entry)
+        del self._pending[:]
+        for entries in batches.values():
+            archiver, mlist = entries[0][:2]
+            try:
+                archiver.archive_messages(
+                    mlist, [entry[2] for entry in entries])
+            except TimeOutError:
+                log.error('Archiver {0} timed out, requeuing {1} messages '
+                          'for {2}'.format(archiver.name, len(entries),
+                                           mlist.fqdn_listname))
+                for archiver, mlist, msg_copy, msg, msgdata in entries:
+                    self.switchboard.enqueue(
+                        msg, msgdata, archivers=[archiver.name])
             except Exception:
                 log.exception('Broken archiver: %s' % archiver.name)
@@ -20,9 +20,11 @@
 import logging
 
 from flufl.bounce import all_failures, scan_message
+from lazr.config import as_timedelta
 from zope.component import getUtility
 
 from mailman.app.bounces import ProbeVERP, StandardVERP, maybe_forward
+from mailman.config import config
 from mailman.core.runner import Runner
 from mailman.interfaces.bounce import BounceContext, IBounceProcessor
 
@@ -41,6 +43,29 @@ class BounceRunner(Runner):
         super(BounceRunner, self).__init__(name, slice)
         self._processor = getUtility(IBounceProcessor)
 
+    def _one_iteration(self):
+        filecnt = super(BounceRunner, self)._one_iteration()
+        # Between passes through the queue, all the registered bounce events
+        # have been committed, so they can be processed in transactions of
+        # their own.
+        self._process_events()
+        return filecnt
+
+    def _process_events(self):
+        """Score the registered bounce events, if it's time to."""
+        result = self._run_periodic_job(
+            'bounce event processing',
+            as_timedelta(config.bounces.register_bounces_every),
+            self._processor.process,
+            int(config.bounces.process_batch_size))
+        if result is None:
+            return
+        processed, seconds = result
+        if processed > 0:
+            log.info('Processed {0} bounce events in {1:.3f} seconds '
+                     '({2:.0f} events/second)'.format(
+                         processed, seconds, processed / max(seconds, 0.001)))
+
     def _dispose(self, mlist, msg, msgdata):
         # List isn't doing bounce processing?
         if not mlist.process_bounces:
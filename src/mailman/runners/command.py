@@ -37,6 +37,7 @@ from StringIO import StringIO
 from email.errors import HeaderParseError
 from email.header import decode_header, make_header
 from email.iterators import typed_subpart_iterator
+from lazr.config import as_timedelta
 from zope.component import getUtility
 from zope.interface import implementer
 
@@ -46,10 +47,12 @@ from mailman.core.runner import Runner
 from mailman.email.message import UserNotification
 from mailman.interfaces.command import ContinueProcessing, IEmailResults
 from mailman.interfaces.languages import ILanguageManager
+from mailman.interfaces.pending import IPendings
 
 
 NL = '\n'
 log = logging.getLogger('mailman.vette')
+rlog = logging.getLogger('mailman.runner')
 
 
 
@@ -151,6 +154,27 @@ The results of your email command are provided below.
 class CommandRunner(Runner):
     """The email command runner."""
 
+    def _one_iteration(self):
+        filecnt = super(CommandRunner, self)._one_iteration()
+        # Between passes through the queue, all the processed queue files have
+        # been committed, so the eviction job can run in transactions of its
+        # own.
+        self._evict_pendings()
+        return filecnt
+
+    def _evict_pendings(self):
+        """Evict the expired pendings, if it's time to."""
+        result = self._run_periodic_job(
+            'pending eviction',
+            as_timedelta(config.mailman.pending_eviction_interval),
+            getUtility(IPendings).evict,
+            int(config.mailman.pending_eviction_batch_size))
+        if result is None:
+            return
+        evicted, seconds = result
+        rlog.info('{0} runner evicted {1} expired pendings in {2:.3f} '
+                  'seconds'.format(self.name, evicted, seconds))
+
     def _dispose(self, mlist, msg, msgdata):
         message_id = msg.get('message-id', 'n/a')
         # The policy here is similar to the Replybot policy.  If a message has
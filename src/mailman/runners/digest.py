@@ -25,32 +25,40 @@ __all__ = [
     ]
 
 
+import os
 import re
+import time
+import codecs
 import logging
+import tempfile
 
 # cStringIO doesn't support unicode.
 from StringIO import StringIO
 from contextlib import nested
-from copy import deepcopy
+from email.generator import Generator, _make_boundary
 from email.header import Header
 from email.message import Message
 from email.mime.message import MIMEMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.utils import formatdate, getaddresses, make_msgid
+from email.utils import formatdate, make_msgid
 from urllib2 import URLError
 
 from mailman.config import config
 from mailman.core.i18n import _
 from mailman.core.runner import Runner
 from mailman.handlers.decorate import decorate
+from mailman.handlers.to_digest import summarize
 from mailman.interfaces.member import DeliveryMode, DeliveryStatus
 from mailman.utilities.i18n import make
-from mailman.utilities.mailbox import Mailbox
+from mailman.utilities.mailbox import Mailbox, MailboxIndex
 from mailman.utilities.string import oneline, wrap
 
 
 log = logging.getLogger('mailman.error')
+dlog = logging.getLogger('mailman.digest')
+
+EMPTYSTRING = b''
 
 
 
@@ -97,25 +105,29 @@ class Digester:
                 self._header = ''
         self._toc = StringIO()
         print >> self._toc, _("Today's Topics:\n")
-
-    def add_to_toc(self, msg, count):
-        """Add a message to the table of contents."""
-        subject = msg.get('subject', _('(no subject)'))
-        subject = oneline(subject, in_unicode=True)
+        # The messages are written out to a spool file as they are added, so
+        # the digest never has to hold them all in memory.  The file goes
+        # away when it is closed.
+        self._spool = tempfile.TemporaryFile(dir=mlist.data_path)
+
+    def add_to_toc(self, subject, username, count):
+        """Add a message to the table of contents.
+
+        :param subject: The message's subject, or None if it has no subject.
+        :type subject: unicode
+        :param username: The name or email address of the message's author.
+        :type username: unicode
+        :param count: The number of the message in the digest.
+        :type count: int
+        """
+        if subject is None:
+            subject = _('(no subject)')
         # Don't include the redundant subject prefix in the toc
         mo = re.match('(re:? *)?({0})'.format(
             re.escape(self._mlist.subject_prefix)),
                       subject, re.IGNORECASE)
         if mo:
             subject = subject[:mo.start(2)] + subject[mo.end(2):]
-        # Take only the first author we find.
-        username = ''
-        addresses = getaddresses(
-            [oneline(msg.get('from', ''), in_unicode=True)])
-        if addresses:
-            username = addresses[0][0]
-            if not username:
-                username = addresses[0][1]
         if username:
             username = ' ({0})'.format(username)
         lines = wrap('{0:2}. {1}'. format(count, subject), 65).split('\n')
@@ -157,6 +169,8 @@ class Digester:
 class MIMEDigester(Digester):
     """A MIME digester."""
 
+    kind = 'MIME digest'
+
     def __init__(self, mlist, volume, digest_number):
         super(MIMEDigester, self).__init__(mlist, volume, digest_number)
         masthead = MIMEText(self._masthead.encode(self._charset),
@@ -171,10 +185,20 @@ class MIMEDigester(Digester):
             self._message.attach(header)
         # Calculate the set of headers we're to keep in the MIME digest.
         self._keepers = set(config.digests.mime_digest_keep_headers.split())
+        # The message parts are flattened as they are added, so the boundary
+        # must be known up front.
+        self._boundary = _make_boundary()
+        self._message.set_boundary(self._boundary)
 
     def _make_message(self):
         return MIMEMultipart('mixed')
 
+    def _write_part(self, part):
+        # This is how the generator would write out the part as one of the
+        # subparts of the digest.
+        self._spool.write(b'\n--' + self._boundary + b'\n')
+        Generator(self._spool).flatten(part, unixfrom=False)
+
     def add_toc(self, count):
         """Add the table of contents."""
         toc_text = self._toc.getvalue()
@@ -188,12 +212,14 @@ class MIMEDigester(Digester):
 
     def add_message(self, msg, count):
         """Add the message to the digest."""
-        # Make a copy of the message object, since the RFC 1153 processing
-        # scrubs out attachments.
-        self._message.attach(MIMEMessage(deepcopy(msg)))
+        self._write_part(MIMEMessage(msg))
 
     def finish(self):
-        """Finish up the digest, producing the email-ready copy."""
+        """Finish up the digest, producing the email-ready copy.
+
+        :return: The text of the digest.
+        :rtype: str
+        """
         if self._mlist.digest_footer_uri is not None:
             try:
                 footer_text = decorate(
@@ -207,25 +233,39 @@ class MIMEDigester(Digester):
             footer = MIMEText(footer_text.encode(self._charset),
                               _charset=self._charset)
             footer['Content-Description'] = _('Digest Footer')
-            self._message.attach(footer)
+            self._write_part(footer)
         # This stuff is outside the normal MIME goo, and it's what the old
         # MIME digester did.  No one seemed to complain, probably because you
         # won't see it in an MUA that can't display the raw message.  We've
         # never got complaints before, but if we do, just wax this.  It's
         # primarily included for (marginally useful) backwards compatibility.
         self._message.postamble = _('End of ') + self._digest_id
-        return self._message
+        # The spooled parts go right before the close-delimiter of the
+        # flattened digest.
+        text = self._message.as_string()
+        end = text.rindex(b'\n--' + self._boundary + b'--')
+        self._spool.seek(0)
+        try:
+            return EMPTYSTRING.join(
+                (text[:end], self._spool.read(), text[end:]))
+        finally:
+            self._spool.close()
 
 
 
 class RFC1153Digester(Digester):
     """A digester of the format specified by RFC 1153."""
 
+    kind = 'RFC 1153 digest'
+
     def __init__(self, mlist, volume, digest_number):
         super(RFC1153Digester, self).__init__(mlist, volume, digest_number)
         self._separator70 = '-' * 70
         self._separator30 = '-' * 30
+        # The masthead, header and table of contents are collected in memory,
+        # the messages and the sign-off in the spool file.
         self._text = StringIO()
+        self._messages = codecs.getwriter('utf-8')(self._spool)
         print >> self._text, self._masthead
         print >> self._text
         # Add the optional digest header.
@@ -248,32 +288,37 @@ class RFC1153Digester(Digester):
     def add_message(self, msg, count):
         """Add the message to the digest."""
         if count > 1:
-            print >> self._text, self._separator30
-            print >> self._text
+            print >> self._messages, self._separator30
+            print >> self._messages
         # Each message section contains a few headers.
         for header in config.digests.plain_digest_keep_headers.split():
             if header in msg:
                 value = oneline(msg[header], in_unicode=True)
                 value = wrap('{0}: {1}'.format(header, value))
                 value = '\n\t'.join(value.split('\n'))
-                print >> self._text, value
-        print >> self._text
+                print >> self._messages, value
+        print >> self._messages
         # Add the payload.  If the decoded payload is empty, this may be a
         # multipart message.  In that case, just stringify it.
         payload = msg.get_payload(decode=True)
-        payload = (payload if payload else msg.as_string().split('\n\n', 1)[1])
+        if not payload:
+            payload = msg.as_string().split(b'\n\n', 1)[1]
         try:
             charset = msg.get_content_charset('us-ascii')
             payload = unicode(payload, charset, 'replace')
         except (LookupError, TypeError):
             # Unknown or empty charset.
             payload = unicode(payload, 'us-ascii', 'replace')
-        print >> self._text, payload
+        print >> self._messages, payload
         if not payload.endswith('\n'):
-            print >> self._text
+            print >> self._messages
 
     def finish(self):
-        """Finish up the digest, producing the email-ready copy."""
+        """Finish up the digest, producing the email-ready copy.
+
+        :return: The text of the digest.
+        :rtype: str
+        """
         if self._mlist.digest_footer_uri is not None:
             try:
                 footer_text = decorate(
@@ -290,26 +335,56 @@ class RFC1153Digester(Digester):
             # is to add the footer as the last message in the RFC 1153 digest.
             # I just hate the way that VM does that and I think it's confusing
             # to users, so don't do it unless there's a clamor.
-            print >> self._text, self._separator30
-            print >> self._text
-            print >> self._text, footer_text
-            print >> self._text
+            print >> self._messages, self._separator30
+            print >> self._messages
+            print >> self._messages, footer_text
+            print >> self._messages
         # Add the sign-off.
         sign_off = _('End of ') + self._digest_id
-        print >> self._text, sign_off
-        print >> self._text, '*' * len(sign_off)
+        print >> self._messages, sign_off
+        print >> self._messages, '*' * len(sign_off)
+        self._spool.seek(0)
+        try:
+            text = self._text.getvalue() + self._spool.read().decode('utf-8')
+        finally:
+            self._spool.close()
         # If the digest message can't be encoded by the list character set,
         # fall back to utf-8.
-        text = self._text.getvalue()
         try:
             self._message.set_payload(text.encode(self._charset),
                                       charset=self._charset)
         except UnicodeError:
             self._message.set_payload(text.encode('utf-8'), charset='utf-8')
-        return self._message
+        return self._message.as_string()
 
 
 
+def _indexed_messages(mailbox, path):
+    """Iterate over the messages in a digest mailbox.
+
+    The messages are found through the mailbox's index, which also provides
+    the subjects and authors for the table of contents.  Mailboxes without an
+    up-to-date index are parsed instead.
+
+    :param mailbox: The digest mailbox.
+    :type mailbox: `Mailbox`
+    :param path: The path of the digest mailbox.
+    :type path: string
+    :return: Iterator over the index entries and the messages.
+    """
+    index = MailboxIndex(path)
+    entries = index.read()
+    last = (entries[-1] if entries else None)
+    if index.is_current(last, os.path.getsize(path)):
+        for entry in entries:
+            yield entry, mailbox.get_message_at(entry['start'], entry['stop'])
+    else:
+        for key, message in mailbox.iteritems():
+            subject, author = summarize(message)
+            yield dict(subject=subject, author=author), message
+
+
+
 class DigestRunner(Runner):
     """The digest runner."""
 
@@ -317,55 +392,90 @@ class DigestRunner(Runner):
         """See `IRunner`."""
         volume = msgdata['volume']
         digest_number = msgdata['digest_number']
+        # Find out who gets which kind of digest before building anything.
+        # Only the kinds of digest that someone is going to receive are
+        # built, and empty digests are never sent.
+        mime_recipients, rfc1153_recipients = self._calculate_recipients(
+            mlist)
+        digests = []
+        if len(mime_recipients) > 0:
+            digests.append((MIMEDigester, mime_recipients))
+        if len(rfc1153_recipients) > 0:
+            digests.append((RFC1153Digester, rfc1153_recipients))
+        if len(digests) == 0:
+            dlog.info('No digest recipients for {0}, volume {1}, '
+                     'number {2}'.format(
+                         mlist.fqdn_listname, volume, digest_number))
+            return
+        start = time.time()
         with nested(Mailbox(msgdata['digest_path']),
                     _.using(mlist.preferred_language.code)) as (mailbox,
                                                                 language_code):
             # Create the digesters.
-            mime_digest = MIMEDigester(mlist, volume, digest_number)
-            rfc1153_digest = RFC1153Digester(mlist, volume, digest_number)
-            # Cruise through all the messages in the mailbox, first building
-            # the table of contents and accumulating Subject: headers and
-            # authors.  The question really is whether it's better from a
-            # performance and memory footprint to go through the mailbox once
-            # and cache the messages in a list, or to cruise through the
-            # mailbox twice.  We'll do the latter, but it's a complete guess.
+            digesters = [digester_class(mlist, volume, digest_number)
+                         for digester_class, recipients in digests]
+            # Cruise through the messages in the mailbox just once.  Only the
+            # table of contents is kept in memory; the digesters spool the
+            # messages themselves out to disk as they go, and put the table
+            # of contents in front of them when they're finished.
             count = None
-            for count, (key, message) in enumerate(mailbox.iteritems(), 1):
-                mime_digest.add_to_toc(message, count)
-                rfc1153_digest.add_to_toc(message, count)
+            messages = _indexed_messages(mailbox, msgdata['digest_path'])
+            for count, (entry, message) in enumerate(messages, 1):
+                for digester in digesters:
+                    digester.add_to_toc(
+                        entry['subject'], entry['author'], count)
+                    digester.add_message(message, count)
             assert count is not None, 'No digest messages?'
-            # Add the table of contents.
-            mime_digest.add_toc(count)
-            rfc1153_digest.add_toc(count)
-            # Cruise through the set of messages a second time, adding them to
-            # the actual digest.
-            for count, (key, message) in enumerate(mailbox.iteritems(), 1):
-                mime_digest.add_message(message, count)
-                rfc1153_digest.add_message(message, count)
-            # Finish up the digests.
-            mime = mime_digest.finish()
-            rfc1153 = rfc1153_digest.finish()
-        # Calculate the recipients lists
+            # Add the table of contents and finish up the digests.
+            texts = []
+            for digester in digesters:
+                digester.add_toc(count)
+                texts.append(digester.finish())
+        dlog.info('Built {0} for {1}, volume {2}, number {3}: {4} messages in '
+                 '{5:.3f} seconds'.format(
+                     ' and '.join(digester_class.kind
+                                  for digester_class, recipients in digests),
+                     mlist.fqdn_listname, volume, digest_number, count,
+                     time.time() - start))
+        # Send the digests to the virgin queue for final delivery.  They are
+        # queued as text, which saves parsing them here just to have them
+        # flattened again.
+        queue = config.switchboards['virgin']
+        for text, (digester_class, recipients) in zip(texts, digests):
+            queue.enqueue(text,
+                          recipients=recipients,
+                          listname=mlist.fqdn_listname,
+                          isdigest=True,
+                          _plaintext=True)
+
+    def _calculate_recipients(self, mlist):
+        """Calculate the recipients of the MIME and RFC 1153 digests.
+
+        :param mlist: The mailing list.
+        :type mlist: `IMailingList`
+        :return: The MIME digest recipients and the RFC 1153 digest
+            recipients.
+        :rtype: 2-tuple of sets of email addresses
+        """
         mime_recipients = set()
         rfc1153_recipients = set()
         # When someone turns off digest delivery, they will get one last
         # digest to ensure that there will be no gaps in the messages they
         # receive.
-        digest_members = set(mlist.digest_members.members)
-        for member in digest_members:
-            if member.delivery_status <> DeliveryStatus.enabled:
+        for record in mlist.digest_members.get_delivery_records():
+            if record.delivery_status <> DeliveryStatus.enabled:
                 continue
             # Send the digest to the case-preserved address of the digest
             # members.
-            email_address = member.address.original_email
-            if member.delivery_mode == DeliveryMode.plaintext_digests:
+            email_address = record.original_email
+            if record.delivery_mode == DeliveryMode.plaintext_digests:
                 rfc1153_recipients.add(email_address)
-            elif member.delivery_mode == DeliveryMode.mime_digests:
+            elif record.delivery_mode == DeliveryMode.mime_digests:
                 mime_recipients.add(email_address)
             else:
                 raise AssertionError(
                     'Digest member "{0}" unexpected delivery mode: {1}'.format(
-                        email_address, member.delivery_mode))
+                        email_address, record.delivery_mode))
         # Add also the folks who are receiving one last digest.
         for address, delivery_mode in mlist.last_digest_recipients:
             if delivery_mode == DeliveryMode.plaintext_digests:
@@ -376,13 +486,4 @@ class DigestRunner(Runner):
                 raise AssertionError(
                     'OLD recipient "{0}" unexpected delivery mode: {1}'.format(
                         address, delivery_mode))
-        # Send the digests to the virgin queue for final delivery.
-        queue = config.switchboards['virgin']
-        queue.enqueue(mime,
-                      recipients=mime_recipients,
-                      listname=mlist.fqdn_listname,
-                      isdigest=True)
-        queue.enqueue(rfc1153,
-                      recipients=rfc1153_recipients,
-                      listname=mlist.fqdn_listname,
-                      isdigest=True)
+        return mime_recipients, rfc1153_recipients
@@ -38,7 +38,6 @@ from zope.component import getUtility
 
 from mailman.core.chains import process
 from mailman.core.runner import Runner
-from mailman.database.transaction import transaction
 from mailman.interfaces.address import ExistingAddressError
 from mailman.interfaces.usermanager import IUserManager
 
@@ -53,13 +52,14 @@ class IncomingRunner(Runner):
             msgdata['envsender'] = mlist.no_reply_address
         # Ensure that the email addresses of the message's senders are known
         # to Mailman.  This will be used in nonmember posting dispositions.
+        # The runner commits them along with the rest of this message's
+        # changes.
         user_manager = getUtility(IUserManager)
-        with transaction():
-            for sender in msg.senders:
-                try:
-                    user_manager.create_address(sender)
-                except ExistingAddressError:
-                    pass
+        for sender in msg.senders:
+            try:
+                user_manager.create_address(sender)
+            except ExistingAddressError:
+                pass
         # Process the message through the mailing list's start chain.
         start_chain = (mlist.owner_chain
                        if msgdata.get('to_owner', False)
@@ -30,6 +30,10 @@ Mailman's incoming queue for normal processing.  If they don't look good, or
 are destined for a bogus sub-address, they are rejected right away, hopefully
 so that the peer mail server can provide better diagnostics.
 
+The LMTP sessions are all served by a single asyncore event loop.  Parsing and
+enqueuing the received messages is handed off to a pool of worker threads, so
+that a large message doesn't hold up the other sessions.
+
 [1] RFC 2033 Local Mail Transport Protocol
     http://www.faqs.org/rfcs/rfc2033.html
 """
@@ -42,19 +46,23 @@ __all__ = [
     ]
 
 
+import Queue
 import email
 import smtpd
+import socket
 import logging
 import asyncore
+import threading
 
+from collections import deque
 from email.utils import parseaddr
-from zope.component import getUtility
 
+from mailman.app.routing import RoutingTable, routing_table
 from mailman.config import config
 from mailman.core.runner import Runner
+from mailman.core.switchboard import SharedPayload
 from mailman.database.transaction import transactional
 from mailman.email.message import Message
-from mailman.interfaces.listmanager import IListManager
 from mailman.utilities.datetime import now
 from mailman.utilities.email import add_message_hash
 
@@ -64,33 +72,6 @@ qlog = logging.getLogger('mailman.runner')
 slog = logging.getLogger('mailman.smtp')
 
 
-# We only care about the listname and the sub-addresses as in listname@ or
-# listname-request@.  This maps user visible subaddress names (which may
-# include aliases) to the internal canonical subaddress name.
-SUBADDRESS_NAMES = dict(
-    admin='bounces',
-    bounces='bounces',
-    confirm='confirm',
-    join='join',
-    leave='leave',
-    owner='owner',
-    request='request',
-    subscribe='join',
-    unsubscribe='leave',
-    )
-
-# This maps subaddress canonical name to the destination queue that handles
-# messages sent to that subaddress.
-SUBADDRESS_QUEUES = dict(
-    bounces='bounces',
-    confirm='command',
-    join='command',
-    leave='command',
-    owner='in',
-    request='command',
-    )
-
-DASH    = '-'
 CRLF    = b'\r\n'
 ERR_451 = b'451 Requested action aborted: error in processing'
 ERR_501 = b'501 Message has defects'
@@ -101,44 +82,108 @@ ERR_550_MID = b'550 No Message-ID header provided'
 # XXX Blech
 smtpd.__version__ = b'Python LMTP runner 1.0'
 
+# Stands in for a channel's close_when_done() in its queue of replies.
+CLOSE = object()
+
 
 
-def split_recipient(address):
-    """Split an address into listname, subaddress and domain parts.
+class Delivery:
+    """A message received over LMTP, waiting to be processed."""
 
-    For example:
+    def __init__(self, channel, mailfrom, rcpttos, data, routes):
+        self.channel = channel
+        self.mailfrom = mailfrom
+        self.rcpttos = rcpttos
+        self.data = data
+        self.routes = routes
+        # The LMTP reply, once the message has been processed.
+        self.status = None
 
-    >>> split_recipient('mylist@example.com')
-    ('mylist', None, 'example.com')
 
-    >>> split_recipient('mylist-request@example.com')
-    ('mylist', 'request', 'example.com')
 
-    :param address: The destination address.
-    :return: A 3-tuple of the form (list-shortname, subaddress, domain).
-        subaddress may be None if this is the list's posting address.
-    """
-    localpart, domain = address.split('@', 1)
-    localpart = localpart.split(config.mta.verp_delimiter, 1)[0]
-    parts = localpart.split(DASH)
-    if parts[-1] in SUBADDRESS_NAMES:
-        listname = DASH.join(parts[:-1])
-        subaddress = parts[-1]
-    else:
-        listname = localpart
-        subaddress = None
-    return listname, subaddress, domain
+class Waker(asyncore.dispatcher):
+    """Wakes up the event loop when the worker threads finish a delivery."""
+
+    def __init__(self, callback):
+        self._callback = callback
+        reader, self._writer = socket.socketpair()
+        self._writer.setblocking(False)
+        asyncore.dispatcher.__init__(self, reader)
+
+    def wake(self):
+        """Wake up the event loop.  This can be called from any thread."""
+        try:
+            self._writer.send(b'x')
+        except socket.error:
+            # The socket buffer is full, so the event loop will wake up
+            # anyway.
+            pass
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self._callback()
+
+    def close(self):
+        asyncore.dispatcher.close(self)
+        self._writer.close()
+
 
 
-
 class Channel(smtpd.SMTPChannel):
     """An LMTP channel."""
 
     def __init__(self, server, conn, addr):
-        smtpd.SMTPChannel.__init__(self, server, conn, addr)
+        # While a delivery is being processed, the replies to any later
+        # commands are held back so that they go out in order.
+        self._replies = deque()
+        # The base class hands the received messages to its server's
+        # process_message().  Pass it the channel instead, so that the
+        # server knows where each message came from.
+        smtpd.SMTPChannel.__init__(self, self, conn, addr)
         # Stash this here since the subclass uses private attributes. :(
         self._server = server
 
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        """Return the LMTP reply, or the `Delivery` standing in for it."""
+        return self._server.receive(self, mailfrom, rcpttos, data)
+
+    def push(self, msg):
+        if isinstance(msg, Delivery) or len(self._replies) > 0:
+            self._replies.append(msg)
+        else:
+            smtpd.SMTPChannel.push(self, msg)
+
+    def close_when_done(self):
+        if len(self._replies) > 0:
+            self._replies.append(CLOSE)
+        else:
+            smtpd.SMTPChannel.close_when_done(self)
+
+    def readable(self):
+        # Wait for the pending delivery before reading any more commands.
+        return (len(self._replies) == 0 and
+                smtpd.SMTPChannel.readable(self))
+
+    def send_replies(self):
+        """Send the replies which are no longer waiting on a delivery."""
+        while len(self._replies) > 0:
+            reply = self._replies[0]
+            if isinstance(reply, Delivery):
+                if reply.status is None:
+                    break
+                reply = reply.status
+            self._replies.popleft()
+            if not self.connected:
+                # The MTA has hung up.
+                continue
+            if reply is CLOSE:
+                smtpd.SMTPChannel.close_when_done(self)
+            else:
+                smtpd.SMTPChannel.push(self, reply)
+
     def smtp_LHLO(self, arg):
         """The LMTP greeting, used instead of HELO/EHLO."""
         smtpd.SMTPChannel.smtp_HELO(self, arg)
@@ -159,6 +204,18 @@ class LMTPRunner(Runner, smtpd.SMTPServer):
         qlog.debug('LMTP server listening on %s:%s',
                    localaddr[0], localaddr[1])
         smtpd.SMTPServer.__init__(self, localaddr, remoteaddr=None)
+        # The base class only queues up to 5 connections, which isn't enough
+        # for an MTA opening many concurrent sessions.
+        self.listen(socket.SOMAXCONN)
+        self._deliveries = Queue.Queue()
+        self._finished = deque()
+        self._waker = Waker(self._send_replies)
+        self._workers = [
+            threading.Thread(target=self._work,
+                             name='LMTP worker {0}'.format(i))
+            for i in range(int(config.mta.lmtp_workers))]
+        for worker in self._workers:
+            worker.daemon = True
 
     def handle_accept(self):
         conn, addr = self.accept()
@@ -166,17 +223,78 @@ class LMTPRunner(Runner, smtpd.SMTPServer):
         slog.debug('LMTP accept from %s', addr)
 
     @transactional
-    def process_message(self, peer, mailfrom, rcpttos, data):
+    def _get_routes(self):
+        return routing_table.routes
+
+    def receive(self, channel, mailfrom, rcpttos, data):
+        """Receive a message from an LMTP channel.
+
+        :param channel: The channel which received the message.
+        :type channel: `Channel`
+        :param mailfrom: The envelope sender.
+        :type mailfrom: str
+        :param rcpttos: The envelope recipients.
+        :type rcpttos: list of str
+        :param data: The message text.
+        :type data: str
+        :return: The LMTP reply, or if the message is being processed by a
+            worker thread, the `Delivery` standing in for the reply.
+        :rtype: str or `Delivery`
+        """
+        try:
+            # Check the routing table every time we process a message since
+            # the set of mailing lists could have changed.  The worker threads
+            # don't touch the database, so this is done here.
+            routes = self._get_routes()
+        except Exception:
+            elog.exception('LMTP routing table')
+            return CRLF.join(ERR_451 for to in rcpttos)
+        delivery = Delivery(channel, mailfrom, rcpttos, data, routes)
+        if len(self._workers) == 0:
+            return self.process_message(delivery)
+        self._deliveries.put(delivery)
+        return delivery
+
+    def _work(self):
+        """Process deliveries until told to stop."""
+        while True:
+            delivery = self._deliveries.get()
+            if delivery is None:
+                break
+            try:
+                delivery.status = self.process_message(delivery)
+            except Exception:
+                # The client must still get a reply, and this thread must
+                # keep serving deliveries.
+                elog.exception('LMTP worker')
+                delivery.status = CRLF.join(
+                    ERR_451 for to in delivery.rcpttos)
+            self._finished.append(delivery)
+            self._waker.wake()
+
+    def _send_replies(self):
+        """Send the replies of the finished deliveries."""
+        while len(self._finished) > 0:
+            self._finished.popleft().channel.send_replies()
+
+    def process_message(self, delivery):
+        """Parse and enqueue a received message.
+
+        This is called from the worker threads, so it must not access the
+        database.
+
+        :param delivery: The received message.
+        :type delivery: `Delivery`
+        :return: The LMTP reply.
+        :rtype: str
+        """
+        rcpttos = delivery.rcpttos
         try:
-            # Refresh the list of list names every time we process a message
-            # since the set of mailing lists could have changed.
-            listnames = set(getUtility(IListManager).names)
             # Parse the message data.  If there are any defects in the
             # message, reject it right away; it's probably spam.
-            msg = email.message_from_string(data, Message)
+            msg = email.message_from_string(delivery.data, Message)
         except Exception:
             elog.exception('LMTP message parsing')
-            config.db.abort()
             return CRLF.join(ERR_451 for to in rcpttos)
         # Do basic post-processing of the message, checking it for defects or
         # other missing information.
@@ -185,72 +303,85 @@ class LMTPRunner(Runner, smtpd.SMTPServer):
             return ERR_550_MID
         if msg.defects:
             return ERR_501
-        msg.original_size = len(data)
+        msg.original_size = len(delivery.data)
         add_message_hash(msg)
-        msg['X-MailFrom'] = mailfrom
+        msg['X-MailFrom'] = delivery.mailfrom
         # RFC 2033 requires us to return a status code for every recipient.
         status = []
-        # Now for each address in the recipients, parse the address to first
-        # see if it's destined for a valid mailing list.  If so, then queue
-        # the message to the appropriate place and record a 250 status for
-        # that recipient.  If not, record a failure status for that recipient.
+        queues = set()
+        # Now look up each address in the recipients to see if it's destined
+        # for a valid mailing list.  If so, then queue the message to the
+        # appropriate place and record a 250 status for that recipient.  If
+        # not, record a failure status for that recipient.
         received_time = now()
+        # When the message is for several lists, or several addresses of a
+        # list, its text is only flattened and written to disk once.
+        try:
+            payload = (msg if len(rcpttos) == 1 else SharedPayload(msg))
+        except Exception:
+            elog.exception('LMTP message flattening: %s', message_id)
+            return CRLF.join(ERR_451 for to in rcpttos)
         for to in rcpttos:
             try:
                 to = parseaddr(to)[1].lower()
-                listname, subaddress, domain = split_recipient(to)
-                slog.debug('%s to: %s, list: %s, sub: %s, dom: %s',
-                           message_id, to, listname, subaddress, domain)
-                listname += '@' + domain
-                if listname not in listnames:
+                route = RoutingTable.route(delivery.routes, to)
+                if route is None:
+                    slog.debug('%s to: %s, no such list', message_id, to)
                     status.append(ERR_550)
                     continue
-                # The recipient is a valid mailing list.  Find the subaddress
-                # if there is one, and set things up to enqueue to the proper
-                # queue.
-                queue = None
+                listname, queue, subaddress = route
                 msgdata = dict(listname=listname,
                                original_size=msg.original_size,
                                received_time=received_time)
-                canonical_subaddress = SUBADDRESS_NAMES.get(subaddress)
-                queue = SUBADDRESS_QUEUES.get(canonical_subaddress)
                 if subaddress is None:
                     # The message is destined for the mailing list.
                     msgdata['to_list'] = True
-                    queue = 'in'
-                elif canonical_subaddress is None:
-                    # The subaddress was bogus.
-                    slog.error('%s unknown sub-address: %s',
-                               message_id, subaddress)
-                    status.append(ERR_550)
-                    continue
                 else:
                     # A valid subaddress.
-                    msgdata['subaddress'] = canonical_subaddress
-                    if canonical_subaddress == 'owner':
+                    msgdata['subaddress'] = subaddress
+                    if subaddress == 'owner':
                         msgdata.update(dict(
                             to_owner=True,
                             envsender=config.mailman.site_owner,
                             ))
-                        queue = 'in'
-                # If we found a valid destination, enqueue the message and add
-                # a success status for this recipient.
-                if queue is not None:
-                    config.switchboards[queue].enqueue(msg, msgdata)
-                    slog.debug('%s subaddress: %s, queue: %s',
-                               message_id, canonical_subaddress, queue)
-                    status.append(b'250 Ok')
+                # Enqueue the message and add a success status for this
+                # recipient.
+                config.switchboards[queue].enqueue(payload, msgdata)
+                queues.add(queue)
+                slog.debug('%s to: %s, list: %s, sub: %s, queue: %s',
+                           message_id, to, listname, subaddress, queue)
+                status.append(b'250 Ok')
             except Exception:
                 slog.exception('Queue detection: %s', msg['message-id'])
-                config.db.abort()
                 status.append(ERR_550)
+        # The queued messages must be durable before they are acknowledged.
+        # Worker threads enqueuing to the same queue share the syncs.
+        try:
+            for queue in queues:
+                config.switchboards[queue].sync()
+        except Exception:
+            elog.exception('LMTP queue sync: %s', message_id)
+            return CRLF.join(ERR_451 for to in rcpttos)
         # All done; returning this big status string should give the expected
         # response to the LMTP client.
         return CRLF.join(status)
 
     def run(self):
         """See `IRunner`."""
+        for worker in self._workers:
+            worker.start()
         asyncore.loop()
+        # Let the workers finish the deliveries they've started.  The MTA
+        # will retry the others, since they were never acknowledged.
+        try:
+            while True:
+                self._deliveries.get_nowait()
+        except Queue.Empty:
+            pass
+        for worker in self._workers:
+            self._deliveries.put(None)
+        for worker in self._workers:
+            worker.join()
 
     def stop(self):
         """See `IRunner`."""
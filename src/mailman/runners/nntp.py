@@ -21,21 +21,26 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'NNTPConnection',
     'NNTPRunner',
     ]
 
 
 import re
+import time
 import email
 import socket
 import logging
 import nntplib
 
 from cStringIO import StringIO
+from datetime import datetime
+from lazr.config import as_timedelta
 
 from mailman.config import config
 from mailman.core.runner import Runner
 from mailman.interfaces.nntp import NewsModeration
+from mailman.utilities.datetime import now
 
 COMMA = ','
 COMMASPACE = ', '
@@ -57,8 +62,99 @@ mcre = re.compile(r"""
 
 
 
+class NNTPConnection:
+    """Manage a persistent connection to the NNTP server."""
+
+    def __init__(self, host, port, user, password, idle_timeout=None):
+        """Create a connection manager.
+
+        :param host: The host name of the NNTP server to connect to.
+        :type host: string
+        :param port: The port number of the NNTP server to connect to.
+        :type port: integer
+        :param user: The user name to authenticate with.
+        :type user: string
+        :param password: The password to authenticate with.
+        :type password: string
+        :param idle_timeout: The number of seconds the connection can sit
+            idle before it is closed.  None means never close an idle
+            connection.
+        :type idle_timeout: float
+        """
+        self._host = host
+        self._port = port
+        self._user = user
+        self._password = password
+        self._idle_timeout = idle_timeout
+        self._connection = None
+        self._last_used = None
+
+    @property
+    def connected(self):
+        """Whether there is an open connection to the NNTP server."""
+        return self._connection is not None
+
+    def _connect(self):
+        self._connection = nntplib.NNTP(self._host, self._port,
+                                        readermode=True,
+                                        user=self._user,
+                                        password=self._password)
+
+    def post(self, text):
+        """Post an article, connecting to the NNTP server if necessary.
+
+        If an existing connection turns out to have been dropped by the
+        server, which nntplib reports as a socket error or EOFError, the
+        article is posted again over a new connection.  On any
+        other error the connection is closed and the error is raised.
+
+        :param text: The flattened article.
+        :type text: bytes
+        """
+        self.prune()
+        reused = self.connected
+        if not reused:
+            self._connect()
+        try:
+            self._connection.post(StringIO(text))
+        except (socket.error, EOFError):
+            self.close()
+            if not reused:
+                raise
+            self._connect()
+            try:
+                self._connection.post(StringIO(text))
+            except Exception:
+                self.close()
+                raise
+        except Exception:
+            self.close()
+            raise
+        self._last_used = time.time()
+
+    def prune(self):
+        """Close the connection if it has been idle for too long."""
+        if (self.connected and self._idle_timeout is not None
+                and time.time() - self._last_used > self._idle_timeout):
+            self.close()
+
+    def close(self):
+        """Close the connection, if there is one."""
+        if self._connection is None:
+            return
+        connection = self._connection
+        self._connection = None
+        try:
+            connection.quit()
+        except Exception:
+            # The connection is being thrown away anyway.
+            pass
+
+
+
 class NNTPRunner(Runner):
-    def _dispose(self, mlist, msg, msgdata):
+    def __init__(self, name, slice=None):
+        super(NNTPRunner, self).__init__(name, slice)
         # Get NNTP server connection information.
         host = config.nntp.host.strip()
         port = config.nntp.port.strip()
@@ -70,35 +166,79 @@ class NNTPRunner(Runner):
             except (TypeError, ValueError):
                 log.exception('Bad [nntp]port value: {0}'.format(port))
                 port = 119
+        idle_timeout = config.nntp.idle_timeout
+        if idle_timeout:
+            idle_timeout = as_timedelta(idle_timeout).total_seconds()
+        else:
+            idle_timeout = None
+        # All articles are posted back-to-back over the same connection.
+        self._connection = NNTPConnection(
+            host, port, config.nntp.user, config.nntp.password, idle_timeout)
+        self._retry_delay = as_timedelta(config.nntp.retry_delay)
+        self._max_retries = int(config.nntp.max_retries)
+        # The number of messages in the current pass through the queue which
+        # are waiting to be retried.
+        self._deferred = 0
+
+    def _dispose(self, mlist, msg, msgdata):
+        # See if we should retry posting this message yet.
+        deliver_after = msgdata.get('deliver_after', datetime.fromtimestamp(0))
+        if now() < deliver_after:
+            self._deferred += 1
+            return True
         # Make sure we have the most up-to-date state
         if not msgdata.get('prepped'):
             prepare_message(mlist, msg, msgdata)
-        # Flatten the message object, sticking it in a StringIO object
-        fp = StringIO(msg.as_string())
-        conn = None
         try:
-            conn = nntplib.NNTP(host, port,
-                                readermode=True,
-                                user=config.nntp.user,
-                                password=config.nntp.password)
-            conn.post(fp)
+            self._connection.post(msg.as_string())
         except nntplib.error_temp:
             log.exception('{0} NNTP error for {1}'.format(
                 msg.get('message-id', 'n/a'), mlist.fqdn_listname))
-        except socket.error:
+            return self._retry(mlist, msg, msgdata)
+        except (socket.error, EOFError):
             log.exception('{0} NNTP socket error for {1}'.format(
                 msg.get('message-id', 'n/a'), mlist.fqdn_listname))
+            return self._retry(mlist, msg, msgdata)
         except Exception:
             # Some other exception occurred, which we definitely did not
             # expect, so set this message up for requeuing.
             log.exception('{0} NNTP unexpected exception for {1}'.format(
                 msg.get('message-id', 'n/a'), mlist.fqdn_listname))
             return True
-        finally:
-            if conn:
-                conn.quit()
         return False
 
+    def _retry(self, mlist, msg, msgdata):
+        # Try posting the message again later, waiting twice as long after
+        # each failure.
+        retries = msgdata.get('nntp_retries', 0)
+        if retries >= self._max_retries:
+            log.error('{0} NNTP posting failed {1} times for {2}, '
+                      'discarding'.format(msg.get('message-id', 'n/a'),
+                                          retries + 1, mlist.fqdn_listname))
+            return False
+        msgdata['nntp_retries'] = retries + 1
+        msgdata['deliver_after'] = now() + self._retry_delay * 2 ** retries
+        return True
+
+    def _do_periodic(self):
+        """Close the NNTP connection if it has been idle for too long."""
+        self._connection.prune()
+
+    def _snooze(self, filecnt):
+        """Don't spin on messages which are only waiting to be retried."""
+        deferred = self._deferred
+        self._deferred = 0
+        if filecnt > 0 and filecnt == deferred and self.sleep_float > 0:
+            # The queue isn't empty, so the switchboard wouldn't wait.
+            time.sleep(self.sleep_float)
+        else:
+            super(NNTPRunner, self)._snooze(filecnt)
+
+    def _clean_up(self):
+        """Close the NNTP connection."""
+        self._connection.close()
+
+
 
 
 def prepare_message(mlist, msg, msgdata):
@@ -32,6 +32,7 @@ from mailman.interfaces.mailinglist import Personalization
 from mailman.interfaces.mta import SomeRecipientsFailed
 from mailman.interfaces.pending import IPendings
 from mailman.interfaces.subscriptions import ISubscriptionService
+from mailman.mta.connection import make_pool
 from mailman.utilities.datetime import now
 from mailman.utilities.modules import find_name
 
@@ -58,6 +59,8 @@ class OutgoingRunner(Runner):
         # set if there was a socket.error.
         self._logged = False
         self._retryq = config.switchboards['retry']
+        # All deliveries made by this runner share a pool of SMTP connections.
+        self._pool = make_pool()
 
     def _dispose(self, mlist, msg, msgdata):
         # See if we should retry delivery of this message again.
@@ -90,7 +93,11 @@ class OutgoingRunner(Runner):
         try:
             debug_log.debug('[outgoing] {0}: {1}'.format(
                 self._func, msg.get('message-id', 'n/a')))
-            self._func(mlist, msg, msgdata)
+            config.smtp_pool = self._pool
+            try:
+                self._func(mlist, msg, msgdata)
+            finally:
+                config.smtp_pool = None
             self._logged = False
         except socket.error:
             # There was a problem connecting to the SMTP server.  Log this
@@ -163,3 +170,13 @@ class OutgoingRunner(Runner):
                     self._retryq.enqueue(msg, msgdata)
         # We've successfully completed handling of this message.
         return False
+
+    def _do_periodic(self):
+        """Close SMTP connections that have been idle for too long."""
+        self._pool.prune()
+
+    def _clean_up(self):
+        """Close the pooled SMTP connections and log the pool statistics."""
+        self._pool.close()
+        smtp_log.info('SMTP connection pool hits: %s, misses: %s',
+                      self._pool.hits, self._pool.misses)
@@ -21,14 +21,19 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestArchivePipeline',
     'TestArchiveRunner',
     ]
 
 
 import os
+import mock
+import shutil
+import tempfile
 import unittest
 
 from email import message_from_file
+from flufl.lock import Lock
 from zope.interface import implementer
 
 from mailman.app.lifecycle import create_list
@@ -37,6 +42,7 @@ from mailman.interfaces.archiver import IArchiver
 from mailman.runners.archive import ArchiveRunner
 from mailman.testing.helpers import (
     configuration,
+    get_queue_messages,
     make_testable_runner,
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
@@ -67,6 +73,29 @@ class DummyArchiver:
         return path
 
 
+
+@implementer(IArchiver)
+class RecordingArchiver:
+    name = 'recording'
+    archived = []
+
+    @staticmethod
+    def list_url(mlist):
+        return 'http://archive.example.com/'
+
+    @staticmethod
+    def permalink(mlist, msg):
+        return None
+
+    def archive_message(self, mlist, msg):
+        self.archived.append((self.name, msg))
+
+
+class OtherRecordingArchiver(RecordingArchiver):
+    name = 'other'
+
+
+
 
 class TestArchiveRunner(unittest.TestCase):
     """Test the archive runner."""
@@ -237,3 +266,125 @@ First post!
         self.assertEqual(archived['message-id'], '<first>')
         self.assertEqual(archived['date'], 'Mon, 01 Aug 2005 07:49:23 +0000')
         self.assertEqual(archived['x-original-date'], None)
+
+
+
+
+class TestArchivePipeline(unittest.TestCase):
+    """Test handing messages to several archivers."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        # The prototype archiver writes to a temporary directory which is
+        # easy to clean up.
+        self._tempdir = tempfile.mkdtemp()
+        config.push('recording', """
+        [paths.testing]
+        archive_dir: {0}
+        [archiver.recording]
+        class: mailman.runners.tests.test_archiver.RecordingArchiver
+        enable: yes
+        clobber_date: never
+        [archiver.other]
+        class: mailman.runners.tests.test_archiver.OtherRecordingArchiver
+        enable: yes
+        clobber_date: never
+        [archiver.prototype]
+        enable: no
+        [archiver.mhonarc]
+        enable: no
+        [archiver.mail_archive]
+        enable: no
+        """.format(self._tempdir))
+        self._archiveq = config.switchboards['archive']
+        self._msg = mfs("""\
+From: aperson@example.com
+To: test@example.com
+Subject: My first post
+Message-ID: <first>
+Date: Sat, 01 Jan 2000 00:00:00 +0000
+X-Message-ID-Hash: 4CMWUN6BHVCMHMDAOSJZ2Q72G5M32MWB
+
+First post!
+""")
+        self._runner = make_testable_runner(ArchiveRunner)
+        del RecordingArchiver.archived[:]
+
+    def tearDown(self):
+        config.pop('recording')
+        shutil.rmtree(self._tempdir)
+        del RecordingArchiver.archived[:]
+
+    def _enqueue(self, **kws):
+        self._archiveq.enqueue(
+            self._msg, {}, listname=self._mlist.fqdn_listname,
+            received_time=now(strip_tzinfo=False), **kws)
+
+    def test_shared_message(self):
+        # Archivers which leave the Date header alone share the message.
+        self._enqueue()
+        self._runner.run()
+        archived = dict(RecordingArchiver.archived)
+        self.assertEqual(sorted(archived), ['other', 'recording'])
+        self.assertIs(archived['other'], archived['recording'])
+        self.assertEqual(archived['other']['date'],
+                         'Sat, 01 Jan 2000 00:00:00 +0000')
+
+    @configuration('archiver.other', clobber_date='always')
+    def test_date_overlay(self):
+        # Only the headers of the message are copied to clobber its Date.
+        self._enqueue()
+        self._runner.run()
+        archived = dict(RecordingArchiver.archived)
+        original, clobbered = archived['recording'], archived['other']
+        self.assertEqual(original['date'], 'Sat, 01 Jan 2000 00:00:00 +0000')
+        self.assertEqual(original['x-original-date'], None)
+        self.assertEqual(clobbered['date'], 'Mon, 01 Aug 2005 07:49:23 +0000')
+        self.assertEqual(clobbered['x-original-date'],
+                         'Sat, 01 Jan 2000 00:00:00 +0000')
+        self.assertIs(clobbered.get_payload(), original.get_payload())
+
+    @configuration('archiver.prototype', enable='yes')
+    def test_lock_timeout_requeues(self):
+        # When the prototype archiver can't get its lock, the message is
+        # requeued for just that archiver.
+        lock_file = os.path.join(
+            config.LOCK_DIR, '{0}-maildir.lock'.format(
+                self._mlist.fqdn_listname))
+        self._enqueue()
+        runner = make_testable_runner(
+            ArchiveRunner, predicate=lambda runner: True)
+        with Lock(lock_file):
+            runner.run()
+        self.assertEqual(len(RecordingArchiver.archived), 2)
+        messages = get_queue_messages('archive')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msg['message-id'], '<first>')
+        self.assertEqual(messages[0].msgdata['archivers'], ['prototype'])
+        # The next time around, only the prototype archiver gets it.
+        self._archiveq.enqueue(messages[0].msg, messages[0].msgdata)
+        self._runner.run()
+        self.assertEqual(len(RecordingArchiver.archived), 2)
+        self.assertEqual(len(get_queue_messages('archive')), 0)
+        new_path = os.path.join(config.ARCHIVE_DIR, 'prototype',
+                                self._mlist.fqdn_listname, 'new')
+        self.assertEqual(len(os.listdir(new_path)), 1)
+
+    @configuration('archiver.prototype', enable='yes')
+    def test_batched_maildir(self):
+        # The prototype archiver adds a whole batch of messages under a
+        # single acquisition of its lock.
+        for i in range(3):
+            del self._msg['message-id']
+            self._msg['Message-ID'] = '<message{0}>'.format(i)
+            self._enqueue()
+        with mock.patch.object(Lock, 'lock', autospec=True,
+                               side_effect=Lock.lock) as lock:
+            self._runner.run()
+        self.assertEqual(lock.call_count, 1)
+        self.assertEqual(len(RecordingArchiver.archived), 6)
+        new_path = os.path.join(config.ARCHIVE_DIR, 'prototype',
+                                self._mlist.fqdn_listname, 'new')
+        self.assertEqual(len(os.listdir(new_path)), 3)
@@ -43,6 +43,7 @@ from mailman.interfaces.usermanager import IUserManager
 from mailman.runners.bounce import BounceRunner
 from mailman.testing.helpers import (
     LogFileMark,
+    configuration,
     get_queue_messages,
     make_testable_runner,
     specialized_message_from_string as message_from_string)
@@ -101,6 +102,33 @@ Message-Id: <first>
         self.assertEqual(events[0].context, BounceContext.normal)
         self.assertEqual(events[0].processed, False)
 
+    @configuration('bounces', register_bounces_every='15m')
+    def test_process_events(self):
+        # Between passes through the queue, the registered bounce events are
+        # scored.
+        self._bounceq.enqueue(self._msg, self._msgdata)
+        mark = LogFileMark('mailman.bounce')
+        self._runner.run()
+        events = list(self._processor.events)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].processed, True)
+        self.assertEqual(self._member.bounce_score, 1)
+        line = mark.readline()
+        self.assertIn('Processed 1 bounce events in ', line)
+        self.assertTrue(line.endswith(' events/second)\n'))
+
+    @configuration('bounces', register_bounces_every='15m',
+                   process_batch_size=0)
+    def test_process_events_without_batches(self):
+        # A batch size of 0 processes all the bounce events at once.
+        self._bounceq.enqueue(self._msg, self._msgdata)
+        mark = LogFileMark('mailman.bounce')
+        self._runner.run()
+        events = list(self._processor.events)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].processed, True)
+        self.assertIn('Processed 1 bounce events in ', mark.readline())
+
     def test_nonfatal_verp_detection(self):
         # A VERPd bounce was received, but the error was nonfatal.
         nonfatal = message_from_string("""\
@@ -0,0 +1,102 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the command runner's eviction of expired pendings."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestPendingEviction',
+    ]
+
+
+import unittest
+
+from datetime import timedelta
+from zope.component import getUtility
+from zope.interface import implementer
+
+from mailman.config import config
+from mailman.interfaces.pending import IPendable, IPendings
+from mailman.runners.command import CommandRunner
+from mailman.testing.helpers import (
+    LogFileMark,
+    configuration,
+    make_testable_runner)
+from mailman.testing.layers import ConfigLayer
+
+
+
+@implementer(IPendable)
+class SimplePendable(dict):
+    pass
+
+
+
+class TestPendingEviction(unittest.TestCase):
+    """Test the command runner's eviction of expired pendings."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._pendings = getUtility(IPendings)
+        self._runner = make_testable_runner(CommandRunner, 'command')
+
+    def _add(self, count, lifetime):
+        tokens = [self._pendings.add(SimplePendable(number=i), lifetime)
+                  for i in range(count)]
+        config.db.commit()
+        return tokens
+
+    @configuration('mailman', pending_eviction_batch_size=2)
+    def test_evict_in_batches(self):
+        expired = self._add(5, timedelta(days=-1))
+        live = self._add(1, timedelta(days=1))
+        mark = LogFileMark('mailman.runner')
+        self._runner.run()
+        for token in expired:
+            self.assertIsNone(self._pendings.confirm(token, expunge=False))
+        self.assertIsNotNone(self._pendings.confirm(live[0], expunge=False))
+        line = mark.readline()
+        self.assertIn('command runner evicted 5 expired pendings in ', line)
+        self.assertTrue(line.endswith(' seconds\n'))
+
+    @configuration('mailman', pending_eviction_batch_size=0)
+    def test_evict_without_batches(self):
+        # A batch size of 0 evicts all the expired pendings at once.
+        expired = self._add(3, timedelta(days=-1))
+        mark = LogFileMark('mailman.runner')
+        self._runner.run()
+        for token in expired:
+            self.assertIsNone(self._pendings.confirm(token, expunge=False))
+        self.assertIn('command runner evicted 3 expired pendings in ',
+                      mark.readline())
+
+    def test_evict_once_per_interval(self):
+        self._runner.run()
+        token = self._add(1, timedelta(days=-1))[0]
+        mark = LogFileMark('mailman.runner')
+        self._runner.run()
+        self.assertEqual(mark.readline(), '')
+        self.assertIsNotNone(self._pendings.confirm(token, expunge=False))
+
+    @configuration('mailman', pending_eviction_interval='0s')
+    def test_eviction_disabled(self):
+        token = self._add(1, timedelta(days=-1))[0]
+        self._runner.run()
+        self.assertIsNotNone(self._pendings.confirm(token, expunge=False))
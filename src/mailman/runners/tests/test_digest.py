@@ -0,0 +1,259 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Test the digest runner."""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'TestDigestRunner',
+    ]
+
+
+import os
+import mock
+import unittest
+
+from contextlib import nested
+from mailbox import MMDF
+
+from mailman.app.lifecycle import create_list
+from mailman.app.membership import add_member
+from mailman.config import config
+from mailman.interfaces.member import DeliveryMode
+from mailman.runners.digest import DigestRunner, RFC1153Digester
+from mailman.testing.helpers import (
+    LogFileMark,
+    get_queue_messages,
+    make_testable_runner,
+    specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer
+from mailman.utilities.mailbox import Mailbox, MailboxIndex
+
+
+
+class TestDigestRunner(unittest.TestCase):
+    """Test the digest runner."""
+
+    layer = ConfigLayer
+
+    def setUp(self):
+        self._mlist = create_list('test@example.com')
+        self._mlist.digest_size_threshold = 100
+        self._process = config.handlers['to-digest'].process
+        self._runner = make_testable_runner(DigestRunner, 'digest')
+        self._anne = add_member(self._mlist, 'anne@example.com', 'Anne',
+                                'xxx', DeliveryMode.mime_digests, 'en')
+        self._bart = add_member(self._mlist, 'bart@example.com', 'Bart',
+                                'xxx', DeliveryMode.plaintext_digests, 'en')
+        self._message = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: Message
+
+Here is a message
+""")
+
+    def _digests(self):
+        # Return the MIME and RFC 1153 digests from the virgin queue.
+        messages = get_queue_messages('virgin')
+        self.assertEqual(len(messages), 2)
+        if messages[0].msg.is_multipart():
+            return messages[0].msg, messages[1].msg
+        return messages[1].msg, messages[0].msg
+
+    def _fill_digest(self, *messages):
+        for msg in messages[:-1]:
+            self._process(self._mlist, msg, {})
+        # Send the digest with the last message.
+        self._mlist.digest_size_threshold = 0
+        self._process(self._mlist, messages[-1], {})
+
+    def test_mailbox_read_once(self):
+        self._fill_digest(*(mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: Message {0}
+
+Here is message {0}
+""".format(i)) for i in range(3)))
+        # The digest mailbox's index is used to find the messages, so the
+        # mailbox does not even have to be parsed.
+        with nested(
+            mock.patch.object(Mailbox, 'iteritems', autospec=True,
+                              side_effect=MMDF.iteritems),
+            mock.patch.object(Mailbox, 'get_message_at', autospec=True,
+                              side_effect=Mailbox.get_message_at),
+            ) as (iteritems, get_message_at):
+            self._runner.run()
+        self.assertEqual(iteritems.call_count, 0)
+        self.assertEqual(get_message_at.call_count, 3)
+        mime, rfc1153 = self._digests()
+        # The masthead, the table of contents, the three messages and the
+        # footer.
+        parts = mime.get_payload()
+        self.assertEqual(len(parts), 6)
+        self.assertEqual(parts[1]['content-description'],
+                         "Today's Topics (3 messages)")
+        for i, part in enumerate(parts[2:5]):
+            self.assertEqual(part.get_content_type(), 'message/rfc822')
+            self.assertEqual(part.get_payload(0)['subject'],
+                             'Message {0}'.format(i))
+        self.assertEqual(parts[5]['content-description'], 'Digest Footer')
+        text = rfc1153.get_payload(decode=True)
+        self.assertEqual(text.count('Here is message'), 3)
+        self.assertTrue(text.endswith('*' * 34 + '\n'))
+
+    def test_missing_index(self):
+        # Without an index, the digest mailbox is read once.
+        self._fill_digest(self._message)
+        for filename in os.listdir(self._mlist.data_path):
+            if filename.endswith('.idx'):
+                os.remove(os.path.join(self._mlist.data_path, filename))
+        with mock.patch.object(Mailbox, 'iteritems', autospec=True,
+                               side_effect=MMDF.iteritems) as iteritems:
+            self._runner.run()
+        self.assertEqual(iteritems.call_count, 1)
+        mime, rfc1153 = self._digests()
+        self.assertEqual(mime.get_payload(1)['content-description'],
+                         "Today's Topics (1 messages)")
+        self.assertIn('1. Message (anne@example.com)', rfc1153.get_payload(decode=True))
+
+    def test_stale_index(self):
+        # Messages added to the digest mailbox behind the index's back are
+        # indexed along with the next message.
+        mailbox_path = os.path.join(self._mlist.data_path, 'digest.mmdf')
+        self._process(self._mlist, self._message, {})
+        with Mailbox(mailbox_path) as mbox:
+            mbox.add(mfs("""\
+From: bart@example.com
+To: test@example.com
+Subject: Sneaky
+
+Not indexed.
+"""))
+        self._fill_digest(self._message)
+        with mock.patch.object(Mailbox, 'iteritems') as iteritems:
+            self._runner.run()
+        self.assertFalse(iteritems.called)
+        mime, rfc1153 = self._digests()
+        self.assertEqual(mime.get_payload(1)['content-description'],
+                         "Today's Topics (3 messages)")
+        self.assertEqual(mime.get_payload(3).get_payload(0)['subject'],
+                         'Sneaky')
+        self.assertIn('2. Sneaky (bart@example.com)', rfc1153.get_payload(decode=True))
+
+    def test_multipart_message(self):
+        self._fill_digest(mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: Parts
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="AAA"
+
+--AAA
+Content-Type: text/plain
+
+From here to there.
+--AAA
+Content-Type: text/plain
+
+Second part.
+--AAA--
+"""))
+        self._runner.run()
+        mime, rfc1153 = self._digests()
+        inner = mime.get_payload(2).get_payload(0)
+        self.assertEqual(inner.get_boundary(), 'AAA')
+        parts = inner.get_payload()
+        self.assertEqual(len(parts), 2)
+        # The digest is flattened like any other message.
+        self.assertEqual(parts[0].get_payload(), '>From here to there.')
+        self.assertEqual(parts[1].get_payload(), 'Second part.')
+        self.assertIn('Second part.', rfc1153.get_payload(decode=True))
+
+    def test_only_mime_recipients(self):
+        # Without any plain text digest recipients, the RFC 1153 digest is
+        # not even built.
+        self._bart.preferences.delivery_mode = DeliveryMode.regular
+        self._fill_digest(self._message)
+        with mock.patch.object(RFC1153Digester, 'finish') as finish:
+            self._runner.run()
+        self.assertFalse(finish.called)
+        messages = get_queue_messages('virgin')
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].msg.is_multipart())
+        self.assertEqual(messages[0].msgdata['recipients'],
+                         set(['anne@example.com']))
+
+    def test_only_rfc1153_recipients(self):
+        self._anne.preferences.delivery_mode = DeliveryMode.regular
+        self._fill_digest(self._message)
+        self._runner.run()
+        messages = get_queue_messages('virgin')
+        self.assertEqual(len(messages), 1)
+        self.assertFalse(messages[0].msg.is_multipart())
+        self.assertEqual(messages[0].msgdata['recipients'],
+                         set(['bart@example.com']))
+
+    def test_no_recipients(self):
+        self._anne.preferences.delivery_mode = DeliveryMode.regular
+        self._bart.preferences.delivery_mode = DeliveryMode.regular
+        self._fill_digest(self._message)
+        mark = LogFileMark('mailman.digest')
+        with mock.patch.object(Mailbox, 'iteritems') as iteritems:
+            self._runner.run()
+        self.assertFalse(iteritems.called)
+        self.assertEqual(len(get_queue_messages('virgin')), 0)
+        self.assertTrue(mark.readline().endswith(
+            'No digest recipients for test@example.com, volume 1, '
+            'number 1\n'))
+
+    def test_build_time_logged(self):
+        self._fill_digest(self._message)
+        mark = LogFileMark('mailman.digest')
+        self._runner.run()
+        line = mark.readline()
+        self.assertIn('Built MIME digest and RFC 1153 digest for '
+                      'test@example.com, volume 1, number 1: 1 messages in ',
+                      line)
+        self.assertTrue(line.endswith(' seconds\n'))
+
+    def test_append_only(self):
+        # Adding a message to the digest neither parses the digest mailbox
+        # nor reads its whole index.
+        self._process(self._mlist, self._message, {})
+        with nested(
+            mock.patch.object(Mailbox, '_generate_toc'),
+            mock.patch.object(MailboxIndex, 'read'),
+            ) as (generate_toc, read):
+            self._process(self._mlist, self._message, {})
+        self.assertFalse(generate_toc.called)
+        self.assertFalse(read.called)
+        index = MailboxIndex(
+            os.path.join(self._mlist.data_path, 'digest.mmdf'))
+        entries = index.read()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[1]['total'], 2 * entries[0]['total'])
+        # The mailbox has both messages at the indexed offsets.
+        with Mailbox(os.path.join(
+                self._mlist.data_path, 'digest.mmdf')) as mbox:
+            self.assertEqual(len(mbox), 2)
+            for entry in entries:
+                message = mbox.get_message_at(entry['start'], entry['stop'])
+                self.assertEqual(message['subject'], 'Message')
@@ -22,18 +22,26 @@ from __future__ import absolute_import, print_function, unicode_literals
 __metaclass__ = type
 __all__ = [
     'TestLMTP',
+    'TestWorker',
     ]
 
 
+import os
+import mock
+import Queue
+import socket
 import smtplib
 import unittest
 
+from collections import deque
 from datetime import datetime
 
 from mailman.app.lifecycle import create_list
+from mailman.config import config
 from mailman.database.transaction import transaction
+from mailman.runners.lmtp import ERR_451, Delivery, LMTPRunner
 from mailman.testing.helpers import get_lmtp_client, get_queue_messages
-from mailman.testing.layers import LMTPLayer
+from mailman.testing.layers import ConfigLayer, LMTPLayer
 
 
 
@@ -112,3 +120,127 @@ Message-ID: <ant>
         self.assertEqual(len(messages), 1)
         self.assertEqual(messages[0].msgdata['received_time'],
                          datetime(2005, 8, 1, 7, 49, 23))
+
+    def test_status_per_recipient(self):
+        # RFC 2033 requires a status code for every recipient, in order.
+        self._lmtp.mail('anne@example.com')
+        self._lmtp.rcpt('test@example.com')
+        self._lmtp.rcpt('nobody@example.com')
+        self._lmtp.rcpt('test-request@example.com')
+        code, message = self._lmtp.data("""\
+From: anne@example.com
+Message-ID: <ant>
+
+""")
+        self.assertEqual(code, 250)
+        self.assertEqual(self._lmtp.getreply()[0], 550)
+        self.assertEqual(self._lmtp.getreply()[0], 250)
+        self.assertEqual(len(get_queue_messages('in')), 1)
+        self.assertEqual(len(get_queue_messages('command')), 1)
+
+    def test_pipelined_replies_in_order(self):
+        # The replies to commands sent while a message is being processed
+        # come back after the message's own status.
+        sock = socket.create_connection(
+            (config.mta.lmtp_host, int(config.mta.lmtp_port)))
+        try:
+            reader = sock.makefile('rb')
+            self.assertTrue(reader.readline().startswith(b'220 '))
+            commands = [b'LHLO remote.example.org']
+            for message_id in ('<ant>', '<bee>'):
+                commands.extend([
+                    b'MAIL FROM:<anne@example.com>',
+                    b'RCPT TO:<test@example.com>',
+                    b'RCPT TO:<nobody@example.com>',
+                    b'DATA',
+                    b'Message-ID: ' + message_id,
+                    b'',
+                    b'.',
+                    ])
+            commands.append(b'QUIT')
+            sock.sendall(b'\r\n'.join(commands) + b'\r\n')
+            replies = [line[:3] for line in reader.read().splitlines()
+                       if line[3:4] == b' ']
+        finally:
+            sock.close()
+        self.assertEqual(replies, [
+            b'250',
+            b'250', b'250', b'250', b'354', b'250', b'550',
+            b'250', b'250', b'250', b'354', b'250', b'550',
+            b'221',
+            ])
+        messages = get_queue_messages('in')
+        self.assertEqual(sorted(message.msg['message-id']
+                                for message in messages),
+                         ['<ant>', '<bee>'])
+
+    def test_shared_payload(self):
+        # A message for several addresses is only written to disk once.
+        recipients = ['test@example.com', 'test-request@example.com']
+        self._lmtp.sendmail('anne@example.com', recipients, """\
+From: anne@example.com
+To: test@example.com
+Message-ID: <ant>
+
+""")
+        paths = []
+        for name in ('in', 'command'):
+            switchboard = config.switchboards[name]
+            filebases = switchboard.files
+            self.assertEqual(len(filebases), 1)
+            paths.append(os.path.join(
+                switchboard.queue_directory, filebases[0] + '.msg'))
+        self.assertTrue(os.path.samefile(*paths))
+        messages = get_queue_messages('in') + get_queue_messages('command')
+        self.assertEqual([message.msg['message-id'] for message in messages],
+                         ['<ant>', '<ant>'])
+        self.assertEqual(messages[1].msgdata['subaddress'], 'request')
+        # Finishing the queue files removes the text.
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_new_list(self):
+        # Lists created while the server is running can be posted to.
+        message = """\
+From: anne@example.com
+To: other@example.com
+Message-ID: <ant>
+
+"""
+        with self.assertRaises(smtplib.SMTPDataError) as cm:
+            self._lmtp.sendmail(
+                'anne@example.com', ['other@example.com'], message)
+        self.assertEqual(cm.exception.smtp_code, 550)
+        with transaction():
+            create_list('other@example.com')
+        self._lmtp.sendmail('anne@example.com', ['other@example.com'], message)
+        messages = get_queue_messages('in')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msgdata['listname'], 'other@example.com')
+
+
+
+class TestWorker(unittest.TestCase):
+    """Test the LMTP worker threads."""
+
+    layer = ConfigLayer
+
+    def test_processing_error(self):
+        # A delivery which fails unexpectedly still gets a reply for every
+        # recipient, and the worker goes on to the next delivery.
+        runner = mock.Mock()
+        runner._deliveries = Queue.Queue()
+        runner._finished = deque()
+        runner.process_message.side_effect = [RuntimeError, b'250 Ok']
+        first = Delivery(None, 'anne@example.com',
+                         ['test@example.com', 'test-request@example.com'],
+                         b'', {})
+        second = Delivery(None, 'anne@example.com', ['test@example.com'],
+                          b'', {})
+        for delivery in (first, second, None):
+            runner._deliveries.put(delivery)
+        with mock.patch('mailman.runners.lmtp.elog'):
+            LMTPRunner._work.im_func(runner)
+        self.assertEqual(list(runner._finished), [first, second])
+        self.assertEqual(first.status, ERR_451 + b'\r\n' + ERR_451)
+        self.assertEqual(second.status, b'250 Ok')
+        self.assertEqual(runner._waker.wake.call_count, 2)
@@ -21,16 +21,20 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
+    'TestNNTPConnection',
     'TestPrepareMessage',
     'TestNNTPRunner',
     ]
 
 
 import mock
+import time
 import socket
 import nntplib
 import unittest
 
+from datetime import timedelta
+
 from mailman.app.lifecycle import create_list
 from mailman.config import config
 from mailman.interfaces.nntp import NewsModeration
@@ -42,6 +46,7 @@ from mailman.testing.helpers import (
     make_testable_runner,
     specialized_message_from_string as mfs)
 from mailman.testing.layers import ConfigLayer
+from mailman.utilities.datetime import factory, now
 
 
 
@@ -254,6 +259,12 @@ Testing
         self._runner = make_testable_runner(nntp.NNTPRunner, 'nntp')
         self._nntpq = config.switchboards['nntp']
 
+    def _run_once(self):
+        # Failed postings stay queued, so the runner can only be run once.
+        runner = make_testable_runner(
+            nntp.NNTPRunner, 'nntp', predicate=lambda runner: True)
+        runner.run()
+
     @mock.patch('nntplib.NNTP')
     def test_connect(self, class_mock):
         # Test connection to the NNTP server with default values.
@@ -266,9 +277,11 @@ Testing
                    host='nntp.example.com', port='2112')
     @mock.patch('nntplib.NNTP')
     def test_connect_with_configuration(self, class_mock):
-        # Test connection to the NNTP server with specific values.
+        # Test connection to the NNTP server with specific values.  The
+        # configuration is read when the runner starts.
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
-        self._runner.run()
+        runner = make_testable_runner(nntp.NNTPRunner, 'nntp')
+        runner.run()
         class_mock.assert_called_once_with(
             'nntp.example.com', 2112,
             user='alpha', password='beta', readermode=True)
@@ -293,7 +306,7 @@ Testing
 
     @mock.patch('nntplib.NNTP')
     def test_connection_got_quit(self, class_mock):
-        # The NNTP connection gets closed after a successful post.
+        # The NNTP connection gets closed when the runner stops.
         # Test that the message is posted to the NNTP server.
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
         self._runner.run()
@@ -308,16 +321,22 @@ Testing
     def test_connect_with_nntplib_failure(self, class_mock):
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
         mark = LogFileMark('mailman.error')
-        self._runner.run()
+        self._run_once()
         log_message = mark.readline()[:-1]
         self.assertTrue(log_message.endswith(
             'NNTP error for test@example.com'))
+        # The message is requeued to be retried later.
+        messages = get_queue_messages('nntp')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msgdata['nntp_retries'], 1)
+        self.assertEqual(messages[0].msgdata['deliver_after'],
+                         now() + timedelta(minutes=1))
 
     @mock.patch('nntplib.NNTP', side_effect=socket.error)
     def test_connect_with_socket_failure(self, class_mock):
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
         mark = LogFileMark('mailman.error')
-        self._runner.run()
+        self._run_once()
         log_message = mark.readline()[:-1]
         self.assertTrue(log_message.endswith(
             'NNTP socket error for test@example.com'))
@@ -346,7 +365,7 @@ Testing
         # The NNTP connection doesn't get closed after a unsuccessful
         # connection, since there's nothing to close.
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
-        self._runner.run()
+        self._run_once()
         # Get the mocked instance, which was used in the runner.  Turn off the
         # exception raising side effect first though!
         class_mock.side_effect = None
@@ -363,8 +382,108 @@ Testing
         conn_mock = class_mock()
         conn_mock.post.side_effect = nntplib.error_temp
         self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
-        self._runner.run()
+        self._run_once()
         # The connection object's post() method was called once with a
         # file-like object containing the message's bytes.  Read those bytes
         # and make some simple checks that the message is what we expected.
         conn_mock.quit.assert_called_once_with()
+
+    @mock.patch('nntplib.NNTP')
+    def test_persistent_connection(self, class_mock):
+        # Queued messages are all posted over the same connection.
+        for i in range(3):
+            del self._msg['message-id']
+            self._msg['Message-ID'] = '<ant{0}>'.format(i)
+            self._nntpq.enqueue(self._msg, {}, listname='test@example.com')
+        self._runner.run()
+        self.assertEqual(class_mock.call_count, 1)
+        conn_mock = class_mock()
+        self.assertEqual(conn_mock.post.call_count, 3)
+        conn_mock.quit.assert_called_once_with()
+
+    @mock.patch('nntplib.NNTP')
+    def test_retry_backoff(self, class_mock):
+        # Each failure doubles the time until the next retry.
+        conn_mock = class_mock()
+        conn_mock.post.side_effect = nntplib.error_temp
+        self._nntpq.enqueue(self._msg, {}, listname='test@example.com',
+                            nntp_retries=2)
+        self._run_once()
+        messages = get_queue_messages('nntp')
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0].msgdata['nntp_retries'], 3)
+        self.assertEqual(messages[0].msgdata['deliver_after'],
+                         now() + timedelta(minutes=4))
+
+    @mock.patch('nntplib.NNTP')
+    def test_retries_exhausted(self, class_mock):
+        conn_mock = class_mock()
+        conn_mock.post.side_effect = nntplib.error_temp
+        self._nntpq.enqueue(self._msg, {}, listname='test@example.com',
+                            nntp_retries=5)
+        with mock.patch.object(nntp.log, 'error') as error:
+            self._run_once()
+        # The first error is the logged exception.
+        self.assertEqual(error.call_count, 2)
+        self.assertTrue(error.call_args[0][0].endswith(
+            'NNTP posting failed 6 times for test@example.com, discarding'))
+        self.assertEqual(len(get_queue_messages('nntp')), 0)
+
+    @mock.patch('nntplib.NNTP')
+    def test_retry_not_yet(self, class_mock):
+        # Messages aren't retried before their time is up.
+        deliver_after = now() + timedelta(minutes=1)
+        self._nntpq.enqueue(self._msg, {}, listname='test@example.com',
+                            deliver_after=deliver_after)
+        self._run_once()
+        self.assertEqual(class_mock.call_count, 0)
+        messages = get_queue_messages('nntp')
+        self.assertEqual(len(messages), 1)
+        factory.fast_forward(days=1)
+        self._nntpq.enqueue(messages[0].msg, messages[0].msgdata)
+        self._runner.run()
+        self.assertEqual(class_mock().post.call_count, 1)
+        self.assertEqual(len(get_queue_messages('nntp')), 0)
+
+
+
+
+class TestNNTPConnection(unittest.TestCase):
+    """Test the persistent NNTP connection."""
+
+    layer = ConfigLayer
+
+    @mock.patch('nntplib.NNTP')
+    def test_reconnect_after_drop(self, class_mock):
+        # A connection which the server has dropped is replaced, and the
+        # article is posted over the new one.
+        connection = nntp.NNTPConnection('', 119, '', '')
+        connection.post(b'article')
+        conn_mock = class_mock()
+        conn_mock.post.side_effect = [EOFError, None]
+        connection.post(b'article')
+        # The mock's own call plus the two connections.
+        self.assertEqual(class_mock.call_count, 3)
+        self.assertEqual(conn_mock.post.call_count, 3)
+        self.assertTrue(connection.connected)
+
+    @mock.patch('nntplib.NNTP')
+    def test_no_reconnect_for_new_connection(self, class_mock):
+        # A new connection which fails isn't tried again.
+        conn_mock = class_mock()
+        conn_mock.post.side_effect = socket.error
+        connection = nntp.NNTPConnection('', 119, '', '')
+        self.assertRaises(socket.error, connection.post, b'article')
+        self.assertEqual(conn_mock.post.call_count, 1)
+        self.assertFalse(connection.connected)
+
+    @mock.patch('nntplib.NNTP')
+    def test_idle_timeout(self, class_mock):
+        connection = nntp.NNTPConnection('', 119, '', '', idle_timeout=60)
+        connection.post(b'article')
+        connection.prune()
+        self.assertTrue(connection.connected)
+        with mock.patch('time.time', return_value=time.time() + 61):
+            connection.prune()
+        self.assertFalse(connection.connected)
+        class_mock().quit.assert_called_once_with()
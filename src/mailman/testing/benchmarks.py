@@ -0,0 +1,431 @@
+# Copyright (C) 2012 by the Free Software Foundation, Inc.
+#
+# This file is part of GNU Mailman.
+#
+# GNU Mailman is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option)
+# any later version.
+#
+# GNU Mailman is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# GNU Mailman.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Simple benchmarks against the testing database.
+
+Run these with `python -m mailman.testing.benchmarks [name ...]`.  Each
+benchmark prints the elapsed wall clock time, and where relevant the number of
+SQL queries, for a range of problem sizes or configurations.
+"""
+
+from __future__ import absolute_import, print_function, unicode_literals
+
+__metaclass__ = type
+__all__ = [
+    'main',
+    ]
+
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+from zope.component import getUtility
+
+from mailman.app.lifecycle import create_list
+from mailman.app.membership import add_member
+from mailman.config import config
+from mailman.core.switchboard import (
+    DURABILITY_POLICIES, SharedPayload, Switchboard)
+from mailman.interfaces.bounce import IBounceProcessor
+from mailman.interfaces.mailinglist import Personalization
+from mailman.interfaces.member import DeliveryMode, DeliveryStatus
+from mailman.interfaces.messages import IMessageStore
+from mailman.interfaces.usermanager import IUserManager
+from mailman.mta.deliver import Deliver
+from mailman.runners.digest import DigestRunner
+from mailman.testing.helpers import (
+    TestableMaster,
+    get_lmtp_client,
+    get_queue_messages,
+    make_testable_runner,
+    query_counter,
+    specialized_message_from_string as mfs)
+from mailman.testing.layers import ConfigLayer
+
+
+# The roster sizes to benchmark.
+ROSTER_SIZES = (10, 100, 1000)
+# The number of messages to enqueue under each durability policy.
+ENQUEUE_COUNT = 500
+# The number of lists a cross-posted message is enqueued to.
+FANOUT_COUNT = 10
+# The number of recipients of a personalized message.
+PERSONALIZE_COUNT = 500
+# The number of messages in a digest.
+DIGEST_COUNT = 1000
+# The number of messages added to, read from and deleted from the message
+# store.
+MESSAGE_STORE_COUNT = 1000
+# The number of bouncing members, and the number of bounce events registered
+# for each of them.
+BOUNCING_MEMBERS = 500
+BOUNCES_PER_MEMBER = 10
+# The bounce event batch sizes to benchmark.
+BOUNCE_BATCH_SIZES = (100, 1000)
+# The numbers of LMTP worker threads and of concurrent LMTP sessions to
+# benchmark, and the number of messages delivered by each session.
+LMTP_WORKERS = (0, 4)
+LMTP_SESSIONS = (1, 8, 32)
+LMTP_MESSAGES = 20
+
+
+
+def _measure(function):
+    """Return the query count and elapsed seconds of calling `function`."""
+    with query_counter() as counter:
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+    return counter.count, elapsed
+
+
+
+def bench_roster():
+    """Regular recipient calculation, per-member vs. bulk delivery records."""
+    def per_member():
+        return set(member.address.email
+                   for member in mlist.regular_members.members
+                   if member.delivery_status == DeliveryStatus.enabled)
+    def bulk():
+        return set(record.email
+                   for record in mlist.regular_members.get_delivery_records()
+                   if record.delivery_status == DeliveryStatus.enabled)
+    print('{0:>8} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'members', 'queries', 'seconds', 'bulk q.', 'bulk sec.'))
+    for size in ROSTER_SIZES:
+        ConfigLayer.testSetUp()
+        try:
+            mlist = create_list('bench@example.com')
+            user_manager = getUtility(IUserManager)
+            for i in range(size):
+                address = user_manager.create_address(
+                    'person{0}@example.com'.format(i))
+                mlist.subscribe(address)
+            config.db.commit()
+            # Drop the cached objects so that both approaches start cold.
+            config.db.store.invalidate()
+            queries, seconds = _measure(per_member)
+            config.db.store.invalidate()
+            bulk_queries, bulk_seconds = _measure(bulk)
+            print('{0:>8} {1:>10} {2:>10.3f} {3:>10} {4:>10.3f}'.format(
+                size, queries, seconds, bulk_queries, bulk_seconds))
+        finally:
+            ConfigLayer.testTearDown()
+
+
+def bench_enqueue():
+    """Switchboard enqueue throughput under each durability policy."""
+    msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: A benchmark
+
+""" + 'A line of text.\n' * 100)
+    print('{0:>8} {1:>10} {2:>10} {3:>10}'.format(
+        'policy', 'messages', 'seconds', 'msgs/sec'))
+    for durability in DURABILITY_POLICIES:
+        queue_directory = tempfile.mkdtemp(dir=config.QUEUE_DIR)
+        try:
+            switchboard = Switchboard(
+                'bench', queue_directory, durability=durability)
+            start = time.time()
+            for i in range(ENQUEUE_COUNT):
+                switchboard.enqueue(msg, listname='test@example.com')
+            # Group commit only makes the files durable once synced.
+            switchboard.sync()
+            seconds = time.time() - start
+            print('{0:>8} {1:>10} {2:>10.3f} {3:>10.0f}'.format(
+                durability, ENQUEUE_COUNT, seconds, ENQUEUE_COUNT / seconds))
+        finally:
+            shutil.rmtree(queue_directory)
+
+
+def bench_fanout():
+    """Enqueuing a cross-posted message, per-queue copies vs. shared text."""
+    msg = mfs("""\
+From: anne@example.com
+To: test@example.com
+Subject: A benchmark
+
+""" + 'A line of text.\n' * 2000)
+    count = ENQUEUE_COUNT // FANOUT_COUNT
+    print('{0:>8} {1:>10} {2:>10} {3:>10}'.format(
+        'payload', 'messages', 'seconds', 'msgs/sec'))
+    for shared in (False, True):
+        queue_directory = tempfile.mkdtemp(dir=config.QUEUE_DIR)
+        try:
+            switchboards = []
+            for i in range(FANOUT_COUNT):
+                path = os.path.join(queue_directory, str(i))
+                os.mkdir(path)
+                switchboards.append(Switchboard('bench', path))
+            start = time.time()
+            for i in range(count):
+                payload = (SharedPayload(msg) if shared else msg)
+                for switchboard in switchboards:
+                    switchboard.enqueue(payload, listname='test@example.com')
+            seconds = time.time() - start
+            print('{0:>8} {1:>10} {2:>10.3f} {3:>10.0f}'.format(
+                'shared' if shared else 'copied', count, seconds,
+                count / seconds))
+        finally:
+            shutil.rmtree(queue_directory)
+
+
+def bench_personalize():
+    """Personalized delivery, per-recipient copies vs. template rendering."""
+    class TemplateDeliver(Deliver):
+        def _send(self, message_id, sender, recipients, msgtext):
+            return {}
+    class CallbackDeliver(TemplateDeliver):
+        renderer_class = None
+    msg = mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: A benchmark
+Message-ID: <benchmark>
+
+""" + 'A line of text.\n' * 100)
+    print('{0:>10} {1:>10} {2:>10}'.format(
+        'renderer', 'recipients', 'seconds'))
+    ConfigLayer.testSetUp()
+    try:
+        mlist = create_list('bench@example.com')
+        mlist.personalize = Personalization.full
+        recipients = []
+        for i in range(PERSONALIZE_COUNT):
+            email = 'person{0}@example.com'.format(i)
+            add_member(mlist, email, 'Person {0}'.format(i), 'xyz',
+                       DeliveryMode.regular, 'en')
+            recipients.append(email)
+        config.db.commit()
+        for name, agent_class in (('callbacks', CallbackDeliver),
+                                  ('template', TemplateDeliver)):
+            start = time.time()
+            agent_class().deliver(mlist, msg, dict(recipients=recipients))
+            print('{0:>10} {1:>10} {2:>10.3f}'.format(
+                name, PERSONALIZE_COUNT, time.time() - start))
+    finally:
+        ConfigLayer.testTearDown()
+
+
+def bench_digest():
+    """Digest building, for one or both digest formats."""
+    print('{0:>10} {1:>10} {2:>10}'.format('formats', 'messages', 'seconds'))
+    ConfigLayer.testSetUp()
+    try:
+        mlist = create_list('bench@example.com')
+        add_member(mlist, 'anne@example.com', 'Anne', 'xyz',
+                   DeliveryMode.mime_digests, 'en')
+        bart = add_member(mlist, 'bart@example.com', 'Bart', 'xyz',
+                          DeliveryMode.plaintext_digests, 'en')
+        process = config.handlers['to-digest'].process
+        runner = make_testable_runner(DigestRunner, 'digest')
+        for name in ('both', 'mime'):
+            if name == 'mime':
+                bart.preferences.delivery_mode = DeliveryMode.regular
+            mlist.digest_size_threshold = 1000000
+            for i in range(DIGEST_COUNT):
+                if i == DIGEST_COUNT - 1:
+                    mlist.digest_size_threshold = 0
+                process(mlist, mfs("""\
+From: anne@example.com
+To: bench@example.com
+Subject: A benchmark {0}
+
+""".format(i) + 'A line of text.\n' * 100), {})
+            config.db.commit()
+            start = time.time()
+            runner.run()
+            print('{0:>10} {1:>10} {2:>10.3f}'.format(
+                name, DIGEST_COUNT, time.time() - start))
+            get_queue_messages('virgin')
+    finally:
+        ConfigLayer.testTearDown()
+
+
+def bench_messagestore():
+    """Message store throughput, for each storage format."""
+    text = """\
+From: anne@example.com
+To: bench@example.com
+Subject: A benchmark
+Message-ID: <{0}>
+
+""" + 'A line of text.\n' * 100
+    print('{0:>12} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'format', 'add/sec', 'get/sec', 'hdrs/sec', 'del/sec'))
+    for name, store_format, compression in (
+            ('pickle', 'pickle', 'zlib'),
+            ('packed', 'packed', 'none'),
+            ('packed+zlib', 'packed', 'zlib')):
+        ConfigLayer.testSetUp()
+        config.push('bench', """
+        [messages]
+        store_format: {0}
+        compression: {1}
+        """.format(store_format, compression))
+        try:
+            message_store = getUtility(IMessageStore)
+            message_ids = ['<{0}>'.format(i)
+                           for i in range(MESSAGE_STORE_COUNT)]
+            messages = [mfs(text.format(i))
+                        for i in range(MESSAGE_STORE_COUNT)]
+            rates = []
+            for function in (
+                    lambda: [message_store.add(msg) for msg in messages],
+                    lambda: [message_store.get_message_by_id(message_id)
+                             for message_id in message_ids],
+                    lambda: [message_store.get_message_by_id(
+                                 message_id, headers_only=True)
+                             for message_id in message_ids],
+                    lambda: [message_store.delete_message(message_id)
+                             for message_id in message_ids]):
+                start = time.time()
+                function()
+                rates.append(MESSAGE_STORE_COUNT / (time.time() - start))
+            print('{0:>12} {1:>10.0f} {2:>10.0f} {3:>10.0f} {4:>10.0f}'.format(
+                name, *rates))
+        finally:
+            config.pop('bench')
+            ConfigLayer.testTearDown()
+
+
+def bench_bounces():
+    """Bounce event scoring throughput, for a range of batch sizes."""
+    msg = mfs("""\
+From: mail-daemon@example.com
+To: bench-bounces@example.com
+Message-ID: <bounce>
+
+""")
+    print('{0:>8} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'batch', 'events', 'queries', 'seconds', 'events/sec'))
+    for batch_size in BOUNCE_BATCH_SIZES:
+        ConfigLayer.testSetUp()
+        try:
+            mlist = create_list('bench@example.com')
+            processor = getUtility(IBounceProcessor)
+            user_manager = getUtility(IUserManager)
+            for i in range(BOUNCING_MEMBERS):
+                email = 'person{0}@example.com'.format(i)
+                mlist.subscribe(user_manager.create_address(email))
+                for j in range(BOUNCES_PER_MEMBER):
+                    processor.register(mlist, email, msg)
+            config.db.commit()
+            def process():
+                while processor.process(batch_size) == batch_size:
+                    config.db.commit()
+                config.db.commit()
+            queries, seconds = _measure(process)
+            events = BOUNCING_MEMBERS * BOUNCES_PER_MEMBER
+            print('{0:>8} {1:>10} {2:>10} {3:>10.3f} {4:>10.0f}'.format(
+                batch_size, events, queries, seconds, events / seconds))
+        finally:
+            ConfigLayer.testTearDown()
+
+
+def bench_lmtp():
+    """LMTP throughput and latency, for a range of concurrent sessions."""
+    text = """\
+From: anne@example.com
+To: bench@example.com
+Subject: A benchmark
+Message-ID: <{0}.{1}>
+
+""" + 'A line of text.\n' * 2000
+    def session(number, latencies):
+        lmtp = get_lmtp_client(quiet=True)
+        lmtp.lhlo('remote.example.org')
+        for i in range(LMTP_MESSAGES):
+            start = time.time()
+            lmtp.sendmail('anne@example.com', ['bench@example.com'],
+                          text.format(number, i))
+            latencies.append(time.time() - start)
+        lmtp.quit()
+    print('{0:>8} {1:>10} {2:>10} {3:>10} {4:>10}'.format(
+        'workers', 'sessions', 'messages', 'msgs/sec', 'p99 msec'))
+    with open(config.filename) as fp:
+        test_config = fp.read()
+    for workers in LMTP_WORKERS:
+        ConfigLayer.testSetUp()
+        config_file = os.path.join(ConfigLayer.var_dir, 'lmtp-bench.cfg')
+        with open(config_file, 'w') as fp:
+            fp.write(test_config)
+            print('[mta]\nlmtp_workers: {0}'.format(workers), file=fp)
+        master = TestableMaster(lambda: get_lmtp_client(quiet=True).quit(),
+                                config_file)
+        try:
+            create_list('bench@example.com')
+            config.db.commit()
+            master.start('lmtp')
+            queue_directory = config.switchboards['in'].queue_directory
+            for sessions in LMTP_SESSIONS:
+                latencies = []
+                threads = [threading.Thread(target=session,
+                                            args=(i, latencies))
+                           for i in range(sessions)]
+                start = time.time()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                seconds = time.time() - start
+                latencies.sort()
+                p99 = latencies[min(len(latencies) - 1,
+                                    int(len(latencies) * 0.99))]
+                print('{0:>8} {1:>10} {2:>10} {3:>10.0f} {4:>10.1f}'.format(
+                    workers, sessions, len(latencies),
+                    len(latencies) / seconds, p99 * 1000))
+                for filename in os.listdir(queue_directory):
+                    os.remove(os.path.join(queue_directory, filename))
+        finally:
+            master.stop()
+            ConfigLayer.testTearDown()
+
+
+BENCHMARKS = dict(
+    bounces=bench_bounces,
+    digest=bench_digest,
+    enqueue=bench_enqueue,
+    fanout=bench_fanout,
+    lmtp=bench_lmtp,
+    messagestore=bench_messagestore,
+    personalize=bench_personalize,
+    roster=bench_roster,
+    )
+
+
+
+def main(argv=None):
+    """Run the named benchmarks, or all of them."""
+    names = (sys.argv[1:] if argv is None else argv) or sorted(BENCHMARKS)
+    ConfigLayer.setUp()
+    try:
+        for name in names:
+            print('{0}: {1}'.format(name, BENCHMARKS[name].__doc__))
+            BENCHMARKS[name]()
+    finally:
+        ConfigLayer.tearDown()
+
+
+if __name__ == '__main__':
+    main()
@@ -32,6 +32,7 @@ __all__ = [
     'get_nntp_server',
     'get_queue_messages',
     'make_testable_runner',
+    'query_counter',
     'reset_the_world',
     'specialized_message_from_string',
     'subscribe',
@@ -57,6 +58,7 @@ from contextlib import contextmanager
 from email import message_from_string
 from httplib2 import Http
 from lazr.config import as_timedelta
+from storm.tracer import install_tracer, remove_tracer
 from urllib import urlencode
 from urllib2 import HTTPError
 from zope import event
@@ -156,7 +158,7 @@ def digest_mbox(mlist):
 class TestableMaster(Master):
     """A testable master loop watcher."""
 
-    def __init__(self, start_check=None):
+    def __init__(self, start_check=None, config_file=None):
         """Create a testable master loop watcher.
 
         :param start_check: Optional callable used to check whether everything
@@ -164,9 +166,14 @@ class TestableMaster(Master):
             subthread before the event is set.  The callback should block
             until the pass condition is set.
         :type start_check: Callable taking no arguments, returning nothing.
+        :param config_file: The configuration file for the runners, instead
+            of the testing configuration file.
+        :type config_file: str
         """
         super(TestableMaster, self).__init__(
-            restartable=False, config_file=config.filename)
+            restartable=False,
+            config_file=(config.filename if config_file is None
+                         else config_file))
         self.start_check = start_check
         self.event = threading.Event()
         self.thread = threading.Thread(target=self.loop)
@@ -358,6 +365,34 @@ def event_subscribers(*subscribers):
 
 
 
+class _QueryCounter:
+    """A Storm tracer which counts the SQL statements executed."""
+
+    def __init__(self):
+        self.count = 0
+
+    def connection_raw_execute(self, connection, raw_cursor, statement,
+                               params):
+        self.count += 1
+
+
+
+@contextmanager
+def query_counter():
+    """Count the SQL statements executed within the context.
+
+    The yielded object's `count` attribute is the number of statements
+    executed so far.
+    """
+    counter = _QueryCounter()
+    install_tracer(counter)
+    try:
+        yield counter
+    finally:
+        remove_tracer(counter)
+
+
+
 class configuration:
     """A decorator/context manager for temporarily setting configurations."""
 
@@ -422,6 +457,7 @@ def reset_the_world():
     * Remove all residual queue and digest files
     * Clear the message store
     * Reset the global style manager
+    * Forget the cached recipients
 
     This should be as thorough a reset of the system as necessary to keep
     tests isolated.
@@ -431,7 +467,7 @@ def reset_the_world():
     # Remove any digest files.
     for dirpath, dirnames, filenames in os.walk(config.LIST_DATA_DIR):
         for filename in filenames:
-            if filename.endswith('.mmdf'):
+            if filename.endswith(('.mmdf', '.idx')):
                 os.remove(os.path.join(dirpath, filename))
     # Remove all residual queue files.
     for dirpath, dirnames, filenames in os.walk(config.QUEUE_DIR):
@@ -442,10 +478,17 @@ def reset_the_world():
     with transaction():
         for message in message_store.messages:
             message_store.delete_message(message['message-id'])
+    # Remove the message store's pack files.
+    for dirpath, dirnames, filenames in os.walk(config.MESSAGES_DIR):
+        for filename in filenames:
+            if filename.endswith('.pack'):
+                os.remove(os.path.join(dirpath, filename))
     # Reset the global style manager.
     getUtility(IStyleManager).populate()
     # Remove all dynamic header-match rules.
     config.chains['header-match'].flush()
+    # Forget all cached recipients.
+    config.handlers['member-recipients'].flush()
 
 
 
@@ -17,14 +17,20 @@
 
 """Module stuff."""
 
-from __future__ import absolute_import, unicode_literals
+from __future__ import absolute_import, print_function, unicode_literals
 
 __metaclass__ = type
 __all__ = [
     'Mailbox',
+    'MailboxIndex',
     ]
 
 
+import os
+import json
+import errno
+
+
 # Use a single file format for the digest mailbox because this makes it easier
 # to calculate the current size of the mailbox.  This way, we don't have to
 # carry around or store the size of the mailbox, we can just stat the file to
@@ -34,6 +40,11 @@ __all__ = [
 from mailbox import MMDF
 
 
+# How much of the end of an index file is read at a time when looking for its
+# last entry.
+LAST_ENTRY_CHUNK_SIZE = 4096
+
+
 
 class Mailbox(MMDF):
     """A mailbox that interoperates with the 'with' statement."""
@@ -47,3 +58,171 @@ class Mailbox(MMDF):
         self.unlock()
         # Don't suppress the exception.
         return False
+
+    def append(self, message):
+        """Append a message to the end of the mailbox file.
+
+        Unlike `add()`, this does not need the mailbox's table of contents,
+        so the mailbox file is not scanned for messages.
+
+        :param message: The message to append.
+        :return: The start and stop offsets of the message text, as
+            `get_offsets()` returns them.
+        :rtype: 2-tuple of ints
+        """
+        self._file.seek(0, 2)
+        before = self._file.tell()
+        try:
+            self._pre_message_hook(self._file)
+            start, stop = self._install_message(message)
+            self._post_message_hook(self._file)
+        except BaseException:
+            self._file.truncate(before)
+            raise
+        self._file.flush()
+        self._file_length = self._file.tell()
+        self._pending_sync = True
+        # Keep the table of contents, if it has been read, up to date.
+        if self._toc is not None:
+            self._toc[self._next_key] = (start, stop)
+            self._next_key += 1
+        self._file.seek(start)
+        self._file.readline()
+        return self._file.tell(), stop
+
+    def get_offsets(self, key):
+        """Return where the text of a message is stored in the mailbox file.
+
+        The message's envelope sender line is not included.
+
+        :param key: The message's key.
+        :return: The start and stop offsets of the message text.
+        :rtype: 2-tuple of ints
+        """
+        start, stop = self._lookup(key)
+        self._file.seek(start)
+        self._file.readline()
+        return self._file.tell(), stop
+
+    def get_message_at(self, start, stop):
+        """Return the message stored between the given offsets.
+
+        Unlike `get_message()`, this does not need the mailbox's table of
+        contents, so the mailbox file is not scanned for messages.  The
+        message's envelope sender is not restored.
+
+        :param start: The start offset of the message text, as returned by
+            `get_offsets()`.
+        :type start: int
+        :param stop: The stop offset of the message text.
+        :type stop: int
+        :return: The message.
+        :rtype: `MMDFMessage`
+        """
+        self._file.seek(start)
+        text = self._file.read(stop - start)
+        return self._message_factory(text.replace(os.linesep, b'\n'))
+
+
+
+class MailboxIndex:
+    """A sidecar index of the messages in a mailbox.
+
+    The index lives next to the mailbox file and has one entry for each
+    message in the mailbox, in order.  An entry is a dictionary with the
+    message's `start` and `stop` offsets in the mailbox file, and whatever
+    summary information the user of the index wants to keep.  The last entry
+    also records the `size` of the mailbox file after its message was added.
+    The index must be updated while the mailbox is locked.
+    """
+
+    def __init__(self, mailbox_path):
+        """Create the index of a mailbox.
+
+        :param mailbox_path: The path of the mailbox file.
+        :type mailbox_path: string
+        """
+        self.path = os.path.splitext(mailbox_path)[0] + '.idx'
+
+    def read(self):
+        """Read the index entries.
+
+        :return: The entries, or the empty list if there is no index.
+        :rtype: list of dictionaries
+        """
+        try:
+            with open(self.path) as fp:
+                return [json.loads(line) for line in fp]
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return []
+
+    def last(self):
+        """Read the last index entry.
+
+        Only the end of the index file is read.
+
+        :return: The last entry, or None if the index is empty or missing.
+        :rtype: dictionary or None
+        """
+        try:
+            with open(self.path, 'rb') as fp:
+                fp.seek(0, 2)
+                position = fp.tell()
+                text = b''
+                # Read backwards until the start of the last line is found.
+                while position > 0 and b'\n' not in text[:-1]:
+                    chunk_size = min(LAST_ENTRY_CHUNK_SIZE, position)
+                    position -= chunk_size
+                    fp.seek(position)
+                    text = fp.read(chunk_size) + text
+        except IOError as error:
+            if error.errno != errno.ENOENT:
+                raise
+            return None
+        line = text.rstrip(b'\n').rsplit(b'\n', 1)[-1]
+        return (json.loads(line) if line else None)
+
+    def is_current(self, entry, size):
+        """Check whether the index entries cover the whole mailbox.
+
+        The index gets out of date when the mailbox is written to without
+        updating the index.
+
+        :param entry: The last index entry, or None if the index is empty.
+        :type entry: dictionary
+        :param size: The size of the mailbox file.
+        :type size: int
+        :rtype: bool
+        """
+        return (0 if entry is None else entry['size']) == size
+
+    def append(self, entry):
+        """Add an entry for a message appended to the mailbox.
+
+        :param entry: The index entry.
+        :type entry: dictionary
+        """
+        with open(self.path, 'a') as fp:
+            print(json.dumps(entry), file=fp)
+
+    def write(self, entries):
+        """Replace all the index entries.
+
+        :param entries: The index entries.
+        :type entries: list of dictionaries
+        """
+        with open(self.path, 'w') as fp:
+            for entry in entries:
+                print(json.dumps(entry), file=fp)
+
+    def rename(self, mailbox_path):
+        """Move the index along with its mailbox.
+
+        :param mailbox_path: The new path of the mailbox file.
+        :type mailbox_path: string
+        """
+        path = os.path.splitext(mailbox_path)[0] + '.idx'
+        os.rename(self.path, path)
+        self.path = path